@@ -0,0 +1,177 @@
+# backend/account_search.py
+"""凭证录入的科目搜索（/api/accounts/search?q=）
+
+录入分录时按输入内容实时匹配启用的末级科目，匹配方式按优先级为：
+科目代码前缀、科目名称前缀、名称拼音首字母前缀（如 yhck 匹配“银行存款”）、名称或拼音首字母中的子串。
+同一优先级内按科目代码排序，取前 limit 个。
+
+索引常驻内存，全部是按科目代码排序的列表：
+- 代码前缀：在有序的代码列表上二分查找，匹配的科目是连续的一段；
+- 名称、拼音首字母的前缀：预先把每个长度不超过 PREFIX_LEN 的前缀映射到科目列表，更长的查询在其中过滤；
+- 子串：名称和拼音首字母中的每个单字、每个二元组映射到科目列表，查询时取其中最短的一个列表逐个核对。
+各优先级依次产出，凑够 limit 个即停止，一次查询只访问少量科目。
+
+索引跟随科目树缓存（account_tree）：科目树换了新版本时，只对名称变化、新增、删除或不再是启用末级的科目
+增删索引项，其余科目（及其拼音首字母）保持不动。
+
+拼音首字母优先用 pypinyin（pip install pypinyin，按词组处理多音字，如“银行”为 yh）；
+未安装时按 GB2312 一级汉字的拼音排序表取首字母，多音字取其排序所在的读音，二级汉字没有首字母。
+"""
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # 未安装 pypinyin 时使用 GB2312 排序表
+    lazy_pinyin = None
+
+PREFIX_LEN = 4
+
+# GB2312 一级汉字（0xB0A1-0xD7F9）按拼音排序，每个声母的第一个字的编码
+GB2312_INITIALS = (
+    (0xB0A1, 'a'), (0xB0C5, 'b'), (0xB2C1, 'c'), (0xB4EE, 'd'), (0xB6EA, 'e'), (0xB7A2, 'f'),
+    (0xB8C1, 'g'), (0xB9FE, 'h'), (0xBBF7, 'j'), (0xBFA6, 'k'), (0xC0AC, 'l'), (0xC2E8, 'm'),
+    (0xC4C3, 'n'), (0xC5B6, 'o'), (0xC5BE, 'p'), (0xC6DA, 'q'), (0xC8BB, 'r'), (0xC8F6, 's'),
+    (0xCBFA, 't'), (0xCDDA, 'w'), (0xCEF4, 'x'), (0xD1B9, 'y'), (0xD4D1, 'z'),
+)
+GB2312_BOUNDS = [code for code, _ in GB2312_INITIALS]
+GB2312_LEVEL_ONE_END = 0xD7F9
+
+
+def gb2312_initial(char):
+    """一个汉字的拼音首字母（GB2312 一级汉字），其他字符返回空串"""
+    try:
+        encoded = char.encode('gb2312')
+    except UnicodeEncodeError:
+        return ''
+    if len(encoded) != 2:
+        return ''
+    code = int.from_bytes(encoded, 'big')
+    if not GB2312_BOUNDS[0] <= code <= GB2312_LEVEL_ONE_END:
+        return ''
+    return GB2312_INITIALS[bisect_left(GB2312_BOUNDS, code + 1) - 1][1]
+
+
+def pinyin_initials(name):
+    """名称的拼音首字母（小写），名称中的字母和数字原样保留，其余符号去掉，如“应交税费-增值税”为 yjsfzzs"""
+    if lazy_pinyin is not None:
+        text = ''.join(lazy_pinyin(name, style=Style.FIRST_LETTER))
+    else:
+        text = ''.join(char if char.isascii() else gb2312_initial(char) for char in name)
+    return ''.join(char for char in text if char.isascii() and char.isalnum()).lower()
+
+
+def grams(text):
+    """子串索引的键：全部单字和二元组"""
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def remove_sorted(items, value):
+    index = bisect_left(items, value)
+    if index < len(items) and items[index] == value:
+        del items[index]
+
+
+class AccountSearchIndex:
+    """启用末级科目的搜索索引（线程安全）"""
+
+    def __init__(self):
+        self.etag = None      # 当前索引对应的科目树快照
+        self._entries = {}    # account_code -> (account_name, 小写名称, 拼音首字母)
+        self._codes = []      # 有序的科目代码
+        self._name_prefixes = defaultdict(list)     # 名称前缀 -> 有序的科目代码
+        self._initial_prefixes = defaultdict(list)  # 拼音首字母前缀 -> 有序的科目代码
+        self._grams = defaultdict(list)             # 名称和拼音首字母中的单字、二元组 -> 有序的科目代码
+        self._lock = threading.Lock()
+
+    def _keys(self, entry):
+        _, name, initials = entry
+        return (
+            (self._name_prefixes, {name[:n] for n in range(1, min(len(name), PREFIX_LEN) + 1)}),
+            (self._initial_prefixes, {initials[:n] for n in range(1, min(len(initials), PREFIX_LEN) + 1)}),
+            (self._grams, grams(name) | grams(initials)),
+        )
+
+    def _add(self, code, account_name):
+        entry = (account_name, account_name.lower(), pinyin_initials(account_name))
+        self._entries[code] = entry
+        insort(self._codes, code)
+        for index, keys in self._keys(entry):
+            for key in keys:
+                insort(index[key], code)
+
+    def _remove(self, code):
+        entry = self._entries.pop(code)
+        remove_sorted(self._codes, code)
+        for index, keys in self._keys(entry):
+            for key in keys:
+                remove_sorted(index[key], code)
+                if not index[key]:
+                    del index[key]
+
+    def sync(self, tree):
+        """与科目树快照同步：只增删有变化的科目，返回 (新增数, 删除数)"""
+        if tree.etag == self.etag:
+            return 0, 0
+        wanted = {a['account_code']: a['account_name'] or '' for a in tree.enabled_leaves}
+        with self._lock:
+            if tree.etag == self.etag:
+                return 0, 0
+            removed = [code for code, entry in self._entries.items() if wanted.get(code) != entry[0]]
+            for code in removed:
+                self._remove(code)
+            added = [code for code in wanted if code not in self._entries]
+            for code in added:
+                self._add(code, wanted[code])
+            self.etag = tree.etag
+        return len(added), len(removed)
+
+    def _prefixed(self, index, field, query):
+        """前缀匹配的科目；field 为 _entries 中被匹配的字段（1 名称，2 拼音首字母）"""
+        if len(query) <= PREFIX_LEN:
+            return index.get(query, ())
+        return [code for code in index.get(query[:PREFIX_LEN], ()) if self._entries[code][field].startswith(query)]
+
+    def _matches(self, query):
+        """按优先级依次产出 (科目代码, 匹配方式)，可能重复"""
+        for i in range(bisect_left(self._codes, query), len(self._codes)):
+            if not self._codes[i].startswith(query):
+                break
+            yield self._codes[i], 'code'
+        for code in self._prefixed(self._name_prefixes, 1, query):
+            yield code, 'name'
+        for code in self._prefixed(self._initial_prefixes, 2, query):
+            yield code, 'pinyin'
+        keys = [query] if len(query) == 1 else [query[i:i + 2] for i in range(len(query) - 1)]
+        for code in min((self._grams.get(key, ()) for key in keys), key=len):
+            _, name, initials = self._entries[code]
+            if query in name:
+                yield code, 'name'
+            elif query in initials:
+                yield code, 'pinyin'
+
+    def search(self, query, limit):
+        """返回至多 limit 个匹配的科目 [{account_code, account_name, match}]；空查询按代码顺序返回"""
+        query = query.strip().lower()
+        results = []
+        seen = set()
+        with self._lock:
+            matches = self._matches(query) if query else ((code, 'code') for code in self._codes)
+            for code, match in matches:
+                if code in seen:
+                    continue
+                seen.add(code)
+                results.append({'account_code': code, 'account_name': self._entries[code][0], 'match': match})
+                if len(results) >= limit:
+                    break
+        return results
+
+
+account_index = AccountSearchIndex()
+
+
+def search_accounts(tree, query, limit):
+    """在科目树快照的启用末级科目中搜索（索引按需与快照同步）"""
+    account_index.sync(tree)
+    return account_index.search(query, limit)
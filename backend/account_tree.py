@@ -0,0 +1,146 @@
+# backend/account_tree.py
+"""进程内的会计科目树缓存
+
+会计科目很少变动却被频繁读取（凭证录入页每次加载都要取末级科目），
+所以把 chart_of_accounts 整表读入内存，预先算好每个科目的是否末级、级别、上级链和全部下级科目。
+
+缓存带版本号：
+- 本进程内的科目新增/修改/删除接口调用 invalidate() 立即失效；
+- 其他进程（多 worker 部署）修改科目时，靠定期比对 COUNT(*) 与 MAX(updated_at) 发现变化，
+  比对间隔由 config.ACCOUNT_CACHE_CHECK_INTERVAL 控制。
+每个快照按内容计算 ETag，前端重复请求时可直接返回 304。
+"""
+import hashlib
+import threading
+import time
+
+from config import ACCOUNT_CACHE_CHECK_INTERVAL
+from db_steps import Query, run_sync
+from db_utils import get_db_connection
+
+
+class AccountTree:
+    """某一版本的科目树快照（只读）"""
+
+    def __init__(self, rows, version):
+        self.version = version
+        self.accounts = {}   # account_code -> 科目行（含 is_leaf）
+        self.children = {}   # account_code -> 直接下级科目代码列表
+        for row in rows:
+            account = dict(row)
+            self.accounts[account['account_code']] = account
+            self.children.setdefault(account['account_code'], [])
+        for code, account in self.accounts.items():
+            parent = account['parent_code']
+            if parent in self.children:
+                self.children[parent].append(code)
+
+        self.ancestors = {}  # account_code -> 从一级科目到自身的代码链
+        for code in self.accounts:
+            chain = []
+            current = code
+            while current is not None and current in self.accounts:
+                chain.append(current)
+                current = self.accounts[current]['parent_code']
+            self.ancestors[code] = list(reversed(chain))
+
+        self.subtree = {code: [] for code in self.accounts}  # account_code -> 自身及全部下级科目代码
+        for code in sorted(self.accounts):
+            for ancestor in self.ancestors[code]:
+                self.subtree[ancestor].append(code)
+
+        for code, account in self.accounts.items():
+            account['is_leaf'] = 0 if self.children[code] else 1
+            if account.get('level') is None:
+                account['level'] = len(self.ancestors[code])
+
+        self.ordered = [self.accounts[code] for code in sorted(self.accounts)]
+        self.leaves = [a for a in self.ordered if a['is_leaf']]
+        self.enabled_leaves = [a for a in self.leaves if a['is_enabled']]
+        # ETag 取自科目内容本身，多个 worker 加载到相同数据时 ETag 也相同
+        digest = hashlib.md5()
+        for account in self.ordered:
+            digest.update(repr(sorted(account.items())).encode('utf-8'))
+        self.etag = digest.hexdigest()
+
+    def get(self, account_code):
+        return self.accounts.get(account_code)
+
+    def is_leaf(self, account_code):
+        account = self.accounts.get(account_code)
+        return bool(account and account['is_leaf'])
+
+
+class AccountTreeCache:
+    """线程安全的科目树缓存"""
+
+    def __init__(self, check_interval=ACCOUNT_CACHE_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._tree = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """科目发生变化后调用，下次读取时重新加载"""
+        with self._lock:
+            self._tree = None
+
+    def _fresh_tree(self):
+        tree = self._tree
+        if tree is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return tree
+        return None
+
+    def _load_steps(self, tree):
+        """比对数据库版本，必要时重新加载科目树（步骤生成器）"""
+        row = yield Query("SELECT COUNT(*) AS cnt, MAX(updated_at) AS max_updated FROM chart_of_accounts;", fetch='one')
+        version = f"{row['cnt']}:{row['max_updated']}"
+        if tree is None or tree.version != version:
+            rows = yield Query("SELECT * FROM chart_of_accounts ORDER BY account_code;", fetch='all')
+            tree = AccountTree(rows, version)
+        self._tree = tree
+        self._checked_at = time.monotonic()
+        return tree
+
+    def get_tree(self):
+        """返回当前的科目树；数据库不可用时抛出 ConnectionError"""
+        tree = self._fresh_tree()
+        if tree is not None:
+            return tree
+
+        with self._lock:
+            tree = self._fresh_tree()
+            if tree is not None:
+                return tree
+            conn = get_db_connection()
+            if conn is None:
+                raise ConnectionError("数据库连接失败")
+            with conn:
+                cursor = conn.cursor(dictionary=True)
+                try:
+                    return run_sync(cursor, self._load_steps(self._tree))
+                finally:
+                    cursor.close()
+
+    async def get_tree_async(self, run_steps):
+        """异步服务方式下返回当前的科目树；run_steps 为借出异步连接执行步骤生成器的协程函数
+
+        事件循环是单线程的，这里不加锁；并发请求最多重复加载一次。
+        """
+        tree = self._fresh_tree()
+        if tree is not None:
+            return tree
+        return await run_steps(self._load_steps(self._tree))
+
+
+account_cache = AccountTreeCache()
+
+
+def get_account_tree():
+    """获取进程内共享的科目树"""
+    return account_cache.get_tree()
+
+
+def invalidate_account_tree():
+    """使进程内共享的科目树失效"""
+    account_cache.invalidate()
@@ -0,0 +1,725 @@
+# backend/analytics.py
+"""分录的列式分析快照与透视查询（/api/analytics/pivot）
+
+科目×月份透视、费用科目排名、按摘要分类汇总等临时分析不走固定的报表存储过程，直接在 MySQL 上跑会和凭证写入
+争用，所以把分录（关联凭证头）导出成列式快照，透视查询在进程内对快照做向量化的过滤、分组和求和，不访问数据库。
+
+快照目录（config.ANALYTICS_CONFIG['snapshot_dir']）的结构：
+- manifest.json：当前版本的段列表、字典文件及长度、已包含的最大凭证ID、各年度的凭证数和凭证ID之和；
+- seg-*/：一个段，每列一个 .npy 文件，查询时以内存映射（mmap）方式打开，多个 worker 共享操作系统的页缓存；
+  金额以分为单位存为 int64，日期存为 int32 的 yyyymmdd；
+- *.jsonl：科目代码、凭证字、分录摘要的字典（每行一项，只追加），段中存字典下标。
+  字典编码加上窄整数列，快照通常只有分录表的几分之一大小。
+
+刷新（refresh_snapshot，python analytics.py --refresh 或 POST /api/analytics/refresh）在一个一致性快照的
+只读事务中进行（配置了只读副本时从副本读取）：
+- 增量：只读取凭证ID大于上次最大ID的分录，写成新的段；
+- 删除与迟到的写入：比对各年度 ID 不超过上次最大ID 的凭证数和ID之和，与上次记录不一致的年度（删除了凭证、
+  或较小ID的凭证晚于上次刷新才提交）从各段中剔除后整年重新读取；
+- 已结账归档的年度从归档表读取（见 period_close）；
+- 小段（行数少于 segment_rows）累积超过 MAX_SMALL_SEGMENTS 个时合并为一段。
+新版本写完后原子替换 manifest.json，各 worker 在下一次查询时发现并重新映射。
+
+透视查询的参数见 pivot。科目维度按当前科目树汇总到指定级次（默认一级科目）。
+"""
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from config import ANALYTICS_CONFIG
+from db_steps import Query, run_sync
+from period_close import ARCHIVE_TABLES, HOT_TABLES
+from statement_engine import np
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+LOCK_FILE = '.refresh.lock'
+MAX_SMALL_SEGMENTS = 8
+
+# 段中的列及类型
+COLUMNS = (
+    ('voucher_id', 'int32'),
+    ('voucher_date', 'int32'),    # yyyymmdd
+    ('voucher_type', 'int32'),    # voucher_types 字典下标
+    ('account', 'int32'),         # accounts 字典下标
+    ('summary', 'int32'),         # summaries 字典下标
+    ('debit', 'int64'),           # 借方金额（分）
+    ('credit', 'int64'),          # 贷方金额（分）
+)
+DICTIONARIES = ('accounts', 'voucher_types', 'summaries')
+DIMENSIONS = ('account', 'year', 'month', 'voucher_type', 'summary')
+MEASURES = ('net', 'debit', 'credit', 'count')
+
+
+class SnapshotUnavailable(Exception):
+    """快照尚未生成，或未安装 numpy"""
+
+
+def snapshot_dir():
+    return ANALYTICS_CONFIG['snapshot_dir'] or os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            'analytics_snapshot')
+
+
+def require_numpy():
+    if np is None:
+        raise SnapshotUnavailable("分析快照需要安装 numpy（pip install numpy）")
+
+
+# --- 读取快照 ---
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    return manifest if manifest.get('format') == FORMAT_VERSION else None
+
+
+def read_dictionary(directory, spec):
+    """读取字典文件的前 spec['size'] 项（写入方可能已追加了新版本的项）"""
+    items = []
+    if spec['size']:
+        with open(os.path.join(directory, spec['file']), encoding='utf-8') as f:
+            for line in f:
+                items.append(json.loads(line))
+                if len(items) == spec['size']:
+                    break
+    return items
+
+
+class Segment:
+    """一个段：各列以只读内存映射打开"""
+
+    def __init__(self, directory, name):
+        self.name = name
+        self.columns = {column: np.load(os.path.join(directory, name, f"{column}.npy"), mmap_mode='r')
+                        for column, _ in COLUMNS}
+        self.rows = len(self.columns['voucher_id'])
+
+
+class Snapshot:
+    """某一版本的分析快照（只读）"""
+
+    def __init__(self, directory, manifest, mtime=None):
+        self.directory = directory
+        self.manifest = manifest
+        self.mtime = mtime
+        self.segments = [Segment(directory, name) for name in manifest['segments']]
+        self.dictionaries = {name: read_dictionary(directory, manifest['dictionaries'][name]) for name in DICTIONARIES}
+        years = [int(year) for year in manifest['checksums']]
+        self.first_year = min(years, default=date.today().year)
+        self.last_year = max(years, default=date.today().year)
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    @property
+    def rows(self):
+        return sum(s.rows for s in self.segments)
+
+    def cached(self, key, build):
+        """按 key 缓存由字典推导出的数组（如科目汇总映射、摘要过滤掩码），快照版本不变时复用"""
+        with self._cache_lock:
+            if key not in self._cache:
+                if len(self._cache) >= 64:
+                    self._cache.clear()
+                self._cache[key] = build()
+            return self._cache[key]
+
+    def info(self):
+        return {
+            'last_voucher_id': self.manifest['last_voucher_id'],
+            'refreshed_at': self.manifest['refreshed_at'],
+            'entries': self.rows,
+            'segments': len(self.segments),
+        }
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """当前进程使用的快照；manifest.json 被替换后在下一次调用时重新加载。没有快照时抛出 SnapshotUnavailable"""
+    global _snapshot
+    require_numpy()
+    directory = snapshot_dir()
+    try:
+        mtime = os.stat(os.path.join(directory, MANIFEST)).st_mtime_ns
+    except FileNotFoundError:
+        raise SnapshotUnavailable("分析快照尚未生成，请先运行 python analytics.py --refresh")
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.directory == directory and snapshot.mtime == mtime:
+        return snapshot
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.directory != directory or _snapshot.mtime != mtime:
+            manifest = read_manifest(directory)
+            if manifest is None:
+                raise SnapshotUnavailable("分析快照格式不兼容，请运行 python analytics.py --refresh --full 重建")
+            _snapshot = Snapshot(directory, manifest, mtime)
+        return _snapshot
+
+
+# --- 刷新快照 ---
+
+def archived_years():
+    rows = yield Query("SELECT fiscal_year FROM fiscal_year_closings WHERE archived_at IS NOT NULL", fetch='all')
+    return sorted(r['fiscal_year'] for r in rows)
+
+
+def table_sets(archived):
+    """[(凭证表, 分录表, 年度条件, 参数)]：已归档的年度读归档表，其余年度读热表（避免结账过程中重复读取）"""
+    if not archived:
+        return [(*HOT_TABLES, "1 = 1", ())]
+    placeholders = ", ".join(["%s"] * len(archived))
+    return [(*HOT_TABLES, f"v.fiscal_year NOT IN ({placeholders})", tuple(archived)),
+            (*ARCHIVE_TABLES, f"v.fiscal_year IN ({placeholders})", tuple(archived))]
+
+
+def voucher_checksums(archived, last_id):
+    """各年度的凭证数、ID之和、最大ID，以及其中 ID 不超过 last_id 的凭证数和ID之和（步骤生成器）"""
+    result = {}
+    for vouchers, _, condition, params in table_sets(archived):
+        rows = yield Query(f"""
+            SELECT v.fiscal_year, COUNT(*) AS vouchers, SUM(v.id) AS id_sum, MAX(v.id) AS max_id,
+                   SUM(v.id <= %s) AS old_vouchers, COALESCE(SUM(IF(v.id <= %s, v.id, 0)), 0) AS old_id_sum
+            FROM {vouchers} v
+            WHERE {condition}
+            GROUP BY v.fiscal_year
+        """, (last_id, last_id, *params), fetch='all')
+        for r in rows:
+            result[r['fiscal_year']] = r
+    return result
+
+
+class SnapshotWriter:
+    """在快照目录中写入新版本：追加字典、写段、最后原子替换 manifest.json
+
+    current 为增量刷新所基于的快照（全量生成时为 None），generation 为新版本号。
+    """
+
+    def __init__(self, directory, current, generation):
+        self.directory = directory
+        self.generation = generation
+        if current:
+            self.dictionary_files = {name: dict(current.manifest['dictionaries'][name]) for name in DICTIONARIES}
+            values = current.dictionaries
+        else:
+            self.dictionary_files = {name: {'file': f"{name}-{generation}.jsonl", 'size': 0} for name in DICTIONARIES}
+            values = {name: [] for name in DICTIONARIES}
+        self.indexes = {name: {value: i for i, value in enumerate(items)} for name, items in values.items()}
+        self.pending = {name: [] for name in DICTIONARIES}
+        self.segment_count = 0
+
+    def encode(self, name, value):
+        index = self.indexes[name].get(value)
+        if index is None:
+            index = self.indexes[name][value] = len(self.indexes[name])
+            self.pending[name].append(value)
+        return index
+
+    def segment_name(self):
+        self.segment_count += 1
+        return f"seg-{self.generation:06d}-{self.segment_count:04d}"
+
+    def write_segment(self, arrays):
+        name = self.segment_name()
+        path = os.path.join(self.directory, name)
+        os.makedirs(path)
+        for column, dtype in COLUMNS:
+            np.save(os.path.join(path, f"{column}.npy"), np.asarray(arrays[column], dtype=dtype))
+        return name
+
+    def write_rows(self, rows):
+        """把一批分录行 (voucher_id, voucher_date, voucher_type, account_code, summary, debit, credit) 编码为一段"""
+        columns = {column: [] for column, _ in COLUMNS}
+        for voucher_id, voucher_date, voucher_type, account_code, summary, debit, credit in rows:
+            columns['voucher_id'].append(voucher_id)
+            columns['voucher_date'].append(voucher_date.year * 10000 + voucher_date.month * 100 + voucher_date.day)
+            columns['voucher_type'].append(self.encode('voucher_types', voucher_type))
+            columns['account'].append(self.encode('accounts', account_code))
+            columns['summary'].append(self.encode('summaries', summary))
+            columns['debit'].append(int(debit * 100))
+            columns['credit'].append(int(credit * 100))
+        return self.write_segment(columns)
+
+    def merge(self, segments, keep=None):
+        """把若干段合并为一段（keep 为每段的行掩码，None 表示保留全部），直接写入内存映射文件，不整体读入内存"""
+        masks = [None] * len(segments) if keep is None else keep
+        total = sum(s.rows if m is None else int(m.sum()) for s, m in zip(segments, masks))
+        name = self.segment_name()
+        path = os.path.join(self.directory, name)
+        os.makedirs(path)
+        for column, dtype in COLUMNS:
+            out = np.lib.format.open_memmap(os.path.join(path, f"{column}.npy"), mode='w+', dtype=dtype, shape=(total,))
+            offset = 0
+            for segment, mask in zip(segments, masks):
+                values = segment.columns[column] if mask is None else segment.columns[column][mask]
+                out[offset:offset + len(values)] = values
+                offset += len(values)
+            out.flush()
+            del out
+        return name
+
+    def commit(self, segments, last_voucher_id, checksums):
+        """追加字典并原子替换 manifest.json"""
+        for name in DICTIONARIES:
+            if self.pending[name]:
+                spec = self.dictionary_files[name]
+                path = os.path.join(self.directory, spec['file'])
+                with open(path, 'a+', encoding='utf-8') as f:
+                    # 去掉上次中断的刷新追加在已提交项之后的内容
+                    f.seek(0)
+                    for _ in range(spec['size']):
+                        f.readline()
+                    f.truncate(f.tell())
+                    for value in self.pending[name]:
+                        f.write(json.dumps(value, ensure_ascii=False) + '\n')
+                self.dictionary_files[name]['size'] += len(self.pending[name])
+        manifest = {
+            'format': FORMAT_VERSION,
+            'generation': self.generation,
+            'last_voucher_id': last_voucher_id,
+            'checksums': {str(year): value for year, value in sorted(checksums.items())},
+            'segments': segments,
+            'dictionaries': self.dictionary_files,
+            'refreshed_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        tmp = os.path.join(self.directory, MANIFEST + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.directory, MANIFEST))
+        return manifest
+
+
+def remove_unused_files(directory, manifest):
+    """删除 manifest 不再引用的段和字典文件（已映射这些文件的进程在 Linux 上仍可继续读取）"""
+    used = set()
+    if manifest:
+        used = set(manifest['segments']) | {spec['file'] for spec in manifest['dictionaries'].values()}
+    for name in os.listdir(directory):
+        if (name.startswith('seg-') or name.endswith('.jsonl')) and name not in used:
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+
+def stream_entries(conn, archived, id_condition, params, batch_size):
+    """按凭证ID顺序分批读取分录行（非缓冲游标，逐批产出元组列表）"""
+    cursor = conn.cursor()
+    try:
+        for vouchers, entries, condition, year_params in table_sets(archived):
+            cursor.execute(f"""
+                SELECT v.id, v.voucher_date, v.voucher_type, je.account_code, je.summary,
+                       je.debit_amount, je.credit_amount
+                FROM {entries} je
+                JOIN {vouchers} v ON v.id = je.voucher_id AND v.fiscal_year = je.fiscal_year
+                WHERE {condition} AND {id_condition}
+                ORDER BY v.id, je.id
+            """, (*year_params, *params))
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield batch
+    finally:
+        cursor.close()
+
+
+def refresh_snapshot(conn, full=False, directory=None):
+    """增量刷新（full 为真或没有快照时全量生成）分析快照，返回刷新结果
+
+    conn 为从连接池借出的连接（可以是只读副本），全部读取在一个一致性快照的只读事务中完成。
+    同一快照目录同一时间只允许一个刷新任务（文件锁）。
+    """
+    require_numpy()
+    started = time.perf_counter()
+    directory = directory or snapshot_dir()
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise RuntimeError("已有分析快照刷新任务正在运行")
+
+        previous = read_manifest(directory)
+        remove_unused_files(directory, previous)  # 清理上次中断的刷新留下的文件
+        manifest = None if full else previous
+        current = Snapshot(directory, manifest) if manifest else None
+        last_id = manifest['last_voucher_id'] if manifest else 0
+        writer = SnapshotWriter(directory, current, (previous['generation'] if previous else 0) + 1)
+
+        cursor = conn.cursor(dictionary=True)
+        conn.start_transaction(consistent_snapshot=True, readonly=True)
+        try:
+            archived = run_sync(cursor, archived_years())
+            checksums = run_sync(cursor, voucher_checksums(archived, last_id))
+            old = {int(year): value for year, value in manifest['checksums'].items()} if manifest else {}
+            now = {year: [int(r['old_vouchers']), int(r['old_id_sum'])] for year, r in checksums.items()}
+            stale = sorted(year for year in set(old) | set(now) if old.get(year, [0, 0]) != now.get(year, [0, 0]))
+            new_last_id = max([last_id] + [r['max_id'] for r in checksums.values()])
+            if current and not stale and new_last_id == last_id:
+                conn.commit()
+                return {'mode': 'unchanged', 'last_voucher_id': last_id, 'new_entries': 0, 'reloaded_years': [],
+                        'segments': len(current.segments), 'seconds': round(time.perf_counter() - started, 3)}
+
+            # 剔除需要整年重新读取的年度，并合并小段
+            segments = current.segments if current else []
+            kept = []
+            if stale and segments:
+                stale_array = np.array(stale)
+                masks = [~np.isin(s.columns['voucher_date'] // 10000, stale_array) for s in segments]
+                rewrite = [(s, m) for s, m in zip(segments, masks) if not m.all()]
+                untouched = [s for s, m in zip(segments, masks) if m.all()]
+                kept = [s.name for s in untouched]
+                if rewrite:
+                    kept.append(writer.merge([s for s, _ in rewrite], [m for _, m in rewrite]))
+            else:
+                kept = [s.name for s in segments]
+
+            id_condition = "v.id > %s AND v.id <= %s"
+            params = (last_id, new_last_id)
+            if stale:
+                placeholders = ", ".join(["%s"] * len(stale))
+                id_condition = f"v.id <= %s AND (v.id > %s OR v.fiscal_year IN ({placeholders}))"
+                params = (new_last_id, last_id, *stale)
+            new_entries = 0
+            buffer = []
+            for batch in stream_entries(conn, archived, id_condition, params, ANALYTICS_CONFIG['refresh_batch']):
+                buffer.extend(batch)
+                if len(buffer) >= ANALYTICS_CONFIG['segment_rows']:
+                    kept.append(writer.write_rows(buffer))
+                    new_entries += len(buffer)
+                    buffer = []
+            if buffer:
+                kept.append(writer.write_rows(buffer))
+                new_entries += len(buffer)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        # 小段过多时合并（只合并不足 segment_rows 行的段，大段保持不动）
+        loaded = {s.name: s for s in segments}
+        for name in kept:
+            if name not in loaded:
+                loaded[name] = Segment(directory, name)
+        small = [name for name in kept if loaded[name].rows < ANALYTICS_CONFIG['segment_rows']]
+        if len(small) > MAX_SMALL_SEGMENTS:
+            merged = writer.merge([loaded[name] for name in small])
+            kept = [name for name in kept if name not in small] + [merged]
+
+        # 刷新后快照包含 ID 不超过 new_last_id 的全部凭证，记下各年度的凭证数和ID之和供下次比对
+        manifest = writer.commit(kept, new_last_id, {year: [int(r['vouchers']), int(r['id_sum'])]
+                                                      for year, r in checksums.items()})
+        remove_unused_files(directory, manifest)
+    return {
+        'mode': 'full' if not current else 'incremental',
+        'last_voucher_id': new_last_id,
+        'new_entries': new_entries,
+        'reloaded_years': stale if current else [],
+        'segments': len(kept),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+# --- 透视查询 ---
+
+class Dimension:
+    """一个分组维度：把段中的行映射为 0..size-1 的分组号（分组号的顺序即标签的顺序），
+    labels(分组号) 为该分组的行标签字段"""
+
+    def __init__(self, name, size, codes, labels, column_label):
+        self.name = name
+        self.size = size
+        self.codes = codes                # codes(列字典) -> int64 数组
+        self.labels = labels              # 分组号 -> 标签字段
+        self.column_label = column_label  # 分组号 -> 作为列维度时的列名
+
+
+def account_rollup(snapshot, tree, level):
+    """科目字典下标 -> 汇总到 level 级的科目分组号，返回 (映射数组, 按代码排序的分组科目)"""
+    def build():
+        targets = []
+        for code in snapshot.dictionaries['accounts']:
+            chain = tree.ancestors.get(code) or [code]
+            targets.append(chain[level - 1] if len(chain) >= level else chain[-1])
+        groups = sorted(set(targets))
+        index = {code: i for i, code in enumerate(groups)}
+        return np.array([index[code] for code in targets], dtype=np.int64), groups
+    return snapshot.cached(('account', tree.etag, level), build)
+
+
+def make_dimension(snapshot, tree, name, level):
+    first_year = snapshot.first_year
+    years = snapshot.last_year - first_year + 1
+    if name == 'account':
+        mapping, groups = account_rollup(snapshot, tree, level)
+        names = [(tree.get(code) or {}).get('account_name') for code in groups]
+        return Dimension(name, max(len(groups), 1), lambda c: mapping[c['account']],
+                         lambda i: {'account_code': groups[i], 'account_name': names[i]}, lambda i: groups[i])
+    if name == 'year':
+        return Dimension(name, years, lambda c: c['voucher_date'] // 10000 - first_year,
+                         lambda i: {'year': first_year + i}, lambda i: str(first_year + i))
+    if name == 'month':
+        def period(i):
+            return f"{first_year + i // 12}-{i % 12 + 1:02d}"
+        return Dimension(name, years * 12,
+                         lambda c: (c['voucher_date'] // 10000 - first_year) * 12 + c['voucher_date'] // 100 % 100 - 1,
+                         lambda i: {'period': period(i)}, period)
+    # 字典按出现顺序编号，分组号改用排序后的位置，使分组号的顺序与标签顺序一致
+    def build():
+        values = snapshot.dictionaries['voucher_types' if name == 'voucher_type' else 'summaries']
+        ordered = sorted(range(len(values)), key=values.__getitem__)
+        rank = np.empty(len(values), dtype=np.int64)
+        rank[ordered] = np.arange(len(values))
+        return rank, [values[i] for i in ordered]
+    rank, ordered = snapshot.cached(('dictionary_order', name), build)
+    return Dimension(name, max(len(ordered), 1), lambda c: rank[c[name]],
+                     lambda i: {name: ordered[i]}, lambda i: ordered[i])
+
+
+def parse_dimensions(value):
+    names = [n.strip() for n in value.split(',') if n.strip()]
+    for n in names:
+        if n not in DIMENSIONS:
+            raise ValueError(f"不支持的维度: {n}（可选 {' / '.join(DIMENSIONS)}）")
+    if len(set(names)) != len(names):
+        raise ValueError("维度不能重复")
+    return names
+
+
+def parse_yyyymmdd(value, name):
+    try:
+        d = date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} 日期格式错误: {value}")
+    return d.year * 10000 + d.month * 100 + d.day
+
+
+def row_filter(snapshot, args):
+    """按查询参数构造行过滤函数 mask(列字典) -> 布尔数组（没有过滤条件时返回 None）"""
+    conditions = []
+    years = args.get('year')
+    if years:
+        try:
+            year_list = np.array([int(y) for y in years.split(',')])
+        except ValueError:
+            raise ValueError(f"无效的年度: {years}")
+        conditions.append(lambda c: np.isin(c['voucher_date'] // 10000, year_list))
+    if args.get('date_from'):
+        start = parse_yyyymmdd(args['date_from'], 'date_from')
+        conditions.append(lambda c: c['voucher_date'] >= start)
+    if args.get('date_to'):
+        end = parse_yyyymmdd(args['date_to'], 'date_to')
+        conditions.append(lambda c: c['voucher_date'] <= end)
+    prefix = args.get('account_code')
+    if prefix:
+        accounts = snapshot.cached(('account_code', prefix), lambda: np.array(
+            [code.startswith(prefix) for code in snapshot.dictionaries['accounts']], dtype=bool))
+        conditions.append(lambda c: accounts[c['account']])
+    voucher_type = args.get('voucher_type')
+    if voucher_type:
+        types = snapshot.dictionaries['voucher_types']
+        type_index = types.index(voucher_type) if voucher_type in types else -1
+        conditions.append(lambda c: c['voucher_type'] == type_index)
+    text = args.get('summary')
+    if text:
+        summaries = snapshot.cached(('summary', text), lambda: np.array(
+            [text in s for s in snapshot.dictionaries['summaries']], dtype=bool))
+        conditions.append(lambda c: summaries[c['summary']])
+    if not conditions:
+        return None
+
+    def mask(columns):
+        result = conditions[0](columns)
+        for condition in conditions[1:]:
+            result &= condition(columns)
+        return result
+    return mask
+
+
+def group_totals(keys, debit, credit, counts):
+    """按 keys 分组求和（排序后 reduceat，整数精确求和），返回 (keys, debit, credit, counts)"""
+    if not len(keys):
+        return keys, debit, credit, counts
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return (keys[starts], np.add.reduceat(debit[order], starts), np.add.reduceat(credit[order], starts),
+            np.add.reduceat(counts[order], starts))
+
+
+def measure_values(measure, debit, credit, counts):
+    if measure == 'net':
+        return debit - credit
+    return {'debit': debit, 'credit': credit, 'count': counts}[measure]
+
+
+def output_value(measure, value):
+    return int(value) if measure == 'count' else Decimal(int(value)).scaleb(-2)
+
+
+def pivot(snapshot, tree, args):
+    """在分析快照上做透视汇总
+
+    参数：
+    - rows: 行维度，逗号分隔，默认 account；columns: 列维度（至多一个），可省略。
+      维度为 account（科目，按 level 级汇总，默认 1）、year、month、voucher_type（凭证字）、summary（分录摘要）；
+    - measure: net（借方-贷方，默认）/ debit / credit / count（分录数）；
+    - 过滤：year（可逗号分隔多个）、date_from、date_to、account_code（含下级科目）、voucher_type、summary（摘要包含）；
+    - top: 只返回合计最大的 N 行（order=asc 时为最小）；order: asc / desc 按行合计排序，默认按行标签排序。
+    返回各行的标签、与 columns 对齐的 values 和 total，以及各列合计和总计；超过 max_rows 行时截断。
+    """
+    rows = parse_dimensions(args.get('rows') or 'account')
+    columns = parse_dimensions(args.get('columns') or '')
+    if not rows:
+        raise ValueError("至少需要一个行维度")
+    if len(columns) > 1:
+        raise ValueError("列维度至多一个")
+    if set(rows) & set(columns):
+        raise ValueError("同一维度不能同时作为行和列")
+    measure = args.get('measure') or 'net'
+    if measure not in MEASURES:
+        raise ValueError(f"不支持的度量: {measure}（可选 {' / '.join(MEASURES)}）")
+    level = args.get('level', 1, type=int)
+    if not 1 <= level <= 4:
+        raise ValueError("科目级次应为 1~4")
+    order = args.get('order')
+    if order not in (None, 'asc', 'desc'):
+        raise ValueError("order 应为 asc 或 desc")
+    top = args.get('top', type=int)
+    if top is not None and top < 1:
+        raise ValueError("top 应为正整数")
+    if top and not order:
+        order = 'desc'
+
+    row_dims = [make_dimension(snapshot, tree, name, level) for name in rows]
+    column_dim = make_dimension(snapshot, tree, columns[0], level) if columns else None
+    column_size = column_dim.size if column_dim else 1
+    space = column_size
+    for dim in row_dims:
+        space *= dim.size
+    if space >= 2 ** 62:
+        raise ValueError("分组维度的组合过多，请减少维度")
+    mask = row_filter(snapshot, args)
+
+    # 各段分别过滤、编码分组键并求和，再合并各段的部分和
+    parts = []
+    for segment in snapshot.segments:
+        data = segment.columns
+        if mask is not None:
+            selected = np.flatnonzero(mask(data))
+            if not len(selected):
+                continue
+            data = {name: values[selected] for name, values in data.items()}
+        keys = np.zeros(len(data['debit']), dtype=np.int64)
+        for dim in row_dims + ([column_dim] if column_dim else []):
+            keys = keys * dim.size + dim.codes(data)
+        parts.append(group_totals(keys, np.asarray(data['debit']), np.asarray(data['credit']),
+                                  np.ones(len(keys), dtype=np.int64)))
+    if parts:
+        keys, debit, credit, counts = group_totals(*(np.concatenate(p) for p in zip(*parts)))
+    else:
+        keys = debit = credit = counts = np.zeros(0, dtype=np.int64)
+    values = measure_values(measure, debit, credit, counts)
+
+    # keys 已排序，行键（去掉列维度）也是有序的，同一行的各列相邻
+    row_keys, column_codes = np.divmod(keys, column_size)
+    row_starts = np.flatnonzero(np.concatenate(([True], row_keys[1:] != row_keys[:-1]))) if len(keys) else keys
+    unique_rows = row_keys[row_starts]
+    row_totals = np.add.reduceat(values, row_starts) if len(keys) else values
+    row_index = np.repeat(np.arange(len(row_starts)), np.diff(np.append(row_starts, len(keys))))
+
+    def row_labels(row_key):
+        fields = {}
+        for dim in reversed(row_dims):
+            row_key, code = divmod(int(row_key), dim.size)
+            fields = {**dim.labels(code), **fields}
+        return fields
+
+    limit = min(top or ANALYTICS_CONFIG['max_rows'], ANALYTICS_CONFIG['max_rows'])
+    if order:
+        selected_rows = np.argsort(row_totals if order == 'asc' else -row_totals, kind='stable')[:limit]
+    else:
+        selected_rows = np.arange(min(len(unique_rows), limit))  # 行键的顺序即标签顺序
+
+    column_list = []
+    column_totals = []
+    if column_dim:
+        present, column_index = np.unique(column_codes, return_inverse=True)
+        if len(present) > ANALYTICS_CONFIG['max_columns']:
+            raise ValueError(f"列维度有 {len(present)} 个取值，超过上限 {ANALYTICS_CONFIG['max_columns']}，请增加过滤条件")
+        sums = np.zeros(len(present), dtype=np.int64)
+        np.add.at(sums, column_index, values)
+        column_list = [column_dim.column_label(int(code)) for code in present]
+        column_totals = [output_value(measure, total) for total in sums]
+
+    wanted = np.zeros(len(unique_rows), dtype=bool)
+    wanted[selected_rows] = True
+    cells = {}
+    if column_dim:
+        for i in np.flatnonzero(wanted[row_index]):
+            cells.setdefault(int(row_index[i]), {})[int(column_index[i])] = values[i]
+
+    result_rows = []
+    for r in selected_rows:
+        r = int(r)
+        row = row_labels(unique_rows[r])
+        if column_dim:
+            row_cells = cells.get(r, {})
+            row['values'] = [output_value(measure, row_cells.get(c, 0)) for c in range(len(column_list))]
+        row['total'] = output_value(measure, row_totals[r])
+        result_rows.append(row)
+
+    return {
+        'measure': measure,
+        'rows': result_rows,
+        'columns': column_list,
+        'column_totals': column_totals,
+        'total': output_value(measure, values.sum()),
+        'row_count': len(unique_rows),
+        'truncated': len(result_rows) < len(unique_rows),
+        'snapshot': snapshot.info(),
+    }
+
+
+def run_pivot(tree, args):
+    """接口入口：在当前进程的快照上执行透视查询"""
+    return pivot(get_snapshot(), tree, args)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from db_utils import get_db_connection
+
+    parser = argparse.ArgumentParser(description="生成或增量刷新分录的列式分析快照")
+    parser.add_argument('--refresh', action='store_true', help="刷新快照（没有快照时全量生成）")
+    parser.add_argument('--full', action='store_true', help="丢弃现有快照，全量重新生成")
+    args = parser.parse_args()
+    if not (args.refresh or args.full):
+        parser.error("请指定 --refresh 或 --full")
+
+    conn = get_db_connection(read_only=True)
+    if conn is None:
+        raise SystemExit("数据库连接失败")
+    with conn:
+        result = refresh_snapshot(conn, full=args.full)
+    if result['mode'] == 'unchanged':
+        print(f"快照已是最新（凭证ID {result['last_voucher_id']}）")
+    else:
+        reloaded = f"，重新读取 {', '.join(map(str, result['reloaded_years']))} 年度" if result['reloaded_years'] else ""
+        print(f"{'全量生成' if result['mode'] == 'full' else '增量刷新'}完成：新写入 {result['new_entries']} 条分录{reloaded}，"
+              f"共 {result['segments']} 段，最大凭证ID {result['last_voucher_id']}，用时 {result['seconds']:.1f} 秒")
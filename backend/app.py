@@ -1,8 +1,81 @@
 # backend/app.py (最终修正版)
-from flask import Flask, jsonify, render_template, request
-from db_utils import get_db_connection
+import csv
+import io
+from datetime import date
+
+from flask import Flask, Response, g, has_request_context, jsonify, make_response, render_template, request
+from flask.json.provider import DefaultJSONProvider
+import fast_json
+import metrics
+import services
+from account_search import search_accounts
+from analytics import SnapshotUnavailable, refresh_snapshot, run_pivot
+from account_tree import get_account_tree, invalidate_account_tree
+from balance_rebuild import rebuild_dirty_years
+from config import (ACCOUNT_SEARCH_LIMIT, ACCOUNT_SEARCH_LIMIT_MAX, DB_READ_CONFIG, DB_REPLICAS,
+                    IMPORT_BATCH_SIZE)
+from db_replicas import pin_cookie_value, pinned_to_primary, routing_gauges
+from db_steps import run_sync, start
+from db_utils import get_db_connection, get_pool_stats
+from exports import (EXPORT_FORMATS, WRITERS, account_summary_source, general_ledger_source,
+                     trial_balance_source, vouchers_source, xlsx_available)
+from fast_json import FastJSONMixin
+from report_cache import report_cache
+from reports import parse_period_range
+from services import ServiceError
+from voucher_import import ImportResult, import_vouchers, parse_stream
+
+class FastJSONProvider(FastJSONMixin, DefaultJSONProvider):
+    """orjson 编码的 JSON 提供者（见 fast_json），金额格式取自请求参数 decimals"""
+
+    def decimal_mode(self):
+        return request.args.get('decimals') if has_request_context() else None
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+
+# --- 请求耗时统计（见 metrics）---
+
+@app.before_request
+def start_request_timing():
+    if metrics.enabled():
+        g.timing_token = metrics.start_request()
+
+@app.after_request
+def finish_request_timing(response):
+    token = g.pop('timing_token', None)
+    if token is not None:
+        route = request.url_rule.rule if request.url_rule else None
+        timing = metrics.finish_request(token, route, request.method, response.status_code)
+        response.headers['Server-Timing'] = metrics.server_timing_header(timing)
+    return response
+
+@app.before_request
+def check_response_format():
+    """校验 decimals / shape 参数（见 fast_json）"""
+    error = fast_json.check_format_args(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+@app.after_request
+def route_reads(response):
+    """只读副本（见 db_replicas）：写请求成功后设置读自己的写 Cookie，并在 X-DB-Route 中给出本次读取的实例"""
+    if DB_REPLICAS:
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(DB_READ_CONFIG['read_your_writes_cookie'], pin_cookie_value(),
+                                max_age=DB_READ_CONFIG['read_your_writes_seconds'], httponly=True, samesite='Lax')
+        route = g.pop('db_route', None)
+        if route:
+            response.headers['X-DB-Route'] = route
+    return response
+
+def get_read_connection():
+    """借出只读连接：优先使用只读副本，客户端刚写入过时走主库"""
+    pinned = pinned_to_primary(request.cookies.get(DB_READ_CONFIG['read_your_writes_cookie']))
+    conn = get_db_connection(read_only=True, pinned=pinned)
+    if conn is not None:
+        g.db_route = conn.route
+    return conn
 
 # --- 页面渲染路由 ---
 
@@ -22,372 +95,272 @@ def show_reports_page():
     """渲染财务报表页面"""
     return render_template('reports.html')
 
+# --- 接口的执行方式 ---
+
+def call_service(steps, error_prefix, status=200, transaction=None, after_commit=None, columnar=False):
+    """在一个池连接上执行 services 中的步骤生成器，并把结果或错误转换为 JSON 响应
+
+    transaction 为 'write' 时在写事务中执行并提交（出错回滚），为 'snapshot' 时在一致性快照的只读事务中执行；
+    after_commit 在提交成功后调用（如使科目树缓存失效）。只读快照在连接归还时结束。
+    columnar 为 True 的接口支持 ?shape=columns，以列式结构返回结果中的行列表（见 fast_json.to_columns）。
+    GET 请求上不写数据的调用从只读副本读取（见 db_replicas）。
+    """
+    try:
+        done, result = start(steps)
+    except ServiceError as e:
+        return jsonify(e.to_dict()), e.status
+    if done:
+        return jsonify(shape_result(result, columnar)), status
+
+    if request.method == 'GET' and transaction != 'write':
+        conn = get_read_connection()
+    else:
+        conn = get_db_connection()
+    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
+
+    with conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            if transaction == 'write':
+                conn.start_transaction()
+            elif transaction == 'snapshot':
+                conn.start_transaction(consistent_snapshot=True, readonly=True)
+            result = run_sync(cursor, result)
+            if transaction == 'write':
+                conn.commit()
+                if after_commit:
+                    after_commit()
+            return jsonify(shape_result(result, columnar)), status
+        except ServiceError as e:
+            conn.rollback()
+            return jsonify(e.to_dict()), e.status
+        except Exception as e:
+            conn.rollback()
+            return jsonify({"error": f"{error_prefix}: {e}"}), 500
+        finally:
+            cursor.close()
+
+def shape_result(result, columnar):
+    if columnar and request.args.get('shape') == 'columns':
+        return fast_json.to_columns(result)
+    return result
+
+def load_account_tree():
+    """获取科目树；加载失败时返回 (None, 错误响应)"""
+    try:
+        return get_account_tree(), None
+    except Exception as e:
+        return None, (jsonify({"error": f"加载会计科目失败: {e}"}), 500)
+
 # --- API 路由：科目管理 (CRUD) ---
 
-@app.route("/api/accounts", methods=['GET'])
-def get_accounts_api():
-    """获取所有会计科目，并增加是否为末级科目的标志"""
-    conn = get_db_connection()
-    if conn is None:
-        return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
+def account_tree_response(build):
+    """用科目树缓存生成 JSON 响应；客户端带着相同的 ETag 再次请求时返回 304"""
     try:
-        # 这个SQL查询会判断每个科目是否作为其他科目的父科目出现过
-        # 如果没有，则它就是末级科目 (is_leaf = true)
-        sql = """
-            SELECT
-                a.*,
-                (CASE WHEN b.parent_code IS NULL THEN 1 ELSE 0 END) as is_leaf
-            FROM
-                chart_of_accounts a
-            LEFT JOIN
-                (SELECT DISTINCT parent_code FROM chart_of_accounts WHERE parent_code IS NOT NULL) b
-            ON
-                a.account_code = b.parent_code
-            ORDER BY
-                a.account_code;
-        """
-        cursor.execute(sql)
-        accounts = cursor.fetchall()
-        return jsonify(accounts)
+        tree = get_account_tree()
     except Exception as e:
-        return jsonify({"error": f"查询科目列表失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+        return jsonify({"error": f"加载会计科目失败: {e}"}), 500
+    if request.if_none_match.contains(tree.etag):
+        response = make_response('', 304)
+    else:
+        response = build(tree)
+        if isinstance(response, tuple):
+            return response
+        response = jsonify(response)
+    response.set_etag(tree.etag)
+    return response
+
+@app.route("/api/accounts", methods=['GET'])
+def get_accounts_api():
+    """获取所有会计科目，并增加是否为末级科目的标志（由科目树缓存提供）"""
+    return account_tree_response(lambda tree: tree.ordered)
 
 @app.route("/api/accounts/<string:account_code>", methods=['GET'])
 def get_single_account_api(account_code):
     """获取单个会计科目的API接口"""
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    try:
-        cursor.execute("SELECT * FROM chart_of_accounts WHERE account_code = %s;", (account_code,))
-        account = cursor.fetchone()
-        if account:
-            return jsonify(account)
-        else:
+    def build(tree):
+        account = tree.get(account_code)
+        if account is None:
             return jsonify({"error": "未找到该科目"}), 404
-    except Exception as e:
-        return jsonify({"error": f"查询失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+        return account
+    return account_tree_response(build)
 
 @app.route("/api/accounts", methods=['POST'])
 def create_account_api():
     """新增一个会计科目"""
-    data = request.get_json()
-    if not data: return jsonify({"error": "请求体中没有提供数据"}), 400
-
-    account_code = data.get('account_code')
-    account_name = data.get('account_name')
-    balance_direction = data.get('balance_direction')
-
-    if not all([account_code, account_name, balance_direction]):
-        return jsonify({"error": "缺少必要的字段"}), 400
-
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor()
-    try:
-        sql = "INSERT INTO chart_of_accounts (account_code, account_name, balance_direction) VALUES (%s, %s, %s)"
-        cursor.execute(sql, (account_code, account_name, balance_direction))
-        conn.commit()
-        return jsonify({"message": "会计科目创建成功"}), 201
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": f"创建失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    return call_service(services.create_account(request.get_json(silent=True)), "创建失败",
+                        status=201, transaction='write', after_commit=invalidate_account_tree)
 
 @app.route("/api/accounts/<string:account_code>", methods=['PUT'])
 def update_account_api(account_code):
     """修改一个会计科目"""
-    data = request.get_json()
-    if not data: return jsonify({"error": "请求体中没有提供数据"}), 400
-
-    fields_to_update = []
-    values = []
-    if 'account_name' in data:
-        fields_to_update.append("account_name = %s")
-        values.append(data['account_name'])
-    if 'balance_direction' in data:
-        fields_to_update.append("balance_direction = %s")
-        values.append(data['balance_direction'])
-
-    if not fields_to_update:
-        return jsonify({"error": "没有提供可更新的字段"}), 400
-
-    values.append(account_code)
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor()
-    try:
-        sql = f"UPDATE chart_of_accounts SET {', '.join(fields_to_update)} WHERE account_code = %s"
-        cursor.execute(sql, tuple(values))
-        conn.commit()
-        return jsonify({"message": "会计科目更新成功"})
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": f"更新失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    return call_service(services.update_account(account_code, request.get_json(silent=True)), "更新失败",
+                        transaction='write', after_commit=invalidate_account_tree)
 
 @app.route("/api/accounts/<string:account_code>", methods=['DELETE'])
 def delete_account_api(account_code):
     """删除一个会计科目"""
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor()
-    try:
-        cursor.execute("DELETE FROM chart_of_accounts WHERE account_code = %s", (account_code,))
-        conn.commit()
-        if cursor.rowcount > 0:
-            return jsonify({"message": "删除成功"})
-        else:
-            return jsonify({"error": "未找到该科目"}), 404
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": f"删除失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    return call_service(services.delete_account(account_code), "删除失败",
+                        transaction='write', after_commit=invalidate_account_tree)
 
 # --- API 路由：期初余额管理 ---
 
 @app.route("/api/account_balances", methods=['GET'])
 def get_account_balances_api():
     """根据年份获取所有科目的期初余额，并判断是否为初始年份"""
-    year = request.args.get('year', type=int)
-    if not year: return jsonify({"error": "必须提供年份参数"}), 400
-
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    try:
-        cursor.execute("SELECT MIN(fiscal_year) as min_year FROM account_balances WHERE opening_balance != 0 OR period_debit != 0 OR period_credit != 0")
-        result = cursor.fetchone()
-        min_year = result['min_year'] if result and result['min_year'] is not None else year
-        is_initial_year = (year <= min_year)
-
-        sql = """
-            SELECT coa.account_code, ab.opening_balance
-            FROM chart_of_accounts coa
-            LEFT JOIN account_balances ab ON coa.account_code = ab.account_code AND ab.fiscal_year = %s
-            ORDER BY coa.account_code;
-        """
-        cursor.execute(sql, (year,))
-        balances = cursor.fetchall()
-        balance_map = {b['account_code']: b['opening_balance'] for b in balances}
-
-        return jsonify({
-            "balances": balance_map,
-            "is_initial_year": is_initial_year
-        })
-    except Exception as e:
-        return jsonify({"error": f"查询期初余额失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    return call_service(services.get_account_balances(request.args), "查询期初余额失败")
 
 @app.route("/api/account_balances", methods=['POST'])
 def save_account_balances_api():
     """批量保存或更新指定年份的期初余额"""
-    data = request.get_json()
-    year = data.get('year')
-    balances = data.get('balances')
-    if not year or balances is None:
-        return jsonify({"error": "缺少年份或余额数据"}), 400
-
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor()
-    try:
-        sql = """
-            INSERT INTO account_balances (account_code, fiscal_year, opening_balance)
-            VALUES (%s, %s, %s)
-            ON DUPLICATE KEY UPDATE opening_balance = VALUES(opening_balance)
-        """
-        data_to_insert = [(item['account_code'], year, item['balance']) for item in balances]
-        cursor.executemany(sql, data_to_insert)
-        conn.commit()
-        return jsonify({"message": f"{year}年度的期初余额已成功保存"})
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": f"保存期初余额失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    return call_service(services.save_account_balances(request.get_json(silent=True)), "保存期初余额失败",
+                        transaction='write')
 
 # --- API 路由：报表 ---
 
+@app.route("/api/reports/cache_stats", methods=['GET'])
+def get_report_cache_stats_api():
+    """获取报表缓存的命中/未命中统计"""
+    return jsonify(report_cache.stats())
+
 @app.route("/api/reports/generate_summary", methods=['POST'])
 def generate_summary_api():
     """调用存储过程，计算指定年度的科目汇总数据"""
-    data = request.get_json()
-    year = data.get('year')
-    if not year: return jsonify({"error": "必须提供年份"}), 400
-    
+    return call_service(services.generate_summary(request.get_json(silent=True)), "汇总计算失败",
+                        transaction='write')
+
+@app.route("/api/reports/verify_summary", methods=['GET'])
+def verify_summary_api():
+    """核对增量过账的科目余额与全量汇总是否一致，返回不一致的科目"""
+    return call_service(services.verify_summary(request.args), "核对科目余额失败")
+
+@app.route("/api/reports/dirty_years", methods=['GET'])
+def get_dirty_years_api():
+    """列出需要重建科目余额的年度"""
+    return call_service(services.dirty_years(request.args), "查询脏年度失败")
+
+@app.route("/api/reports/rebuild_balances", methods=['POST'])
+def rebuild_balances_api():
+    """从最早的脏年度（或 from_year）起逐年重建科目余额并向后结转，以 NDJSON 流逐行返回进度（见 balance_rebuild）"""
+    from_year = request.args.get('from_year', type=int)
     conn = get_db_connection()
     if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor()
-    try:
-        cursor.callproc('proc_generate_account_summary', (year,))
-        conn.commit()
-        return jsonify({"message": f"{year}年度科目汇总数据已生成"})
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": f"汇总计算失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+
+    def generate():
+        with conn:
+            try:
+                for event in rebuild_dirty_years(conn, from_year):
+                    yield fast_json.encode(event) + b'\n'
+            except Exception as e:
+                yield fast_json.encode({'event': 'error', 'error': f"科目余额重建失败: {e}"}) + b'\n'
+
+    response = Response(generate(), mimetype=EXPORT_FORMATS['ndjson'])
+    response.call_on_close(conn.close)
+    return response
 
 # 获取报表数据的API
 @app.route("/api/reports/account_summary", methods=['GET'])
 def get_account_summary_api():
-    """获取指定年度的科目汇总表数据"""
-    year = request.args.get('year', type=int)
-    if not year:
-        return jsonify({"error": "必须提供年份参数"}), 400
-
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    try:
-        sql = """
-            SELECT 
-                ab.account_code,
-                coa.account_name,
-                ab.opening_balance,
-                ab.period_debit,
-                ab.period_credit,
-                ab.closing_balance
-            FROM account_balances ab
-            JOIN chart_of_accounts coa ON ab.account_code = coa.account_code
-            WHERE ab.fiscal_year = %s
-            ORDER BY ab.account_code;
-        """
-        cursor.execute(sql, (year,))
-        summary_data = cursor.fetchall()
-        return jsonify(summary_data)
-    except Exception as e:
-        return jsonify({"error": f"获取科目汇总表失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    """获取指定年度（或 from_period~to_period 期间）的科目汇总表数据"""
+    return call_service(services.account_summary(request.args), "获取科目汇总表失败", columnar=True)
 
 @app.route("/api/reports/balance_sheet", methods=['GET'])
 def get_balance_sheet_api():
-    """获取资产负债表数据"""
-    year = request.args.get('year', type=int)
-    if not year:
-        return jsonify({"error": "必须提供年份参数"}), 400
+    """获取资产负债表数据（可用 from_period/to_period 指定期间）"""
+    return call_service(services.balance_sheet(request.args), "获取报表失败")
 
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    try:
-        cursor.callproc('proc_generate_balance_sheet', (year,))
-        cursor.execute("SELECT * FROM balance_sheet_report ORDER BY line_index;")
-        report_data = cursor.fetchall()
-        return jsonify(report_data)
-    except Exception as e:
-        return jsonify({"error": f"获取报表失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
 @app.route("/api/reports/income_statement", methods=['GET'])
 def get_income_statement_api():
-    """获取利润表数据"""
-    year = request.args.get('year', type=int)
-    if not year:
-        return jsonify({"error": "必须提供年份参数"}), 400
-        
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    try:
-        cursor.callproc('proc_generate_income_statement', (year,))
-        cursor.execute("SELECT * FROM income_statement_report ORDER BY line_index;")
-        report_data = cursor.fetchall()
-        return jsonify(report_data)
-    except Exception as e:
-        return jsonify({"error": f"获取报表失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    """获取利润表数据（可用 from_period/to_period 指定期间）"""
+    return call_service(services.income_statement(request.args), "获取报表失败")
 
 @app.route("/api/reports/cash_flow_statement", methods=['GET'])
 def get_cash_flow_statement_api():
-    """获取现金流量表数据"""
-    year = request.args.get('year', type=int)
-    if not year:
-        return jsonify({"error": "必须提供年份参数"}), 400
+    """获取现金流量表数据（可用 from_period/to_period 指定期间）"""
+    # 现金流量表要查两次（余额和分录），放在同一个只读快照里读取，保证两次看到的数据一致
+    return call_service(services.cash_flow_statement(request.args), "获取报表失败", transaction='snapshot')
+
+@app.route("/api/reports/statements", methods=['GET'])
+def get_statements_api():
+    """一次返回资产负债表、利润表、现金流量表和试算平衡表（参数同单张报表：year 或 from_period/to_period）"""
+    return call_service(services.statements(request.args), "获取报表失败", transaction='snapshot')
+
+@app.route("/api/reports/comparative", methods=['GET'])
+def get_comparative_report_api():
+    """多期间对比报表（参数见 services.comparative），每行为各期间的数值及相对前一列的增减额、增减百分比"""
+    return call_service(services.comparative(request.args), "获取对比报表失败")
 
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    try:
-        cursor.callproc('proc_generate_cash_flow_statement', (year,))
-        cursor.execute("SELECT * FROM cash_flow_statement_report ORDER BY line_index;")
-        report_data = cursor.fetchall()
-        results = []
-        for row in report_data:
-            results.append({
-                'item': row.get('item'),
-                'amount': row.get('amount') or row.get('current_period_amount')
-            })
-
-        return jsonify(results)
-    except Exception as e:
-        return jsonify({"error": f"获取报表失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
 @app.route("/api/reports/trial_balance", methods=['GET'])
 def get_trial_balance_api():
-    """获取试算平衡表数据"""
+    """获取试算平衡表数据（可用 from_period/to_period 指定期间）"""
+    return call_service(services.trial_balance(request.args), "获取试算平衡表失败", columnar=True)
+
+@app.route("/api/reports/general_ledger", methods=['GET'])
+def get_general_ledger_api():
+    """获取总分类账（分页）
+
+    参数：year；scope 为 account（单科目，默认）/ subtree（科目及下级汇总）/ all（全部科目）；
+    account_code；limit 每页分录数；after 上一页返回的 next_cursor
+    """
+    return call_service(services.general_ledger(request.args), "获取总分类账失败", columnar=True)
+
+# --- API 路由：数据导出 ---
+
+@app.route("/api/export/<string:report>", methods=['GET'])
+def export_api(report):
+    """流式导出报表或凭证：report 为 account_summary / trial_balance / general_ledger / vouchers，
+    format 为 csv（默认）/ ndjson / xlsx"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in WRITERS:
+        return jsonify({"error": f"不支持的导出格式: {fmt}"}), 400
+    if fmt == 'xlsx' and not xlsx_available():
+        return jsonify({"error": "服务器未安装 openpyxl，无法导出 XLSX"}), 501
+
     year = request.args.get('year', type=int)
-    if not year:
+    try:
+        period_range = parse_period_range(request.args)
+        date_from = request.args.get('date_from')
+        date_to = request.args.get('date_to')
+        date_from = date.fromisoformat(date_from) if date_from else None
+        date_to = date.fromisoformat(date_to) if date_to else None
+    except ValueError as e:
+        return jsonify({"error": f"查询参数错误: {e}"}), 400
+    if period_range:
+        year = period_range[0]
+    account_code = request.args.get('account_code')
+    scope = request.args.get('scope')  # 数据源在流式输出时才调用，那时请求上下文已经不在了
+
+    if report == 'account_summary':
+        source = lambda cursor: account_summary_source(cursor, year, period_range)
+    elif report == 'trial_balance':
+        source = lambda cursor: trial_balance_source(cursor, year, period_range)
+    elif report == 'general_ledger':
+        source = lambda cursor: general_ledger_source(cursor, year, account_code, scope)
+    elif report == 'vouchers':
+        source = lambda cursor: vouchers_source(cursor, date_from, date_to)
+    else:
+        return jsonify({"error": f"未知的导出类型: {report}"}), 404
+    if report != 'vouchers' and not year:
         return jsonify({"error": "必须提供年份参数"}), 400
 
-    conn = get_db_connection()
+    conn = get_read_connection()
     if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    try:
-        # 1. 调用存储过程执行计算
-        cursor.callproc('proc_generate_trial_balance', (year,))
-        
-        # 2. 查询计算结果
-        cursor.execute("SELECT * FROM trial_balance_report;")
-        report_data = cursor.fetchall()
-
-        # 3. 返回结果
-        return jsonify(report_data)
-    except Exception as e:
-        return jsonify({"error": f"获取试算平衡表失败: {e}"}), 500
-    finally:
-        # 确保在存储过程调用后提交，使其结果对后续查询可见
-        conn.commit()
-        cursor.close()
-        conn.close()
+
+    def generate():
+        # 连接在整个流式输出期间保持借出，输出结束（或客户端断开）后归还
+        with conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                columns, rows = source(cursor)
+                yield from WRITERS[fmt](columns, rows)
+            finally:
+                cursor.close()
+
+    filename = f"{report}_{year}.{fmt}" if year else f"{report}.{fmt}"
+    response = Response(generate(), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.call_on_close(conn.close)
+    return response
 
 # --- 记账凭证页面渲染路由 ---
 @app.route("/vouchers")
@@ -403,187 +376,142 @@ def new_voucher_page():
 
 @app.route("/api/accounts/leaf", methods=['GET'])
 def get_leaf_accounts_api():
-    """获取所有末级会计科目"""
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    try:
-        # 查询所有不存在子科目的科目，即末级科目
-        sql = """
-            SELECT account_code, account_name FROM chart_of_accounts
-            WHERE is_enabled = 1 AND account_code NOT IN 
-                (SELECT DISTINCT parent_code FROM chart_of_accounts WHERE parent_code IS NOT NULL)
-            ORDER BY account_code;
-        """
-        cursor.execute(sql)
-        leaf_accounts = cursor.fetchall()
-        return jsonify(leaf_accounts)
-    except Exception as e:
-        return jsonify({"error": f"查询末级科目失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    """获取所有启用的末级会计科目（由科目树缓存提供）"""
+    return account_tree_response(lambda tree: [
+        {'account_code': a['account_code'], 'account_name': a['account_name']}
+        for a in tree.enabled_leaves
+    ])
+
+@app.route("/api/accounts/search", methods=['GET'])
+def search_accounts_api():
+    """凭证录入的科目搜索：q 为科目代码、名称或拼音首字母，limit 为返回条数（见 account_search）"""
+    tree, error = load_account_tree()
+    if error: return error
+    limit = max(1, min(request.args.get('limit', ACCOUNT_SEARCH_LIMIT, type=int), ACCOUNT_SEARCH_LIMIT_MAX))
+    return jsonify(search_accounts(tree, request.args.get('q', ''), limit))
 
 @app.route("/api/vouchers", methods=['GET'])
 def get_vouchers_api():
-    """获取凭证列表"""
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    try:
-        # 关联查询凭证头和分录的借方总额
-        sql = """
-            SELECT 
-                v.id,
-                v.voucher_date,
-                CONCAT(v.voucher_type, '-', LPAD(v.voucher_number, 4, '0')) as voucher_ref,
-                v.summary,
-                (SELECT SUM(je.debit_amount) FROM journal_entries je WHERE je.voucher_id = v.id) as total_amount
-            FROM vouchers v
-            ORDER BY v.voucher_date DESC, v.voucher_number DESC;
-        """
-        cursor.execute(sql)
-        vouchers = cursor.fetchall()
-        return jsonify(vouchers)
-    except Exception as e:
-        return jsonify({"error": f"查询凭证列表失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    """分页获取凭证列表（参数见 services.list_vouchers）"""
+    return call_service(services.list_vouchers(request.args), "查询凭证列表失败", columnar=True)
 
 @app.route("/api/vouchers", methods=['POST'])
 def create_voucher_api():
     """创建一张新凭证 (核心：使用事务处理)"""
-    data = request.get_json()
-    if not data: return jsonify({"error": "请求体为空"}), 400
-    
-    header = data.get('header')
-    entries = data.get('entries')
-
-    if not header or not entries:
-        return jsonify({"error": "凭证头或分录数据缺失"}), 400
+    tree, error = load_account_tree()
+    if error: return error
+    return call_service(services.create_voucher(request.get_json(silent=True), tree), "凭证创建失败",
+                        status=201, transaction='write')
+
+@app.route("/api/vouchers:batch", methods=['POST'])
+def create_vouchers_batch_api():
+    """一次提交多张凭证：全部校验通过后在一个事务中写入，任何一张不合法则全部不写入"""
+    tree, error = load_account_tree()
+    if error: return error
+    return call_service(services.create_voucher_batch(request.get_json(silent=True), tree), "批量创建凭证失败",
+                        status=201, transaction='write')
+
+@app.route("/api/vouchers/import", methods=['POST'])
+def import_vouchers_api():
+    """批量导入凭证（请求体为 NDJSON 或 CSV，流式解析、分批写入）"""
+    fmt = request.args.get('format')
+    if not fmt:
+        fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({"error": f"不支持的导入格式: {fmt}"}), 400
+    batch_size = request.args.get('batch_size', IMPORT_BATCH_SIZE, type=int)
 
     conn = get_db_connection()
     if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor()
-    try:
-        # 开启事务
-        conn.start_transaction()
-
-        # 1. 插入凭证主表
-        sql_header = "INSERT INTO vouchers (voucher_date, voucher_type, voucher_number, summary) VALUES (%s, %s, %s, %s)"
-        cursor.execute(sql_header, (header['date'], header['type'], header['number'], header['summary']))
-        voucher_id = cursor.lastrowid # 获取刚插入的凭证ID
-
-        # 2. 批量插入凭证分录表
-        sql_entries = "INSERT INTO journal_entries (voucher_id, account_code, summary, debit_amount, credit_amount) VALUES (%s, %s, %s, %s, %s)"
-        entry_data = [(voucher_id, e['account_code'], e['summary'], e['debit'], e['credit']) for e in entries]
-        cursor.executemany(sql_entries, entry_data)
-
-        # 提交事务
-        conn.commit()
-        return jsonify({"message": "凭证创建成功", "voucher_id": voucher_id}), 201
-    except Exception as e:
-        # 关键：出错时回滚
-        conn.rollback() 
-        return jsonify({"error": f"凭证创建失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+
+    # 中途出错时之前的批次已经提交，响应中带上已导入的数量和错误明细，调用方据此从断点继续
+    result = ImportResult()
+    with conn:
+        try:
+            lines = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+            import_vouchers(conn, parse_stream(lines, fmt), batch_size=max(1, batch_size), result=result)
+            return jsonify(result.to_dict())
+        except (ValueError, csv.Error) as e:
+            # 请求体的问题：CSV 缺少列、格式错误，或不是 UTF-8 编码（UnicodeDecodeError 是 ValueError 的子类）
+            return jsonify({"error": f"凭证导入失败: {e}", **result.to_dict()}), 400
+        except Exception as e:
+            return jsonify({"error": f"凭证导入失败: {e}", **result.to_dict()}), 500
 
 @app.route("/api/vouchers/<int:voucher_id>", methods=['DELETE'])
 def delete_voucher_api(voucher_id):
     """删除一张凭证"""
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor()
-    try:
-        # 由于我们在数据库中设置了外键的 ON DELETE CASCADE 约束
-        # 所以只需要删除主表记录，从表的分录就会被自动删除
-        cursor.execute("DELETE FROM vouchers WHERE id = %s", (voucher_id,))
-        conn.commit()
-        if cursor.rowcount > 0:
-            return jsonify({"message": "凭证删除成功"})
-        else:
-            return jsonify({"error": "未找到该凭证"}), 404
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": f"删除失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    return call_service(services.delete_voucher(voucher_id), "删除失败", transaction='write')
+
 # 将根据凭证ID，返回凭证的头部信息和所有的分录信息。
 @app.route("/api/vouchers/<int:voucher_id>", methods=['GET'])
 def get_voucher_details_api(voucher_id):
     """获取单张凭证的详细信息（凭证头+所有分录）"""
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    try:
-        # 查询凭证头
-        cursor.execute("SELECT * FROM vouchers WHERE id = %s", (voucher_id,))
-        header = cursor.fetchone()
-        if not header:
-            return jsonify({"error": "未找到该凭证"}), 404
-
-        # 查询所有分录
-        sql_entries = """
-            SELECT je.*, coa.account_name 
-            FROM journal_entries je
-            JOIN chart_of_accounts coa ON je.account_code = coa.account_code
-            WHERE je.voucher_id = %s 
-            ORDER BY je.id;
-        """
-        cursor.execute(sql_entries, (voucher_id,))
-        entries = cursor.fetchall()
-
-        return jsonify({
-            "header": header,
-            "entries": entries
-        })
-    except Exception as e:
-        return jsonify({"error": f"查询凭证详情失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    return call_service(services.voucher_detail(voucher_id), "查询凭证详情失败")
 
 #根据指定的日期和凭证字，自动计算出下一个可用的凭证号。
 @app.route("/api/vouchers/next_number", methods=['GET'])
 def get_next_voucher_number_api():
-    """根据日期和凭证字，获取下一个可用的凭证号"""
-    voucher_date_str = request.args.get('date')
-    voucher_type = request.args.get('type')
-
-    if not voucher_date_str or not voucher_type:
-        return jsonify({"error": "必须提供日期和凭证字参数"}), 400
+    """根据日期和凭证字预览下一个凭证号（实际号码在保存凭证时分配）"""
+    return call_service(services.next_voucher_number(request.args), "计算凭证号失败")
 
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
+# --- API 路由：分析快照 ---
 
-    cursor = conn.cursor()
+@app.route("/api/analytics/pivot", methods=['GET'])
+def analytics_pivot_api():
+    """在分录的列式快照上做透视汇总（参数见 analytics.pivot），不访问数据库"""
+    tree, error = load_account_tree()
+    if error: return error
     try:
-        # 查询指定月份和凭证字下的最大凭证号
-        sql = """
-            SELECT MAX(voucher_number) FROM vouchers
-            WHERE voucher_type = %s AND DATE_FORMAT(voucher_date, '%Y-%m') = DATE_FORMAT(%s, '%Y-%m');
-        """
-        cursor.execute(sql, (voucher_type, voucher_date_str))
-        max_number = cursor.fetchone()[0]
-
-        next_number = (max_number or 0) + 1
-        return jsonify({"next_number": next_number})
+        return jsonify(run_pivot(tree, request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except SnapshotUnavailable as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
-        return jsonify({"error": f"计算凭证号失败: {e}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+        return jsonify({"error": f"透视查询失败: {e}"}), 500
+
+@app.route("/api/analytics/refresh", methods=['POST'])
+def analytics_refresh_api():
+    """增量刷新分析快照（?full=1 时全量重新生成），优先从只读副本读取"""
+    conn = get_read_connection()
+    if conn is None: return jsonify({"error": "数据库连接失败"}), 500
+    with conn:
+        try:
+            return jsonify(refresh_snapshot(conn, full=request.args.get('full') in ('1', 'true')))
+        except SnapshotUnavailable as e:
+            return jsonify({"error": str(e)}), 503
+        except Exception as e:
+            return jsonify({"error": f"刷新分析快照失败: {e}"}), 500
+
+# --- API 路由：系统监控 ---
+
+@app.route("/api/system/db_pool", methods=['GET'])
+def get_db_pool_stats_api():
+    """获取数据库连接池的计数器（借出数、等待次数、等待时间等）"""
+    return jsonify(get_pool_stats())
+
+@app.route("/metrics", methods=['GET'])
+def metrics_api():
+    """Prometheus 格式的耗时直方图（按路由、按SQL指纹）以及连接池、报表缓存的计数
+
+    多 worker 部署时每个进程分别统计，抓取到的是处理本次请求的那个 worker 的数据。
+    """
+    pool = get_pool_stats()
+    cache = report_cache.stats()
+    gauges = {
+        'db_pool_in_use': ("借出中的连接数", pool['in_use']),
+        'db_pool_idle': ("空闲连接数", pool['idle']),
+        'db_pool_waits_total': ("借用连接时发生等待的次数", pool['waits'], 'counter'),
+        'db_pool_timeouts_total': ("借用连接超时的次数", pool['timeouts'], 'counter'),
+        'report_cache_hits_total': ("报表缓存命中次数", cache['hits'] + cache['disk_hits'], 'counter'),
+        'report_cache_misses_total': ("报表缓存未命中次数", cache['misses'], 'counter'),
+    }
+    if 'read_routing' in pool:
+        gauges.update(routing_gauges(pool['read_routing']))
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
 
 
 if __name__ == '__main__':
+    # 开发服务器（单进程、带调试器）；生产环境用 python server.py 以多进程方式启动
     app.run(host='0.0.0.0', port=5000, debug=True)
 
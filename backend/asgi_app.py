@@ -0,0 +1,369 @@
+# backend/asgi_app.py
+"""ASGI 服务方式（Quart + aiomysql）
+
+提供与 app.py 相同的页面和接口（科目、期初余额、报表、凭证），处理函数是协程，数据库访问走 db_async 的异步连接池：
+一个请求在等待慢报表查询时只挂起自己的协程，同一进程可以同时处理数百个并发请求。
+业务逻辑和SQL都在 services 中，与 Flask 应用共用，这里只负责借连接、开事务和生成响应。
+
+数据导出（/api/export）、凭证导入（/api/vouchers/import）、科目余额重建（/api/reports/rebuild_balances）
+和分析快照刷新（/api/analytics/refresh）是长时间的读写，仍只由 Flask 应用提供。
+
+需要安装 quart、aiomysql 和一个 ASGI 服务器，例如：
+    pip install quart aiomysql uvicorn
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+
+from quart import Quart, Response, g, has_request_context, jsonify, make_response, render_template, request
+from quart.json.provider import DefaultJSONProvider
+
+import fast_json
+import metrics
+import services
+from account_search import search_accounts
+from analytics import SnapshotUnavailable, run_pivot
+from account_tree import account_cache, invalidate_account_tree
+from config import ACCOUNT_SEARCH_LIMIT, ACCOUNT_SEARCH_LIMIT_MAX, DB_READ_CONFIG, DB_REPLICAS
+from db_async import (close_pool, get_async_connection, get_async_cursor, get_async_pool_stats,
+                      get_async_read_connection, init_pool)
+from db_replicas import pin_cookie_value, pinned_to_primary, routing_gauges
+from db_steps import run_async, start
+from fast_json import FastJSONMixin
+from report_cache import report_cache
+from services import ServiceError
+
+class FastJSONProvider(FastJSONMixin, DefaultJSONProvider):
+    """orjson 编码的 JSON 提供者（见 fast_json），金额格式取自请求参数 decimals"""
+
+    def decimal_mode(self):
+        return request.args.get('decimals') if has_request_context() else None
+
+
+app = Quart(__name__)
+app.json = FastJSONProvider(app)
+
+
+@app.before_serving
+async def open_db_pool():
+    await init_pool()
+
+
+@app.after_serving
+async def close_db_pool():
+    await close_pool()
+
+
+@app.before_request
+async def start_request_timing():
+    if metrics.enabled():
+        g.timing_token = metrics.start_request()
+
+
+@app.after_request
+async def finish_request_timing(response):
+    token = g.pop('timing_token', None)
+    if token is not None:
+        route = request.url_rule.rule if request.url_rule else None
+        timing = metrics.finish_request(token, route, request.method, response.status_code)
+        response.headers['Server-Timing'] = metrics.server_timing_header(timing)
+    return response
+
+
+@app.before_request
+async def check_response_format():
+    """校验 decimals / shape 参数（见 fast_json）"""
+    error = fast_json.check_format_args(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+
+@app.after_request
+async def route_reads(response):
+    """与 app.route_reads 相同：写请求成功后设置读自己的写 Cookie，X-DB-Route 给出本次读取的实例"""
+    if DB_REPLICAS:
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(DB_READ_CONFIG['read_your_writes_cookie'], pin_cookie_value(),
+                                max_age=DB_READ_CONFIG['read_your_writes_seconds'], httponly=True, samesite='Lax')
+        route = g.pop('db_route', None)
+        if route:
+            response.headers['X-DB-Route'] = route
+    return response
+
+
+# --- 页面渲染路由 ---
+
+@app.route("/")
+async def index():
+    return await render_template('layout.html')
+
+@app.route("/accounts")
+async def show_accounts_page():
+    return await render_template('accounts.html')
+
+@app.route("/reports")
+async def show_reports_page():
+    return await render_template('reports.html')
+
+@app.route("/vouchers")
+async def show_vouchers_page():
+    return await render_template('vouchers.html')
+
+@app.route("/vouchers/new")
+async def new_voucher_page():
+    return await render_template('voucher_create.html')
+
+# --- 接口的执行方式 ---
+
+async def run_steps(steps, transaction=None, read_only=False):
+    """借出一个异步连接执行步骤生成器，返回其结果；transaction 的含义同 call_service，
+    read_only 为 True 时优先从只读副本读取（见 db_replicas）"""
+    if read_only:
+        pinned = pinned_to_primary(request.cookies.get(DB_READ_CONFIG['read_your_writes_cookie']))
+        async with get_async_read_connection(pinned) as (conn, route):
+            g.db_route = route
+            return await execute_steps(conn, steps, transaction)
+    async with get_async_connection() as conn:
+        return await execute_steps(conn, steps, transaction)
+
+
+async def execute_steps(conn, steps, transaction):
+    async with get_async_cursor(conn) as cursor:
+        if transaction == 'write':
+            await conn.begin()
+        elif transaction == 'snapshot':
+            await cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+        try:
+            result = await run_async(cursor, steps)
+            if transaction == 'write':
+                await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+    return result
+
+
+async def call_service(steps, error_prefix, status=200, transaction=None, after_commit=None, columnar=False):
+    """与 app.call_service 相同：执行 services 中的步骤生成器，并把结果或错误转换为 JSON 响应"""
+    try:
+        done, steps = start(steps)
+        read_only = request.method == 'GET' and transaction != 'write'
+        result = steps if done else await run_steps(steps, transaction, read_only)
+    except ServiceError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({"error": f"{error_prefix}: {e}"}), 500
+    if after_commit and transaction == 'write':
+        after_commit()
+    if columnar and request.args.get('shape') == 'columns':
+        result = fast_json.to_columns(result)
+    return jsonify(result), status
+
+
+async def load_account_tree():
+    """获取科目树；加载失败时返回 (None, 错误响应)"""
+    try:
+        return await account_cache.get_tree_async(run_steps), None
+    except Exception as e:
+        return None, (jsonify({"error": f"加载会计科目失败: {e}"}), 500)
+
+
+async def account_tree_response(build):
+    """用科目树缓存生成 JSON 响应；客户端带着相同的 ETag 再次请求时返回 304"""
+    tree, error = await load_account_tree()
+    if error:
+        return error
+    if request.if_none_match.contains(tree.etag):
+        response = await make_response('', 304)
+    else:
+        response = build(tree)
+        if isinstance(response, tuple):
+            return response
+        response = jsonify(response)
+    response.set_etag(tree.etag)
+    return response
+
+# --- API 路由：科目管理 (CRUD) ---
+
+@app.route("/api/accounts", methods=['GET'])
+async def get_accounts_api():
+    return await account_tree_response(lambda tree: tree.ordered)
+
+@app.route("/api/accounts/leaf", methods=['GET'])
+async def get_leaf_accounts_api():
+    return await account_tree_response(lambda tree: [
+        {'account_code': a['account_code'], 'account_name': a['account_name']}
+        for a in tree.enabled_leaves
+    ])
+
+@app.route("/api/accounts/search", methods=['GET'])
+async def search_accounts_api():
+    tree, error = await load_account_tree()
+    if error:
+        return error
+    limit = max(1, min(request.args.get('limit', ACCOUNT_SEARCH_LIMIT, type=int), ACCOUNT_SEARCH_LIMIT_MAX))
+    return jsonify(search_accounts(tree, request.args.get('q', ''), limit))
+
+@app.route("/api/accounts/<string:account_code>", methods=['GET'])
+async def get_single_account_api(account_code):
+    def build(tree):
+        account = tree.get(account_code)
+        if account is None:
+            return jsonify({"error": "未找到该科目"}), 404
+        return account
+    return await account_tree_response(build)
+
+@app.route("/api/accounts", methods=['POST'])
+async def create_account_api():
+    data = await request.get_json(silent=True)
+    return await call_service(services.create_account(data), "创建失败",
+                              status=201, transaction='write', after_commit=invalidate_account_tree)
+
+@app.route("/api/accounts/<string:account_code>", methods=['PUT'])
+async def update_account_api(account_code):
+    data = await request.get_json(silent=True)
+    return await call_service(services.update_account(account_code, data), "更新失败",
+                              transaction='write', after_commit=invalidate_account_tree)
+
+@app.route("/api/accounts/<string:account_code>", methods=['DELETE'])
+async def delete_account_api(account_code):
+    return await call_service(services.delete_account(account_code), "删除失败",
+                              transaction='write', after_commit=invalidate_account_tree)
+
+# --- API 路由：期初余额管理 ---
+
+@app.route("/api/account_balances", methods=['GET'])
+async def get_account_balances_api():
+    return await call_service(services.get_account_balances(request.args), "查询期初余额失败")
+
+@app.route("/api/account_balances", methods=['POST'])
+async def save_account_balances_api():
+    data = await request.get_json(silent=True)
+    return await call_service(services.save_account_balances(data), "保存期初余额失败", transaction='write')
+
+# --- API 路由：报表 ---
+
+@app.route("/api/reports/cache_stats", methods=['GET'])
+async def get_report_cache_stats_api():
+    return jsonify(report_cache.stats())
+
+@app.route("/api/reports/generate_summary", methods=['POST'])
+async def generate_summary_api():
+    data = await request.get_json(silent=True)
+    return await call_service(services.generate_summary(data), "汇总计算失败", transaction='write')
+
+@app.route("/api/reports/verify_summary", methods=['GET'])
+async def verify_summary_api():
+    return await call_service(services.verify_summary(request.args), "核对科目余额失败")
+
+@app.route("/api/reports/dirty_years", methods=['GET'])
+async def get_dirty_years_api():
+    return await call_service(services.dirty_years(request.args), "查询脏年度失败")
+
+@app.route("/api/reports/account_summary", methods=['GET'])
+async def get_account_summary_api():
+    return await call_service(services.account_summary(request.args), "获取科目汇总表失败", columnar=True)
+
+@app.route("/api/reports/balance_sheet", methods=['GET'])
+async def get_balance_sheet_api():
+    return await call_service(services.balance_sheet(request.args), "获取报表失败")
+
+@app.route("/api/reports/income_statement", methods=['GET'])
+async def get_income_statement_api():
+    return await call_service(services.income_statement(request.args), "获取报表失败")
+
+@app.route("/api/reports/cash_flow_statement", methods=['GET'])
+async def get_cash_flow_statement_api():
+    return await call_service(services.cash_flow_statement(request.args), "获取报表失败", transaction='snapshot')
+
+@app.route("/api/reports/statements", methods=['GET'])
+async def get_statements_api():
+    return await call_service(services.statements(request.args), "获取报表失败", transaction='snapshot')
+
+@app.route("/api/reports/comparative", methods=['GET'])
+async def get_comparative_report_api():
+    return await call_service(services.comparative(request.args), "获取对比报表失败")
+
+@app.route("/api/reports/trial_balance", methods=['GET'])
+async def get_trial_balance_api():
+    return await call_service(services.trial_balance(request.args), "获取试算平衡表失败", columnar=True)
+
+@app.route("/api/reports/general_ledger", methods=['GET'])
+async def get_general_ledger_api():
+    return await call_service(services.general_ledger(request.args), "获取总分类账失败", columnar=True)
+
+# --- API 路由：凭证 ---
+
+@app.route("/api/vouchers", methods=['GET'])
+async def get_vouchers_api():
+    return await call_service(services.list_vouchers(request.args), "查询凭证列表失败", columnar=True)
+
+@app.route("/api/vouchers", methods=['POST'])
+async def create_voucher_api():
+    data = await request.get_json(silent=True)
+    tree, error = await load_account_tree()
+    if error:
+        return error
+    return await call_service(services.create_voucher(data, tree), "凭证创建失败", status=201, transaction='write')
+
+@app.route("/api/vouchers:batch", methods=['POST'])
+async def create_vouchers_batch_api():
+    data = await request.get_json(silent=True)
+    tree, error = await load_account_tree()
+    if error:
+        return error
+    return await call_service(services.create_voucher_batch(data, tree), "批量创建凭证失败",
+                              status=201, transaction='write')
+
+@app.route("/api/vouchers/<int:voucher_id>", methods=['DELETE'])
+async def delete_voucher_api(voucher_id):
+    return await call_service(services.delete_voucher(voucher_id), "删除失败", transaction='write')
+
+@app.route("/api/vouchers/<int:voucher_id>", methods=['GET'])
+async def get_voucher_details_api(voucher_id):
+    return await call_service(services.voucher_detail(voucher_id), "查询凭证详情失败")
+
+@app.route("/api/vouchers/next_number", methods=['GET'])
+async def get_next_voucher_number_api():
+    return await call_service(services.next_voucher_number(request.args), "计算凭证号失败")
+
+# --- API 路由：分析快照 ---
+
+@app.route("/api/analytics/pivot", methods=['GET'])
+async def analytics_pivot_api():
+    tree, error = await load_account_tree()
+    if error:
+        return error
+    try:
+        # 透视在快照上计算，不访问数据库；放到线程中执行，不阻塞事件循环
+        return jsonify(await asyncio.to_thread(run_pivot, tree, request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except SnapshotUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": f"透视查询失败: {e}"}), 500
+
+# --- API 路由：系统监控 ---
+
+@app.route("/api/system/db_pool", methods=['GET'])
+async def get_db_pool_stats_api():
+    return jsonify(get_async_pool_stats())
+
+@app.route("/metrics", methods=['GET'])
+async def metrics_api():
+    """与 app.py 的 /metrics 相同；aiomysql 连接池没有等待/超时计数"""
+    pool = get_async_pool_stats()
+    cache = report_cache.stats()
+    gauges = {
+        'db_pool_in_use': ("借出中的连接数", pool.get('in_use', 0)),
+        'db_pool_idle': ("空闲连接数", pool.get('free', 0)),
+        'report_cache_hits_total': ("报表缓存命中次数", cache['hits'] + cache['disk_hits'], 'counter'),
+        'report_cache_misses_total': ("报表缓存未命中次数", cache['misses'], 'counter'),
+    }
+    if 'read_routing' in pool:
+        gauges.update(routing_gauges(pool['read_routing']))
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,268 @@
+# backend/balance_posting.py
+"""科目余额的增量过账
+
+凭证新增或删除时，把分录的借贷发生额直接累加到末级科目及其所有上级科目的 account_balances 行
+（以及按月的 account_period_balances 行）上，与凭证写入处于同一个事务中。这样科目汇总表始终是最新的，
+每张凭证的代价是 O(分录数 × 科目层级)，而不是重新汇总全年的分录。
+
+proc_generate_account_summary 仍然保留，作为全量重建手段；verify_account_summary 用于核对增量结果
+与全量汇总是否一致。命令行用法：
+
+    python balance_posting.py verify 2025
+    python balance_posting.py rebuild 2025    # 经 balance_rebuild 重建并向以后年度结转
+
+访问数据库的函数都是 db_steps 的步骤生成器，由调用方用 run_sync / run_async 执行。
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from db_steps import Query
+from period_close import ledger_tables
+
+ZERO = Decimal('0.00')
+
+
+def to_decimal(value):
+    """把前端传来的金额（字符串/数字/None）转换为 Decimal"""
+    if value is None or value == '':
+        return ZERO
+    return Decimal(str(value))
+
+
+def load_account_chain(account_codes):
+    """一次查询取出给定科目及其所有上级科目的 (上级代码, 余额方向)
+
+    科目代码的上级一定是它的前缀（见 trg_before_insert_chart_of_accounts），
+    所以把每个代码的所有前缀作为候选一次查出，再按 parent_code 串起来即可。
+    """
+    candidates = set()
+    for code in account_codes:
+        for length in range(1, len(code) + 1):
+            candidates.add(code[:length])
+    if not candidates:
+        return {}
+    placeholders = ", ".join(["%s"] * len(candidates))
+    rows = yield Query(
+        f"SELECT account_code, parent_code, balance_direction FROM chart_of_accounts WHERE account_code IN ({placeholders})",
+        tuple(sorted(candidates)), fetch='all'
+    )
+    return {row['account_code']: (row['parent_code'], row['balance_direction']) for row in rows}
+
+
+def post_voucher_deltas(voucher_date, entries, sign=1):
+    """把一张凭证的分录按 sign（1 为记账，-1 为冲销）累加到科目余额表和科目月度发生额表
+
+    entries 中每项需要 account_code、debit、credit 三个键。
+    调用方负责事务的开始与提交。
+    """
+    yield from post_deltas({(voucher_date.year, voucher_date.month): entries}, sign)
+
+
+def post_deltas(entries_by_period, sign=1):
+    """按会计期间批量过账，entries_by_period: {(fiscal_year, fiscal_month): [entry, ...]}"""
+    leaf_totals = defaultdict(lambda: [ZERO, ZERO])
+    for period, entries in entries_by_period.items():
+        for e in entries:
+            totals = leaf_totals[(period, e['account_code'])]
+            totals[0] += to_decimal(e.get('debit')) * sign
+            totals[1] += to_decimal(e.get('credit')) * sign
+    if not leaf_totals:
+        return
+
+    chain = yield from load_account_chain({code for _, code in leaf_totals})
+
+    # 把末级科目的发生额逐级累加到所有上级科目
+    period_deltas = defaultdict(lambda: [ZERO, ZERO])
+    for (period, code), (debit, credit) in leaf_totals.items():
+        if code not in chain:
+            raise ValueError(f"科目 {code} 不存在")
+        current = code
+        while current is not None:
+            d = period_deltas[(period, current)]
+            d[0] += debit
+            d[1] += credit
+            current = chain[current][0]
+
+    year_deltas = defaultdict(lambda: [ZERO, ZERO])
+    for ((year, _), code), (debit, credit) in period_deltas.items():
+        d = year_deltas[(year, code)]
+        d[0] += debit
+        d[1] += credit
+
+    years = sorted({year for year, _ in year_deltas})
+    for year in years:
+        codes = sorted(code for y, code in year_deltas if y == year)
+        yield from ensure_balance_rows(year, codes)
+
+    # 按 (年度, 科目代码) 的固定顺序更新，避免并发过账时出现死锁
+    sql = """
+        UPDATE account_balances
+        SET period_debit = period_debit + %s,
+            period_credit = period_credit + %s,
+            closing_balance = closing_balance + %s
+        WHERE account_code = %s AND fiscal_year = %s
+    """
+    rows = []
+    for (year, code) in sorted(year_deltas):
+        debit, credit = year_deltas[(year, code)]
+        if chain[code][1] == 'debit':
+            closing_delta = debit - credit
+        else:
+            closing_delta = credit - debit
+        rows.append((debit, credit, closing_delta, code, year))
+    yield Query(sql, rows, many=True)
+
+    # 月度发生额：一条多行 INSERT ... ON DUPLICATE KEY UPDATE 完成累加
+    keys = sorted(period_deltas, key=lambda k: (k[0][0], k[1], k[0][1]))
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s)"] * len(keys))
+    params = []
+    for (year, month), code in keys:
+        debit, credit = period_deltas[((year, month), code)]
+        params.extend([code, year, month, debit, credit])
+    yield Query(f"""
+        INSERT INTO account_period_balances (account_code, fiscal_year, fiscal_month, period_debit, period_credit)
+        VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE
+            period_debit = period_debit + VALUES(period_debit),
+            period_credit = period_credit + VALUES(period_credit)
+    """, tuple(params))
+
+
+def ensure_balance_rows(year, account_codes):
+    """确保科目在该年度有余额行；新行的期初余额从上年期末结转，与 proc_generate_account_summary 一致"""
+    placeholders = ", ".join(["%s"] * len(account_codes))
+    sql = f"""
+        INSERT INTO account_balances (account_code, fiscal_year, opening_balance, closing_balance)
+        SELECT
+            coa.account_code,
+            %s,
+            COALESCE(prev_year.closing_balance, 0),
+            COALESCE(prev_year.closing_balance, 0)
+        FROM chart_of_accounts coa
+        LEFT JOIN account_balances prev_year
+            ON coa.account_code = prev_year.account_code AND prev_year.fiscal_year = %s
+        WHERE coa.account_code IN ({placeholders})
+        ON DUPLICATE KEY UPDATE id = id
+    """
+    yield Query(sql, (year, year - 1, *account_codes))
+
+
+def load_voucher_entries(voucher_id, fiscal_year=None):
+    """读取（并锁定）一张凭证的日期和分录，用于删除前的冲销；凭证不存在时返回 (None, [])
+
+    vouchers 按会计年度分区，只按 id 加锁读会在每个分区上加锁。不知道年度时先用不加锁的读取查出年度，
+    再只锁定该年度分区中的这一行。
+    """
+    if fiscal_year is None:
+        row = yield Query("SELECT fiscal_year FROM vouchers WHERE id = %s", (voucher_id,), fetch='one')
+        if row is None:
+            return None, []
+        fiscal_year = row['fiscal_year']
+    row = yield Query("SELECT voucher_date FROM vouchers WHERE id = %s AND fiscal_year = %s FOR UPDATE",
+                      (voucher_id, fiscal_year), fetch='one')
+    if row is None:
+        return None, []
+    voucher_date = row['voucher_date']
+    rows = yield Query(
+        "SELECT account_code, debit_amount, credit_amount FROM journal_entries WHERE voucher_id = %s AND fiscal_year = %s",
+        (voucher_id, voucher_date.year), fetch='all'
+    )
+    entries = [
+        {'account_code': r['account_code'], 'debit': r['debit_amount'], 'credit': r['credit_amount']}
+        for r in rows
+    ]
+    return voucher_date, entries
+
+
+def verify_account_summary(year):
+    """按 proc_generate_account_summary 的口径重新汇总该年度，返回与 account_balances 不一致的科目列表
+
+    已归档的年度从归档表汇总。
+    """
+    vouchers_table, entries_table = yield from ledger_tables(year)
+    rows = yield Query("SELECT account_code, parent_code, balance_direction FROM chart_of_accounts", fetch='all')
+    accounts = {r['account_code']: (r['parent_code'], r['balance_direction']) for r in rows}
+    parents = {parent for parent, _ in accounts.values() if parent is not None}
+
+    rows = yield Query(f"""
+        SELECT je.account_code, SUM(je.debit_amount) AS debit, SUM(je.credit_amount) AS credit
+        FROM {entries_table} je
+        JOIN {vouchers_table} v ON v.id = je.voucher_id AND v.fiscal_year = je.fiscal_year
+        WHERE je.fiscal_year = %s AND v.voucher_date >= %s AND v.voucher_date < %s
+        GROUP BY je.account_code
+    """, (year, date(year, 1, 1), date(year + 1, 1, 1)), fetch='all')
+    expected = defaultdict(lambda: [ZERO, ZERO])
+    for r in rows:
+        code, debit, credit = r['account_code'], r['debit'], r['credit']
+        if code in parents or code not in accounts:
+            continue  # 与存储过程一致：只汇总末级科目的分录
+        current = code
+        while current is not None:
+            expected[current][0] += debit
+            expected[current][1] += credit
+            current = accounts[current][0]
+
+    rows = yield Query("""
+        SELECT account_code, opening_balance, period_debit, period_credit, closing_balance
+        FROM account_balances WHERE fiscal_year = %s
+    """, (year,), fetch='all')
+    actual = {
+        r['account_code']: (r['opening_balance'], r['period_debit'], r['period_credit'], r['closing_balance'])
+        for r in rows
+    }
+
+    drifts = []
+    for code in sorted(set(expected) | set(actual)):
+        opening, debit, credit, closing = actual.get(code, (ZERO, ZERO, ZERO, ZERO))
+        exp_debit, exp_credit = expected.get(code, (ZERO, ZERO))
+        direction = accounts.get(code, (None, 'debit'))[1]
+        if direction == 'debit':
+            exp_closing = opening + exp_debit - exp_credit
+        else:
+            exp_closing = opening - exp_debit + exp_credit
+        if (debit, credit, closing) != (exp_debit, exp_credit, exp_closing):
+            drifts.append({
+                'account_code': code,
+                'period_debit': debit, 'expected_period_debit': exp_debit,
+                'period_credit': credit, 'expected_period_credit': exp_credit,
+                'closing_balance': closing, 'expected_closing_balance': exp_closing,
+            })
+    return drifts
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from balance_rebuild import rebuild_dirty_years
+    from db_steps import run_sync
+    from db_utils import get_db_connection
+
+    parser = argparse.ArgumentParser(description="科目余额核对与全量重建")
+    parser.add_argument('command', choices=['verify', 'rebuild'])
+    parser.add_argument('year', type=int)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if conn is None:
+        raise SystemExit("数据库连接失败")
+    with conn:
+        if args.command == 'rebuild':
+            # 与 /api/reports/rebuild_balances 走同一条路径：已结账年度拒绝重建，
+            # 重建后更新账簿版本（报表缓存失效）和 balance_rebuilds，并按需结转到以后年度
+            try:
+                for event in rebuild_dirty_years(conn, from_year=args.year):
+                    if event['event'] == 'year':
+                        print(f"{event['year']}年度科目汇总数据已重建（{event['seconds']:.1f} 秒）")
+            except RuntimeError as e:
+                raise SystemExit(str(e))
+            raise SystemExit(0)
+        cursor = conn.cursor()
+        try:
+            drifts = run_sync(cursor, verify_account_summary(args.year))
+            for d in drifts:
+                print(d)
+            print(f"{args.year}年度共有 {len(drifts)} 个科目与全量汇总不一致")
+            raise SystemExit(1 if drifts else 0)
+        finally:
+            cursor.close()
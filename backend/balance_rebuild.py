@@ -0,0 +1,191 @@
+# backend/balance_rebuild.py
+"""只重建“脏”年度的科目余额，并按年结转到以后各年度
+
+某年度的期初余额取自上一年度的期末余额（proc_generate_account_summary），所以补录或删除一张往年的凭证后，
+该年度及以后每个年度都可能需要重建。哪些年度是脏的由账簿版本判断：凭证和期初余额的写入会把对应年度的
+ledger_versions 加一（见 report_cache.bump_ledger_version），重建完成时把当时的版本记入 balance_rebuilds，
+两者不同的年度就是上次重建之后又有过写入的年度。判断不需要在凭证写入时额外写任何东西。
+
+重建从最早的脏年度开始，逐年进行，每个年度一个事务：
+- 有上一年度余额的年度调用 proc_generate_account_summary 全量重建；
+- 最早的年度没有上一年度，期初余额是手工录入的，存储过程会把它清零，所以只重算发生额和期末余额；
+- 重建后比较本年期末余额与下一年度的期初余额：都相同且下一年度不是脏年度时停止结转，
+  跳到后面的下一个脏年度（如果有）；否则继续重建下一年度。
+
+重建期间新写入的凭证会再次把年度的版本加一，这些年度在下次运行时仍是脏的，不会被漏掉。
+同一时间只允许一个重建任务（MySQL 命名锁）。
+
+命令行用法：
+
+    python balance_rebuild.py              # 重建全部脏年度
+    python balance_rebuild.py --list       # 只列出脏年度
+    python balance_rebuild.py --from-year 2023   # 从2023年起强制重建（并照常向后结转）
+
+接口：POST /api/reports/rebuild_balances 以 NDJSON 流逐行返回进度，GET /api/reports/dirty_years 列出脏年度。
+"""
+import time
+
+from db_steps import Call, Query, run_sync
+from report_cache import GLOBAL_VERSION_YEAR, bump_ledger_version
+
+LOCK_NAME = 'financial_balance_rebuild'
+
+
+def fetch_dirty_years():
+    """账簿版本与上次重建时不同的年度，返回按年度排序的 [(year, version)]（步骤生成器）"""
+    rows = yield Query("""
+        SELECT lv.fiscal_year, lv.version
+        FROM ledger_versions lv
+        LEFT JOIN balance_rebuilds br ON br.fiscal_year = lv.fiscal_year
+        WHERE lv.fiscal_year <> %s AND lv.version <> COALESCE(br.ledger_version, 0)
+        ORDER BY lv.fiscal_year
+    """, (GLOBAL_VERSION_YEAR,), fetch='all')
+    return [(r['fiscal_year'], r['version']) for r in rows]
+
+
+def rebuild_year(year):
+    """重建一个年度的科目余额和月度发生额，并记录重建版本（步骤生成器，调用方负责事务）
+
+    返回 {'next_year_exists': 下一年度是否已有余额行, 'changed_openings': 下一年度期初余额与本年期末余额不同的科目数}。
+    已结账的年度不能重建（分录已归档，见 period_close），抛出 RuntimeError。
+    """
+    closed = yield Query("SELECT 1 FROM fiscal_year_closings WHERE fiscal_year = %s", (year,), fetch='one')
+    if closed:
+        raise RuntimeError(f"{year}年度已结账，不能重建科目余额")
+    row = yield Query("SELECT version FROM ledger_versions WHERE fiscal_year = %s", (year,), fetch='one')
+    version = row['version'] if row else 0
+
+    has_previous = yield Query("SELECT 1 FROM account_balances WHERE fiscal_year = %s LIMIT 1", (year - 1,), fetch='one')
+    if has_previous:
+        yield Call('proc_generate_account_summary', (year,))
+    else:
+        yield Call('proc_generate_period_balances', (year,))
+        # 保留已有的期初余额，为缺少余额行的科目补上期初为0的行
+        yield Query("""
+            INSERT INTO account_balances (account_code, fiscal_year, opening_balance)
+            SELECT account_code, %s, 0 FROM chart_of_accounts
+            ON DUPLICATE KEY UPDATE id = id
+        """, (year,))
+        yield Query("""
+            UPDATE account_balances ab
+            JOIN chart_of_accounts coa ON coa.account_code = ab.account_code
+            LEFT JOIN (
+                SELECT account_code, SUM(period_debit) AS debit, SUM(period_credit) AS credit
+                FROM account_period_balances
+                WHERE fiscal_year = %s
+                GROUP BY account_code
+            ) p ON p.account_code = ab.account_code
+            SET ab.period_debit = COALESCE(p.debit, 0),
+                ab.period_credit = COALESCE(p.credit, 0),
+                ab.closing_balance = IF(coa.balance_direction = 'debit',
+                                        ab.opening_balance + COALESCE(p.debit, 0) - COALESCE(p.credit, 0),
+                                        ab.opening_balance - COALESCE(p.debit, 0) + COALESCE(p.credit, 0))
+            WHERE ab.fiscal_year = %s
+        """, (year, year))
+
+    next_year_exists = yield Query("SELECT 1 FROM account_balances WHERE fiscal_year = %s LIMIT 1",
+                                   (year + 1,), fetch='one')
+    changed = 0
+    if next_year_exists:
+        row = yield Query("""
+            SELECT COUNT(*) AS changed
+            FROM account_balances cur
+            LEFT JOIN account_balances nxt
+                ON nxt.account_code = cur.account_code AND nxt.fiscal_year = %s
+            WHERE cur.fiscal_year = %s
+              AND (nxt.id IS NULL AND cur.closing_balance <> 0 OR nxt.opening_balance <> cur.closing_balance)
+        """, (year + 1, year), fetch='one')
+        changed = row['changed']
+
+    # 版本加一使报表缓存失效；记录的重建版本是开始时读到的版本加一，
+    # 若期间有其他事务写入该年度，实际版本会更大，该年度在下次运行时仍是脏的
+    yield from bump_ledger_version([year])
+    yield Query("""
+        INSERT INTO balance_rebuilds (fiscal_year, ledger_version) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE ledger_version = VALUES(ledger_version)
+    """, (year, version + 1))
+    return {'next_year_exists': bool(next_year_exists), 'changed_openings': changed}
+
+
+def rebuild_dirty_years(conn, from_year=None):
+    """从最早的脏年度（或 from_year）开始按依赖顺序重建，逐个产出进度事件（字典）
+
+    事件的 event 字段为 plan（待重建的脏年度）、year（一个年度重建完成）、done（全部完成）。
+    conn 为从连接池借出的连接，每个年度单独提交。
+    """
+    started = time.perf_counter()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 0) AS acquired", (LOCK_NAME,))
+        if not cursor.fetchone()['acquired']:
+            raise RuntimeError("已有科目余额重建任务正在运行")
+        try:
+            dirty = {year for year, _ in run_sync(cursor, fetch_dirty_years())}
+            conn.commit()
+            if from_year is not None:
+                dirty = {y for y in dirty if y > from_year} | {from_year}
+            yield {'event': 'plan', 'dirty_years': sorted(dirty)}
+
+            rebuilt = []
+            year = min(dirty, default=None)
+            while year is not None:
+                year_started = time.perf_counter()
+                conn.start_transaction()
+                try:
+                    info = run_sync(cursor, rebuild_year(year))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                rebuilt.append(year)
+                propagate = year + 1 in dirty or (info['next_year_exists'] and info['changed_openings'] > 0)
+                yield {
+                    'event': 'year', 'year': year,
+                    'reason': 'dirty' if year in dirty else 'carry_forward',
+                    'changed_openings_next_year': info['changed_openings'],
+                    'propagate': propagate,
+                    'seconds': round(time.perf_counter() - year_started, 3),
+                }
+                if propagate:
+                    year += 1
+                else:
+                    year = min((y for y in dirty if y > year), default=None)
+            yield {'event': 'done', 'rebuilt_years': rebuilt, 'seconds': round(time.perf_counter() - started, 3)}
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s) AS released", (LOCK_NAME,))
+            cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from db_utils import get_db_connection
+
+    parser = argparse.ArgumentParser(description="重建脏年度的科目余额并向以后年度结转")
+    parser.add_argument('--from-year', type=int, help="从该年度起强制重建")
+    parser.add_argument('--list', action='store_true', help="只列出脏年度")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if conn is None:
+        raise SystemExit("数据库连接失败")
+    with conn:
+        if args.list:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                dirty = run_sync(cursor, fetch_dirty_years())
+            finally:
+                cursor.close()
+            print("脏年度: " + (", ".join(str(year) for year, _ in dirty) or "无"))
+            raise SystemExit(0)
+        for event in rebuild_dirty_years(conn, args.from_year):
+            if event['event'] == 'plan':
+                print("待重建的脏年度: " + (", ".join(map(str, event['dirty_years'])) or "无"))
+            elif event['event'] == 'year':
+                note = "继续结转到下一年度" if event['propagate'] else "期末余额已与下一年度衔接，停止结转"
+                print(f"  {event['year']}年度已重建（{event['seconds']:.1f} 秒），"
+                      f"下一年度有 {event['changed_openings_next_year']} 个科目的期初余额需要更新，{note}")
+            else:
+                print(f"完成：共重建 {len(event['rebuilt_years'])} 个年度，用时 {event['seconds']:.1f} 秒")
@@ -0,0 +1,16 @@
+# backend/benchmarks/__init__.py
+"""性能基准测试
+
+- dataset: 在独立的测试库中建表，并生成符合会计规则的合成账套（四级科目、多年借贷平衡的凭证）；
+- run: 按 1万 / 10万 / 100万 条分录等不同规模，逐一测量 app.py 的每个接口和 3_procedures.sql 的每个存储过程，
+  统计 p50/p95/p99 延迟、吞吐量和内存，结果保存为 JSON，可用 compare 对比两次运行；
+- serialization: 不连数据库，比较科目汇总表、凭证列表的响应体在各种 JSON 编码方式下的耗时和体积。
+
+在 backend 目录下执行：
+
+    python -m benchmarks.run --sizes 10000,100000,1000000
+    python -m benchmarks.run compare benchmarks/results/旧.json benchmarks/results/新.json
+    python -m benchmarks.serialization --rows 1000,10000,100000
+
+测试库默认为 <DB_CONFIG['database']>_bench，每个规模都会删除并重建，不会动到业务库。
+"""
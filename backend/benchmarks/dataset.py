@@ -0,0 +1,231 @@
+# backend/benchmarks/dataset.py
+"""合成测试账套
+
+科目：以《小企业会计准则》的若干一级科目为根，按代码长度 4/6/8/10 位生成四级科目树，共 N 个科目；
+凭证：M 个会计年度，每张凭证 K 条分录，借方金额随机、贷方金额把借方合计随机拆分，保证每张凭证借贷平衡；
+约四成凭证涉及库存现金/银行存款，使现金流量表有数据。凭证号按 (凭证字, 月份) 连续编号，并同步凭证号序列。
+写入完成后调用存储过程生成各年度的月度发生额和科目余额。
+
+同样的参数和随机种子生成完全相同的数据，不同次运行的结果可以直接比较。
+"""
+import math
+import os
+import random
+from datetime import date, timedelta
+
+import mysql.connector
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'database', 'sql')
+SCHEMA_FILES = ['1_tables.sql', '2_constraints_and_triggers.sql', '3_procedures.sql',
+                '4_indexes.sql', '5_voucher_numbers.sql', '6_balance_rebuilds.sql', '7_fiscal_year_partitions.sql']
+
+# (一级科目代码, 名称, 余额方向)
+LEVEL_ONE_ACCOUNTS = [
+    ('1001', '库存现金', 'debit'), ('1002', '银行存款', 'debit'), ('1122', '应收账款', 'debit'),
+    ('1221', '其他应收款', 'debit'), ('1403', '原材料', 'debit'), ('1405', '库存商品', 'debit'),
+    ('1601', '固定资产', 'debit'), ('1602', '累计折旧', 'credit'), ('2001', '短期借款', 'credit'),
+    ('2202', '应付账款', 'credit'), ('2211', '应付职工薪酬', 'credit'), ('2221', '应交税费', 'credit'),
+    ('2241', '其他应付款', 'credit'), ('3001', '实收资本', 'credit'), ('3103', '本年利润', 'credit'),
+    ('5001', '主营业务收入', 'credit'), ('5051', '其他业务收入', 'credit'), ('5401', '主营业务成本', 'debit'),
+    ('5601', '销售费用', 'debit'), ('5602', '管理费用', 'debit'), ('5603', '财务费用', 'debit'),
+]
+CASH_PREFIXES = ('1001', '1002')
+VOUCHER_TYPES = ['记', '记', '记', '收', '付']
+INSERT_CHUNK = 5000
+
+
+# --- 建库 ---
+
+def split_sql(text):
+    """把SQL脚本拆成单条语句，支持 DELIMITER；跳过注释行和 USE 语句（连接已指定数据库）"""
+    delimiter = ';'
+    buf = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('--'):
+            continue
+        if stripped.upper().startswith('DELIMITER '):
+            delimiter = stripped.split()[1]
+            continue
+        buf.append(line)
+        if stripped.endswith(delimiter):
+            statement = '\n'.join(buf).rstrip()[:-len(delimiter)].strip()
+            buf = []
+            if statement and not statement.upper().startswith('USE '):
+                yield statement
+
+
+def create_database(db_config, database):
+    """删除并重建测试库，执行 database/sql 下的全部建表脚本"""
+    if database == db_config['database']:
+        raise ValueError(f"测试库不能与业务库同名: {database}")
+    server_config = {k: v for k, v in db_config.items() if k != 'database'}
+    conn = mysql.connector.connect(**server_config)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+    cursor.execute(f"CREATE DATABASE `{database}` DEFAULT CHARSET utf8mb4")
+    cursor.execute(f"USE `{database}`")
+    for name in SCHEMA_FILES:
+        with open(os.path.join(SQL_DIR, name), encoding='utf-8') as f:
+            for statement in split_sql(f.read()):
+                try:
+                    cursor.execute(statement)
+                    if cursor.with_rows:
+                        cursor.fetchall()
+                except mysql.connector.Error:
+                    # 新库上删除不存在的约束会报错，脚本本身说明了可以忽略
+                    if ' DROP ' not in f" {statement.upper()} ":
+                        raise
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+# --- 科目 ---
+
+def plan_fanout(n_accounts):
+    """计算二、三级的下级科目数 f 和四级的下级科目数 f4，使总数不少于 n_accounts 且一定有四级科目"""
+    roots = len(LEVEL_ONE_ACCOUNTS)
+    if n_accounts < roots * 4:
+        raise ValueError(f"科目数至少为 {roots * 4} 才能生成四级科目")
+    per_root = n_accounts / roots
+    f = max(1, int(per_root ** (1 / 3)))
+    while f > 1 and 1 + f + 2 * f * f > per_root:
+        f -= 1
+    f4 = min(99, max(1, math.ceil((per_root - 1 - f - f * f) / (f * f))))
+    return f, f4
+
+
+def generate_accounts(n_accounts):
+    """返回按代码排序的科目列表 [(code, name, parent_code, level, direction)]，上级科目总在下级之前"""
+    f, f4 = plan_fanout(n_accounts)
+    accounts = []
+    level3 = []
+    for code, name, direction in LEVEL_ONE_ACCOUNTS:
+        accounts.append((code, name, None, 1, direction))
+        for i in range(1, f + 1):
+            code2 = f"{code}{i:02d}"
+            accounts.append((code2, f"{name}-{i:02d}", code, 2, direction))
+            for j in range(1, f + 1):
+                code3 = f"{code2}{j:02d}"
+                accounts.append((code3, f"{name}-{i:02d}{j:02d}", code2, 3, direction))
+                level3.append((code3, f"{name}-{i:02d}{j:02d}", direction))
+    # 四级科目按“每个三级科目先各建一个，再各建第二个”的顺序截断，使末级科目在各分支间均匀分布
+    remaining = n_accounts - len(accounts)
+    for k in range(1, f4 + 1):
+        for code3, name3, direction in level3:
+            if remaining <= 0:
+                break
+            accounts.append((f"{code3}{k:02d}", f"{name3}{k:02d}", code3, 4, direction))
+            remaining -= 1
+    accounts.sort(key=lambda a: a[0])
+    return accounts
+
+
+def leaf_codes(accounts):
+    parents = {a[2] for a in accounts if a[2]}
+    return [a[0] for a in accounts if a[0] not in parents]
+
+
+# --- 凭证 ---
+
+def random_voucher_entries(rng, leaves, cash_leaves, k):
+    """生成一张借贷平衡的凭证的 k 条分录 [(account_code, debit_cents, credit_cents)]"""
+    n_debit = rng.randint(1, k - 1)
+    n_credit = k - n_debit
+    debits = [rng.randint(100, 1_000_000) for _ in range(n_debit)]
+    total = sum(debits)
+    cuts = sorted(rng.sample(range(1, total), n_credit - 1))
+    credits = [b - a for a, b in zip([0] + cuts, cuts + [total])]
+    codes = [rng.choice(leaves) for _ in range(k)]
+    if cash_leaves and rng.random() < 0.4:
+        codes[rng.randrange(k)] = rng.choice(cash_leaves)
+    return ([(codes[i], d, 0) for i, d in enumerate(debits)]
+            + [(codes[n_debit + i], 0, c) for i, c in enumerate(credits)])
+
+
+def iter_vouchers(rng, years, n_entries, k):
+    """按日期顺序产出 (voucher_date, voucher_type)，凭证总数为 ceil(n_entries / k)，平均分布在各年度"""
+    n_vouchers = math.ceil(n_entries / k)
+    for index, year in enumerate(years):
+        count = n_vouchers // len(years) + (1 if index < n_vouchers % len(years) else 0)
+        days = (date(year + 1, 1, 1) - date(year, 1, 1)).days
+        offsets = sorted(rng.randrange(days) for _ in range(count))
+        for offset in offsets:
+            yield date(year, 1, 1) + timedelta(days=offset), rng.choice(VOUCHER_TYPES)
+
+
+def cents(value):
+    return f"{value // 100}.{value % 100:02d}"
+
+
+def populate(db_config, database, n_accounts, years, n_entries, entries_per_voucher, seed=20250101):
+    """向测试库写入合成账套，返回数据集的描述"""
+    if entries_per_voucher < 2:
+        raise ValueError("每张凭证至少2条分录")
+    rng = random.Random(seed)
+    accounts = generate_accounts(n_accounts)
+    leaves = leaf_codes(accounts)
+    cash_leaves = [c for c in leaves if c.startswith(CASH_PREFIXES)]
+
+    conn = mysql.connector.connect(**dict(db_config, database=database))
+    cursor = conn.cursor()
+    cursor.execute("SET unique_checks = 0, foreign_key_checks = 0")
+    cursor.executemany(
+        "INSERT INTO chart_of_accounts (account_code, account_name, parent_code, level, balance_direction) "
+        "VALUES (%s, %s, %s, %s, %s)", accounts)
+    conn.commit()
+
+    numbers = {}
+    vouchers = []
+    entries = []
+    voucher_id = 0
+    entry_count = 0
+
+    def flush():
+        if vouchers:
+            cursor.executemany("INSERT INTO vouchers (id, voucher_date, voucher_type, voucher_number, summary) "
+                               "VALUES (%s, %s, %s, %s, %s)", vouchers)
+        if entries:
+            cursor.executemany("INSERT INTO journal_entries (voucher_id, fiscal_year, account_code, summary, "
+                               "debit_amount, credit_amount) VALUES (%s, %s, %s, %s, %s, %s)", entries)
+        conn.commit()
+        vouchers.clear()
+        entries.clear()
+
+    for voucher_date, voucher_type in iter_vouchers(rng, years, n_entries, entries_per_voucher):
+        voucher_id += 1
+        key = (voucher_type, voucher_date.year, voucher_date.month)
+        numbers[key] = numbers.get(key, 0) + 1
+        summary = f"合成凭证{voucher_id}"
+        vouchers.append((voucher_id, voucher_date, voucher_type, numbers[key], summary))
+        for code, debit, credit in random_voucher_entries(rng, leaves, cash_leaves, entries_per_voucher):
+            entries.append((voucher_id, voucher_date.year, code, summary, cents(debit), cents(credit)))
+        entry_count += entries_per_voucher
+        if len(entries) >= INSERT_CHUNK:
+            flush()
+    flush()
+
+    cursor.executemany(
+        "INSERT INTO voucher_sequences (voucher_type, fiscal_year, fiscal_month, last_number) VALUES (%s, %s, %s, %s)",
+        [(*key, last) for key, last in sorted(numbers.items())])
+    conn.commit()
+    for year in years:
+        cursor.callproc('proc_generate_period_balances', (year,))
+        cursor.callproc('proc_generate_account_summary', (year,))
+        conn.commit()
+    cursor.close()
+    conn.close()
+
+    return {
+        'accounts': len(accounts),
+        'leaf_accounts': len(leaves),
+        'years': list(years),
+        'vouchers': voucher_id,
+        'entries': entry_count,
+        'entries_per_voucher': entries_per_voucher,
+        'seed': seed,
+        'busiest_leaf': cash_leaves[0] if cash_leaves else leaves[0],
+        'sample_leaf': leaves[len(leaves) // 2],
+        'sample_parent': accounts[0][0],
+    }
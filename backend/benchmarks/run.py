@@ -0,0 +1,343 @@
+# backend/benchmarks/run.py
+"""按不同数据规模测量每个接口和存储过程
+
+对每个规模（分录条数）：重建测试库并生成合成账套，然后
+- 存储过程：直接连接测试库，对最后一个年度逐个 CALL 3_procedures.sql 中的过程；
+- 接口：把 config.DB_CONFIG 指向测试库，用 Flask 测试客户端逐个请求 app.py 的接口（不经过网络，
+  测的是应用与数据库的耗时）；报表接口分别测 ?fresh=1（重新计算）和命中缓存两种情况。
+每项重复 --repeat 次，记录 p50/p95/p99 延迟和吞吐量（单客户端串行，次/秒）；
+另外单独执行一次并用 tracemalloc 记录 Python 内存峰值，每个规模结束时记录进程的最大常驻内存。
+
+用法（在 backend 目录下执行）：
+
+    python -m benchmarks.run --sizes 10000,100000,1000000 --accounts 1000 --years 3
+    python -m benchmarks.run compare benchmarks/results/a.json benchmarks/results/b.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import config
+from account_search import pinyin_initials
+from benchmarks.dataset import LEVEL_ONE_ACCOUNTS, create_database, populate
+from load_test import percentile
+from statement_engine import np
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+REPORTS = ['account_summary', 'balance_sheet', 'income_statement', 'cash_flow_statement', 'trial_balance', 'statements']
+BATCH_SIZE = 100  # 批量创建与导入接口每次提交的凭证数
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    total = sum(values)
+    return {
+        'n': len(values),
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'mean_ms': total / len(values) * 1000 if values else 0.0,
+        'max_ms': values[-1] * 1000 if values else 0.0,
+        'throughput_per_s': len(values) / total if total else 0.0,
+    }
+
+
+def max_rss_kb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if sys.platform == 'darwin' else usage  # macOS 以字节为单位
+
+
+# --- 存储过程 ---
+
+def bench_procedures(database, dataset, repeat):
+    import mysql.connector
+
+    year = dataset['years'][-1]
+    calls = [
+        ('proc_generate_period_balances', (year,)),
+        ('proc_generate_account_summary', (year,)),
+        ('proc_generate_general_ledger', (dataset['busiest_leaf'], year)),
+        ('proc_generate_general_ledger', (dataset['sample_leaf'], year)),
+    ]
+    conn = mysql.connector.connect(**dict(config.DB_CONFIG, database=database))
+    cursor = conn.cursor()
+    results = []
+    for proc, args in calls:
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            cursor.callproc(proc, args)
+            for result in cursor.stored_results():
+                result.fetchall()
+            conn.commit()
+            latencies.append(time.perf_counter() - started)
+        results.append({'name': f"CALL {proc}{args}", **summarize(latencies)})
+        print(f"  {results[-1]['name']:<60} p50 {results[-1]['p50_ms']:>9.1f}ms  p95 {results[-1]['p95_ms']:>9.1f}ms")
+    cursor.close()
+    conn.close()
+    return results
+
+
+# --- 接口 ---
+
+def voucher_body(dataset, index, number=None):
+    """一张借贷平衡的测试凭证（请求体格式）"""
+    year = dataset['years'][-1]
+    return {
+        "header": {"date": f"{year}-06-{index % 28 + 1:02d}", "type": "记", "number": number,
+                   "summary": f"基准测试凭证{index}"},
+        "entries": [
+            {"account_code": dataset['busiest_leaf'], "summary": "收款", "debit": "100.00", "credit": "0"},
+            {"account_code": dataset['sample_leaf'], "summary": "收款", "debit": "0", "credit": "100.00"},
+        ],
+    }
+
+
+def endpoint_cases(client, dataset):
+    """[(名称, 方法, 构造请求的函数)]；构造函数参数为第几次请求，返回 (url, 请求参数)，其中的准备工作不计时
+
+    读接口在前、写接口在后，避免写入影响读接口的测量。
+    """
+    year = dataset['years'][-1]
+    leaf = dataset['busiest_leaf']
+    parent = dataset['sample_parent']
+    # 合成科目的名称以一级科目名称开头，如“银行存款-0101”，拼音首字母为 yhck0101
+    root_names = {code: name for code, name, _ in LEVEL_ONE_ACCOUNTS}
+    initials = pinyin_initials(root_names[leaf[:4]])
+
+    def fixed(url, **kwargs):
+        return lambda i: (url, kwargs)
+
+    def create_for_delete(i):
+        response = client.post('/api/vouchers', json=voucher_body(dataset, i))
+        voucher_id = response.get_json()['voucher_id'] if response.status_code == 201 else 0
+        return f"/api/vouchers/{voucher_id}", {}
+
+    def with_snapshot(url):
+        # 第一次请求前先全量生成分析快照（不计时）
+        def build(i):
+            if i == 0:
+                client.post('/api/analytics/refresh?full=1').get_data()
+            return url, {}
+        return build
+
+    def post_voucher(i):
+        return '/api/vouchers', {'json': voucher_body(dataset, i)}
+
+    def ndjson_body(i):
+        lines = [json.dumps(voucher_body(dataset, i * BATCH_SIZE + j), ensure_ascii=False) for j in range(BATCH_SIZE)]
+        return '/api/vouchers/import?format=ndjson', {'data': '\n'.join(lines).encode('utf-8'),
+                                                     'content_type': 'application/x-ndjson'}
+
+    cases = [
+        ('页面 /', 'GET', fixed('/')),
+        ('页面 /accounts', 'GET', fixed('/accounts')),
+        ('页面 /reports', 'GET', fixed('/reports')),
+        ('页面 /vouchers', 'GET', fixed('/vouchers')),
+        ('页面 /vouchers/new', 'GET', fixed('/vouchers/new')),
+        ('科目列表', 'GET', fixed('/api/accounts')),
+        ('末级科目', 'GET', fixed('/api/accounts/leaf')),
+        ('单个科目', 'GET', fixed(f'/api/accounts/{leaf}')),
+        ('科目搜索（代码前缀）', 'GET', fixed(f'/api/accounts/search?q={leaf[:6]}')),
+        ('科目搜索（拼音首字母）', 'GET', fixed(f'/api/accounts/search?q={initials}')),
+        ('期初余额', 'GET', fixed(f'/api/account_balances?year={year}')),
+        ('报表缓存统计', 'GET', fixed('/api/reports/cache_stats')),
+        ('连接池统计', 'GET', fixed('/api/system/db_pool')),
+        ('科目余额核对', 'GET', fixed(f'/api/reports/verify_summary?year={year}')),
+        ('脏年度列表', 'GET', fixed('/api/reports/dirty_years')),
+    ]
+    for report in REPORTS:
+        cases.append((f'{report}（重新计算）', 'GET', fixed(f'/api/reports/{report}?year={year}&fresh=1')))
+        cases.append((f'{report}（缓存）', 'GET', fixed(f'/api/reports/{report}?year={year}')))
+    cases += [
+        ('季度资产负债表（重新计算）', 'GET',
+         fixed(f'/api/reports/balance_sheet?from_period={year}-01&to_period={year}-03&fresh=1')),
+        ('多年度对比利润表', 'GET', fixed(f'/api/reports/comparative?report=income_statement&years='
+                                       f'{",".join(str(y) for y in dataset["years"])}')),
+        ('总分类账（单科目）', 'GET', fixed(f'/api/reports/general_ledger?year={year}&account_code={leaf}')),
+        ('总分类账（科目树）', 'GET',
+         fixed(f'/api/reports/general_ledger?year={year}&account_code={parent}&scope=subtree')),
+        ('总分类账（全部科目）', 'GET', fixed(f'/api/reports/general_ledger?year={year}&scope=all')),
+        ('导出科目汇总表 CSV', 'GET', fixed(f'/api/export/account_summary?year={year}')),
+        ('导出试算平衡表 CSV', 'GET', fixed(f'/api/export/trial_balance?year={year}')),
+        ('导出总分类账 CSV', 'GET', fixed(f'/api/export/general_ledger?year={year}&account_code={parent}')),
+        ('导出凭证 NDJSON（一个月）', 'GET',
+         fixed(f'/api/export/vouchers?format=ndjson&date_from={year}-03-01&date_to={year}-03-31')),
+        ('凭证列表首页', 'GET', fixed('/api/vouchers')),
+        ('凭证列表（按科目）', 'GET', fixed(f'/api/vouchers?account_code={parent}')),
+        ('凭证列表（按金额）', 'GET', fixed('/api/vouchers?min_amount=5000')),
+        ('凭证详情', 'GET', fixed('/api/vouchers/1')),
+        ('下一个凭证号', 'GET', fixed(f'/api/vouchers/next_number?date={year}-06-01&type=记')),
+    ]
+    if np is not None:  # 分析快照需要 numpy
+        cases.append(('分析透视（科目×月份）', 'GET',
+                      with_snapshot(f'/api/analytics/pivot?rows=account&columns=month&year={year}')))
+    cases += [
+        # --- 写接口 ---
+        ('新增凭证', 'POST', post_voucher),
+        ('删除凭证', 'DELETE', create_for_delete),
+        (f'批量新增凭证（{BATCH_SIZE}张）', 'POST',
+         lambda i: ('/api/vouchers:batch', {'json': [voucher_body(dataset, i * BATCH_SIZE + j)
+                                                     for j in range(BATCH_SIZE)]})),
+        (f'导入凭证 NDJSON（{BATCH_SIZE}张）', 'POST', ndjson_body),
+        ('保存期初余额', 'POST', fixed('/api/account_balances', json={
+            'year': year, 'balances': [{'account_code': leaf, 'balance': '1000.00'}]})),
+        ('生成科目汇总', 'POST', fixed('/api/reports/generate_summary', json={'year': year})),
+        ('重建科目余额（从首年起结转）', 'POST',
+         fixed(f'/api/reports/rebuild_balances?from_year={dataset["years"][0]}')),
+        ('新增科目', 'POST', lambda i: ('/api/accounts', {'json': {
+            'account_code': f"9{i:03d}", 'account_name': f"基准测试{i}", 'balance_direction': 'debit'}})),
+        ('修改科目', 'PUT', lambda i: (f"/api/accounts/9{i:03d}", {'json': {'account_name': f"基准测试{i}改"}})),
+        ('删除科目', 'DELETE', lambda i: (f"/api/accounts/9{i:03d}", {})),
+    ]
+    if np is not None:
+        # 放在写接口之后：第一次刷新读入上面新增、删除的凭证，之后几次只做年度校验
+        cases.append(('刷新分析快照（增量）', 'POST', fixed('/api/analytics/refresh')))
+    return cases
+
+
+def bench_endpoints(database, dataset, repeat):
+    from account_tree import invalidate_account_tree
+    from app import app
+    from db_utils import close_pool
+    from report_cache import report_cache
+
+    config.DB_CONFIG['database'] = database  # db_utils 在首次建池时读取
+    close_pool()
+    invalidate_account_tree()
+    report_cache.clear()
+    # 分析快照写到临时目录，不覆盖业务库的快照
+    snapshot_dir = tempfile.mkdtemp(prefix='analytics_bench_')
+    config.ANALYTICS_CONFIG['snapshot_dir'] = snapshot_dir
+
+    client = app.test_client()
+    adapter = app.url_map.bind('localhost')
+    covered = set()
+    results = []
+    for name, method, build in endpoint_cases(client, dataset):
+        latencies = []
+        errors = 0
+        for i in range(repeat):
+            url, kwargs = build(i)
+            covered.add(adapter.match(url.split('?')[0], method=method)[0])
+            started = time.perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            response.get_data()  # 流式响应要读完才算完成
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+        url, kwargs = build(repeat)
+        tracemalloc.start()
+        client.open(url, method=method, **kwargs).get_data()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results.append({'name': name, 'method': method, 'url': url, 'errors': errors,
+                        'peak_python_kb': peak // 1024, **summarize(latencies)})
+        r = results[-1]
+        print(f"  {method:<6} {name:<28} p50 {r['p50_ms']:>8.1f}ms  p95 {r['p95_ms']:>8.1f}ms  "
+              f"p99 {r['p99_ms']:>8.1f}ms  {r['throughput_per_s']:>8.1f}/s  峰值 {r['peak_python_kb']}KB"
+              + (f"  错误 {errors}" if errors else ""))
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    uncovered = sorted(rule.rule for rule in app.url_map.iter_rules()
+                       if rule.endpoint != 'static' and rule.endpoint not in covered)
+    return results, uncovered
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    database = args.database or f"{config.DB_CONFIG['database']}_bench"
+    years = list(range(args.start_year, args.start_year + args.years))
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {'accounts': args.accounts, 'years': years, 'entries_per_voucher': args.entries_per_voucher,
+                   'repeat': args.repeat, 'seed': args.seed},
+        'scales': [],
+    }
+    for size in args.sizes:
+        print(f"== {size} 条分录：生成测试账套到 {database}")
+        started = time.perf_counter()
+        create_database(config.DB_CONFIG, database)
+        dataset = populate(config.DB_CONFIG, database, args.accounts, years, size,
+                           args.entries_per_voucher, seed=args.seed)
+        generate_seconds = time.perf_counter() - started
+        print(f"   {dataset['accounts']} 个科目，{dataset['vouchers']} 张凭证，用时 {generate_seconds:.1f} 秒")
+
+        print("-- 存储过程")
+        procedures = bench_procedures(database, dataset, args.repeat)
+        print("-- 接口")
+        endpoints, uncovered = bench_endpoints(database, dataset, args.repeat)
+        if uncovered:
+            print(f"   未覆盖的路由: {', '.join(uncovered)}")
+        report['scales'].append({
+            'entries': size, 'dataset': dataset, 'generate_seconds': generate_seconds,
+            'procedures': procedures, 'endpoints': endpoints, 'uncovered_routes': uncovered,
+            'max_rss_kb': max_rss_kb(),
+        })
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"结果已保存到 {output}")
+
+
+def compare(old_path, new_path):
+    """对比两次运行中相同规模、相同项目的 p50/p95"""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    old_items = {(s['entries'], item['name']): item
+                 for s in old['scales'] for item in s['procedures'] + s['endpoints']}
+    for scale in new['scales']:
+        print(f"== {scale['entries']} 条分录")
+        for item in scale['procedures'] + scale['endpoints']:
+            before = old_items.get((scale['entries'], item['name']))
+            if before is None:
+                continue
+            ratio = item['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+            flag = '  变慢' if ratio > 1.2 else ('  变快' if ratio < 0.8 else '')
+            print(f"  {item['name']:<60} p50 {before['p50_ms']:>8.1f} -> {item['p50_ms']:>8.1f}ms (x{ratio:.2f})  "
+                  f"p95 {before['p95_ms']:>8.1f} -> {item['p95_ms']:>8.1f}ms{flag}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        if len(sys.argv) != 4:
+            raise SystemExit("用法: python -m benchmarks.run compare 旧结果.json 新结果.json")
+        compare(sys.argv[2], sys.argv[3])
+        raise SystemExit(0)
+
+    parser = argparse.ArgumentParser(description="接口与存储过程的基准测试")
+    parser.add_argument('--sizes', type=lambda s: [int(x) for x in s.split(',')], default=[10_000, 100_000, 1_000_000],
+                        help="分录条数，逗号分隔")
+    parser.add_argument('--accounts', type=int, default=1000, help="科目数（四级科目树）")
+    parser.add_argument('--years', type=int, default=3, help="会计年度数")
+    parser.add_argument('--start-year', type=int, default=2023)
+    parser.add_argument('--entries-per-voucher', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=20, help="每项重复次数")
+    parser.add_argument('--seed', type=int, default=20250101)
+    parser.add_argument('--database', help="测试库名，默认 <业务库名>_bench")
+    parser.add_argument('--output', help="结果文件，默认 benchmarks/results/<时间>.json")
+    run(parser.parse_args())
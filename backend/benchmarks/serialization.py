@@ -0,0 +1,113 @@
+# backend/benchmarks/serialization.py
+"""JSON 编码的基准测试：科目汇总表和凭证列表的响应体
+
+不需要数据库：按真实查询结果的列和类型（Decimal 金额、date 日期）生成行，分别用
+- Flask 默认的 JSON 提供者（原来的实现，按键排序、每个值回调 default）；
+- fast_json 的对象输出（金额为字符串 / 整数分）；
+- fast_json 的列式输出（?shape=columns）；
+编码同一份数据，比较每次编码的 p50/p95 耗时和响应体字节数。未安装 orjson 时另测标准库回退路径。
+
+用法（在 backend 目录下执行）：
+
+    python -m benchmarks.serialization --rows 1000,10000,100000
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import fast_json
+from benchmarks.run import summarize
+
+
+def amount(rng, high=10_000_000):
+    return Decimal(rng.randint(0, high)).scaleb(-2)
+
+
+def account_summary_rows(n, rng):
+    """与 services.account_summary 的结果相同的列"""
+    rows = []
+    for i in range(n):
+        opening = amount(rng)
+        debit = amount(rng)
+        credit = amount(rng)
+        rows.append({
+            'account_code': f"{1001 + i // 1000}{i % 1000:06d}",
+            'account_name': f"科目-{i:06d}",
+            'opening_balance': opening,
+            'period_debit': debit,
+            'period_credit': credit,
+            'closing_balance': opening + debit - credit,
+        })
+    return rows
+
+
+def voucher_page(n, rng):
+    """与 services.list_vouchers 的结果相同的结构"""
+    start = date(2025, 1, 1)
+    vouchers = []
+    for i in range(n):
+        number = i % 9999 + 1
+        vouchers.append({
+            'id': i + 1,
+            'voucher_date': start + timedelta(days=i % 365),
+            'voucher_type': '记',
+            'voucher_number': number,
+            'voucher_ref': f"记-{number:04d}",
+            'summary': f"合成凭证{i + 1}",
+            'total_amount': amount(rng),
+        })
+    return {'vouchers': vouchers, 'next_cursor': 'MjAyNS0wMS0wMXwxfDE'}
+
+
+def encoders():
+    """(名称, 编码函数)；编码函数返回字节串"""
+    flask_json = DefaultJSONProvider(Flask(__name__))
+    cases = [
+        ('flask 默认', lambda obj: flask_json.dumps(obj).encode('utf-8')),
+        ('fast 对象/字符串', lambda obj: fast_json.encode(obj, 'string')),
+        ('fast 对象/整数分', lambda obj: fast_json.encode(obj, 'cents')),
+        ('fast 列式/字符串', lambda obj: fast_json.encode(fast_json.to_columns(obj), 'string')),
+        ('fast 列式/整数分', lambda obj: fast_json.encode(fast_json.to_columns(obj), 'cents')),
+    ]
+    if fast_json.orjson is None:
+        print("未安装 orjson，fast 各项为标准库回退路径的结果")
+    return cases
+
+
+def bench(payload, encode, repeat):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode(payload)
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    cases = encoders()
+    for n in args.rows:
+        for name, payload in (('account_summary', account_summary_rows(n, rng)), ('vouchers', voucher_page(n, rng))):
+            print(f"== {name}，{n} 行")
+            baseline = None
+            for label, encode in cases:
+                stats = bench(payload, encode, args.repeat)
+                size = len(encode(payload))
+                baseline = baseline or stats['p50_ms']
+                speedup = baseline / stats['p50_ms'] if stats['p50_ms'] else float('inf')
+                print(f"  {label:<16} p50 {stats['p50_ms']:>9.2f}ms  p95 {stats['p95_ms']:>9.2f}ms  "
+                      f"{size / 1024:>9.1f} KB  x{speedup:.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="JSON 编码基准测试")
+    parser.add_argument('--rows', type=lambda s: [int(x) for x in s.split(',')], default=[1000, 10_000, 100_000],
+                        help="行数，逗号分隔")
+    parser.add_argument('--repeat', type=int, default=20, help="每项重复次数")
+    parser.add_argument('--seed', type=int, default=20250101)
+    run(parser.parse_args())
@@ -0,0 +1,185 @@
+# backend/comparative.py
+"""多期间对比报表（资产负债表、利润表、试算平衡表）
+
+一次请求可以对比多个年度或期间（如近五年，或今年与去年的第三季度）：
+- 一条查询取出所涉各年度全部一级科目的年初余额和月度发生额（每个科目每年至多12行，走 fiscal_year 索引）；
+- 各期间的期初余额和本期发生额由月度发生额的累计和求出，叠成 (期间数, 科目数, 字段数) 的矩阵，
+  与 statement_engine 的系数矩阵相乘，一次得到所有期间的全部报表数值；
+- 结果按报表项目对齐：每行给出各期间的数值，以及相对前一列的增减额和增减百分比。
+
+现金流量表需要逐张分析每个期间的凭证，不能由余额得到，所以不在对比报表之列。
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from db_steps import Query
+from reports import closing_of, parse_period
+from statement_engine import BalanceMatrix, assemble, compute_statements, evaluate, field_values, np, to_cents
+
+COMPARATIVE_REPORTS = ('balance_sheet', 'income_statement', 'trial_balance')
+HUNDRED = Decimal('100')
+PERCENT = Decimal('0.01')
+
+
+def parse_periods(args, max_periods):
+    """解析 years=2023,2024 或 periods=2024-01~2024-03,2025-01~2025-03（单个 YYYY-MM 表示一个月），
+    返回按给定顺序排列的 [(year, from_month, to_month)]；格式错误时抛出 ValueError"""
+    years = args.get('years')
+    periods = args.get('periods')
+    if bool(years) == bool(periods):
+        raise ValueError("须提供 years 或 periods 参数之一")
+    result = []
+    if years:
+        for item in years.split(','):
+            try:
+                result.append((int(item), 1, 12))
+            except ValueError:
+                raise ValueError(f"无效的年度: {item}")
+    else:
+        for item in periods.split(','):
+            start, _, end = item.partition('~')
+            year, from_month = parse_period(start.strip())
+            to_year, to_month = parse_period(end.strip()) if end else (year, from_month)
+            if to_year != year:
+                raise ValueError(f"起止期间必须在同一会计年度内: {item}")
+            if from_month > to_month:
+                raise ValueError(f"起始期间不能晚于结束期间: {item}")
+            result.append((year, from_month, to_month))
+    if len(result) > max_periods:
+        raise ValueError(f"最多对比 {max_periods} 个期间")
+    return result
+
+
+def fetch_monthly_balances(years):
+    """查询各年度一级科目的年初余额和月度发生额（步骤生成器）
+
+    返回 (accounts, openings, monthly)：accounts 为按代码排序的 [(account_code, balance_direction)]，
+    openings 为 {(year, code): 年初余额}，monthly 为 {(year, code): {month: (借方发生额, 贷方发生额)}}。
+    """
+    placeholders = ", ".join(["%s"] * len(years))
+    rows = yield Query(f"""
+        SELECT ab.fiscal_year, ab.account_code, coa.balance_direction, ab.opening_balance,
+               p.fiscal_month, p.period_debit, p.period_credit
+        FROM account_balances ab
+        JOIN chart_of_accounts coa ON ab.account_code = coa.account_code
+        LEFT JOIN account_period_balances p
+            ON p.account_code = ab.account_code AND p.fiscal_year = ab.fiscal_year
+        WHERE ab.fiscal_year IN ({placeholders}) AND coa.level = 1
+        ORDER BY ab.account_code, ab.fiscal_year, p.fiscal_month
+    """, tuple(years), fetch='all')
+    directions = {}
+    openings = {}
+    monthly = defaultdict(dict)
+    for r in rows:
+        key = (r['fiscal_year'], r['account_code'])
+        directions[r['account_code']] = r['balance_direction']
+        openings[key] = r['opening_balance']
+        if r['fiscal_month'] is not None:
+            monthly[key][r['fiscal_month']] = (r['period_debit'], r['period_credit'])
+    return sorted(directions.items()), openings, monthly
+
+
+def period_rows(accounts, openings, monthly, period):
+    """一个期间的科目余额，结构与 fetch_range_balances 的结果相同（未安装 numpy 时使用）"""
+    year, from_month, to_month = period
+    rows = []
+    for code, direction in accounts:
+        if (year, code) not in openings:
+            continue
+        months = monthly.get((year, code), {})
+        prior = [months[m] for m in range(1, from_month) if m in months]
+        current = [months[m] for m in range(from_month, to_month + 1) if m in months]
+        opening = closing_of(direction, openings[(year, code)],
+                             sum((d for d, _ in prior), Decimal('0.00')), sum((c for _, c in prior), Decimal('0.00')))
+        period_debit = sum((d for d, _ in current), Decimal('0.00'))
+        period_credit = sum((c for _, c in current), Decimal('0.00'))
+        rows.append({
+            'account_code': code, 'level': 1, 'balance_direction': direction,
+            'opening_balance': opening, 'period_debit': period_debit, 'period_credit': period_credit,
+            'closing_balance': closing_of(direction, opening, period_debit, period_credit),
+        })
+    return rows
+
+
+def period_matrix(accounts, openings, monthly, periods):
+    """把各期间的科目余额叠成 BalanceMatrix（期间数 x 科目数 x 字段数）"""
+    years = sorted({year for year, _, _ in periods})
+    year_index = {year: i for i, year in enumerate(years)}
+    n = len(accounts)
+    opening = np.zeros((len(years), n), dtype=np.int64)
+    # 月度发生额的累计和：cumulative[年, 科目, k] 为 1..k 月之和（k=0 为 0）
+    debit = np.zeros((len(years), n, 13), dtype=np.int64)
+    credit = np.zeros((len(years), n, 13), dtype=np.int64)
+    for a, (code, _) in enumerate(accounts):
+        for year, y in year_index.items():
+            if (year, code) in openings:
+                opening[y, a] = to_cents(openings[(year, code)])
+            for month, (d, c) in monthly.get((year, code), {}).items():
+                debit[y, a, month] = to_cents(d)
+                credit[y, a, month] = to_cents(c)
+    debit = debit.cumsum(axis=2)
+    credit = credit.cumsum(axis=2)
+
+    sign = np.array([1 if direction == 'debit' else -1 for _, direction in accounts], dtype=np.int64)
+    y = np.array([year_index[year] for year, _, _ in periods])
+    before = np.array([from_month - 1 for _, from_month, _ in periods])
+    end = np.array([to_month for _, _, to_month in periods])
+    # 按余额方向记录：借方科目 +借 -贷，贷方科目 -借 +贷
+    period_opening = opening[y] + sign * (debit[y, :, before] - credit[y, :, before])
+    period_debit = debit[y, :, end] - debit[y, :, before]
+    period_credit = credit[y, :, end] - credit[y, :, before]
+    period_closing = period_opening + sign * (period_debit - period_credit)
+    raw = np.stack([period_opening, period_debit, period_credit, period_closing], axis=-1)
+    return BalanceMatrix([code for code, _ in accounts], field_values(raw, sign))
+
+
+def compute_period_statements(accounts, openings, monthly, periods):
+    """计算每个期间的资产负债表、利润表和试算平衡表，返回与 periods 对应的列表"""
+    if np is not None:
+        return [assemble(values) for values in evaluate(period_matrix(accounts, openings, monthly, periods))]
+    return [compute_statements(period_rows(accounts, openings, monthly, period)) for period in periods]
+
+
+def report_lines(report, rows):
+    """把一张报表的行展开为 [(行标识, 数值)]，用于按项目对齐各期间"""
+    if report == 'balance_sheet':
+        # 对比资产负债表取各期末数
+        return ([({'section': 'asset', 'item': r['asset_item']}, r['asset_closing'])
+                 for r in rows if r['asset_item']]
+                + [({'section': 'liability_equity', 'item': r['liability_equity_item']}, r['liability_equity_closing'])
+                   for r in rows if r['liability_equity_item']])
+    if report == 'income_statement':
+        return [({'line_index': r['line_index'], 'item': r['item']}, r['amount']) for r in rows]
+    return ([({'item': r['item_name'], 'side': 'debit'}, r['total_debit']) for r in rows]
+            + [({'item': r['item_name'], 'side': 'credit'}, r['total_credit']) for r in rows])
+
+
+def change_pct(current, previous):
+    if not previous:
+        return None
+    return (((current - previous) / abs(previous)) * HUNDRED).quantize(PERCENT)
+
+
+def align(report, periods, statements):
+    """按报表项目对齐各期间：每行含 values（各期间数值）、changes 和 change_pcts（相对前一列，首列为 None）"""
+    columns = [report_lines(report, s[report]) for s in statements]
+    rows = []
+    for i, (label, _) in enumerate(columns[0]):
+        values = [column[i][1] for column in columns]
+        rows.append({
+            **label,
+            'values': values,
+            'changes': [None] + [cur - prev for prev, cur in zip(values, values[1:])],
+            'change_pcts': [None] + [change_pct(cur, prev) for prev, cur in zip(values, values[1:])],
+        })
+    return {
+        'report': report,
+        'periods': [{'year': y, 'from_month': f, 'to_month': t} for y, f, t in periods],
+        'rows': rows,
+    }
+
+
+def comparative_report(report, periods):
+    """对比报表（步骤生成器）：一条查询取数，一次矩阵乘法计算所有期间"""
+    accounts, openings, monthly = yield from fetch_monthly_balances(sorted({year for year, _, _ in periods}))
+    return align(report, periods, compute_period_statements(accounts, openings, monthly, periods))
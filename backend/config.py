@@ -7,3 +7,101 @@ DB_CONFIG = {
     'database': 'financial_db'
 }
 
+# 数据库连接池配置
+DB_POOL_CONFIG = {
+    'pool_size': 10,     # 常驻连接数
+    'max_overflow': 5,   # 高峰期允许额外创建的连接数
+    'timeout': 30,       # 池满时借用连接的最长等待秒数
+    'pre_ping': True,    # 借出前检查连接是否可用
+    'recycle': 3600      # 连接存活超过该秒数后重建
+}
+
+# 只读副本（MySQL 复制的从库），每一项覆盖 DB_CONFIG 中的对应键，例如：
+#     DB_REPLICAS = [{'host': '127.0.0.1', 'port': 3307}]
+# 为空时全部读写都走主库。每个副本有自己的连接池（大小同 DB_POOL_CONFIG）
+DB_REPLICAS = []
+
+# 只读请求的路由（见 db_replicas）
+DB_READ_CONFIG = {
+    'balance': 'round_robin',           # round_robin 轮流使用 / least_connections 借出连接最少的副本
+    'max_lag_seconds': 5,               # 复制延迟超过该秒数的副本暂不使用，读请求回退到主库
+    'lag_check_interval': 2,            # 两次检查同一副本复制延迟的最短间隔（秒）
+    'retry_seconds': 10,                # 副本连接失败后暂停使用的秒数
+    'read_your_writes_seconds': 5,      # 写请求成功后，该客户端的读请求在这么多秒内走主库
+    'read_your_writes_cookie': 'db_pin',
+}
+
+# 凭证列表分页
+VOUCHER_PAGE_SIZE = 50       # 默认每页条数
+VOUCHER_PAGE_SIZE_MAX = 500  # 每页条数上限
+
+# 凭证新增/删除时是否在同一事务中增量更新科目余额表（关闭后只能通过“生成科目汇总”全量重建）
+INCREMENTAL_BALANCES = True
+
+# 科目树缓存：两次比对数据库版本（COUNT/MAX(updated_at)）之间的最短间隔（秒）
+ACCOUNT_CACHE_CHECK_INTERVAL = 2
+
+# 科目搜索（/api/accounts/search）返回的条数
+ACCOUNT_SEARCH_LIMIT = 20      # 默认条数
+ACCOUNT_SEARCH_LIMIT_MAX = 100  # 条数上限
+
+# 凭证批量导入
+IMPORT_BATCH_SIZE = 500   # 每个事务写入的凭证数
+IMPORT_MAX_ERRORS = 1000  # 导入结果中最多返回的错误明细条数
+
+# 凭证批量提交（POST /api/vouchers:batch）
+VOUCHER_BATCH_MAX = 1000  # 单次请求最多包含的凭证数
+
+# 总分类账分页
+LEDGER_PAGE_SIZE = 200        # 默认每页分录数
+LEDGER_PAGE_SIZE_MAX = 2000   # 每页分录数上限
+
+# 多期间对比报表（/api/reports/comparative）一次最多对比的年度或期间数
+COMPARATIVE_MAX_PERIODS = 12
+
+# 分析快照与透视查询（/api/analytics/pivot，见 analytics）
+ANALYTICS_CONFIG = {
+    'snapshot_dir': None,       # 快照目录，None 为 backend/analytics_snapshot；多个 worker 须指向同一目录
+    'segment_rows': 1000000,    # 刷新时每段最多写入的分录数
+    'refresh_batch': 10000,     # 刷新时每次从数据库读取的分录数
+    'max_rows': 5000,           # 一次透视最多返回的行数
+    'max_columns': 500,         # 列维度最多的取值数
+}
+
+# 报表结果缓存：disk_dir 设为目录路径即可启用磁盘层，使缓存在重启后仍然可用
+REPORT_CACHE = {
+    'max_entries': 256,                  # 内存层最多缓存的报表数
+    'max_bytes': 64 * 1024 * 1024,       # 内存层总字节数上限
+    'disk_dir': None,                    # 例如 '/var/cache/financial-reports'
+    'disk_max_bytes': 512 * 1024 * 1024  # 磁盘层总字节数上限
+}
+
+# 生产环境启动器（python server.py，基于 gunicorn）；每一项都可用环境变量 SERVER_<大写键名> 覆盖，如 SERVER_WORKERS=8
+# 注意：每个 worker 进程有自己的连接池，数据库连接总数最多为 workers * (pool_size + max_overflow)，
+# 应小于 MySQL 的 max_connections；threads 不宜超过 pool_size + max_overflow
+SERVER_CONFIG = {
+    'bind': '0.0.0.0:5000',
+    'workers': None,             # worker 进程数，None 表示 CPU 核数 * 2 + 1
+    'threads': 4,                # 每个 worker 的线程数（大于1时使用 gthread worker）
+    'timeout': 120,              # 单个请求的最长处理秒数，超时的 worker 被重启
+    'graceful_timeout': 30,      # 平滑重启/停止时，等待在途请求完成的最长秒数
+    'keepalive': 5,              # HTTP keep-alive 秒数
+    'max_requests': 5000,        # worker 处理这么多请求后自动替换（0 表示不替换）
+    'max_requests_jitter': 500,  # 在 max_requests 上加的随机量，避免所有 worker 同时重启
+    'preload_app': True,         # 主进程先加载应用并预热缓存，再 fork 出 worker
+}
+
+# 请求与SQL耗时统计（/metrics 接口、Server-Timing 响应头、慢查询日志）
+METRICS = {
+    'enabled': True,
+    'slow_query_ms': 500,       # 单条SQL超过该毫秒数时写入慢查询日志
+    'slow_request_ms': 2000,    # 单个请求超过该毫秒数时写入慢请求日志
+    'max_fingerprints': 500,    # 最多区分的SQL指纹数，超出的归入 (other)
+}
+
+# 接口的JSON输出；可安装 orjson 加速（pip install orjson），未安装时使用标准库 json
+# 金额（Decimal）默认输出为精确的字符串，如 "1234.50"；请求参数 ?decimals=cents 时输出为乘以 10^cents_scale 的整数
+JSON_CONFIG = {
+    'decimals': 'string',   # 默认的金额输出方式：string / cents
+    'cents_scale': 2,       # cents 方式的小数位数（与金额列的 DECIMAL(15,2) 一致）
+}
@@ -0,0 +1,221 @@
+# backend/db_async.py
+"""ASGI 服务方式使用的异步MySQL连接池（aiomysql）
+
+与 db_utils 的同步连接池使用同一份 DB_CONFIG / DB_POOL_CONFIG：
+连接上限为 pool_size + max_overflow，连接存活超过 recycle 秒后重建。
+等待数据库的请求只挂起协程、不占用线程，所以一个进程可以同时处理远多于连接数的请求，
+超出连接数的请求在 acquire() 处排队，最长等待 timeout 秒。
+配置了只读副本（config.DB_REPLICAS）时每个副本另有一个连接池，只读请求由 get_async_read_connection 按
+db_replicas 的规则选择副本。
+
+需要安装 aiomysql：pip install aiomysql
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import aiomysql
+
+import metrics
+from config import DB_CONFIG, DB_POOL_CONFIG
+from db_replicas import STATUS_STATEMENTS, Replica, create_router, lag_from_status, replica_configs
+
+_pool = None
+_router = None  # 只读副本的路由器，未配置副本时为 None
+
+
+def create_pool(db_config, minsize=1):
+    return aiomysql.create_pool(
+        host=db_config['host'],
+        port=db_config.get('port', 3306),
+        user=db_config['user'],
+        password=db_config['password'],
+        db=db_config['database'],
+        charset='utf8mb4',
+        autocommit=False,
+        minsize=minsize,
+        maxsize=DB_POOL_CONFIG['pool_size'] + DB_POOL_CONFIG['max_overflow'],
+        pool_recycle=DB_POOL_CONFIG['recycle'],
+    )
+
+
+async def init_pool():
+    """创建连接池（在应用启动时调用一次）；副本的连接池不预先建立连接，副本不可用不影响启动"""
+    global _pool, _router
+    if _pool is None:
+        _pool = await create_pool(DB_CONFIG)
+        replicas = [Replica(config, await create_pool(config, minsize=0)) for config in replica_configs()]
+        if replicas:
+            _router = create_router(replicas, lambda pool: pool.size - pool.freesize)
+    return _pool
+
+
+async def close_pool():
+    """关闭连接池（在应用退出时调用）"""
+    global _pool, _router
+    pools = [] if _pool is None else [_pool]
+    if _router is not None:
+        pools += [replica.pool for replica in _router.replicas]
+    _pool = _router = None
+    for pool in pools:
+        pool.close()
+        await pool.wait_closed()
+
+
+async def release(pool, conn):
+    # 归还前结束未提交的事务，避免下一个借用者看到残留的事务状态
+    if not conn.closed:
+        await conn.rollback()
+    pool.release(conn)
+
+
+@asynccontextmanager
+async def get_async_connection():
+    """借出一个连接，退出 async with 时归还；等待超过 DB_POOL_CONFIG['timeout'] 秒抛出 TimeoutError"""
+    pool = await init_pool()
+    started = time.perf_counter()
+    conn = await asyncio.wait_for(pool.acquire(), DB_POOL_CONFIG['timeout'])
+    metrics.record_connect(time.perf_counter() - started)
+    try:
+        yield conn
+    finally:
+        await release(pool, conn)
+
+
+async def check_replica_lag(router, replica, conn):
+    """在副本连接上读取复制延迟并记录到路由器（语句的选择同 db_utils.check_replica_lag）"""
+    error = None
+    async with conn.cursor(aiomysql.DictCursor) as cursor:
+        for index in range(replica.status_statement, len(STATUS_STATEMENTS)):
+            sql, column = STATUS_STATEMENTS[index]
+            try:
+                await cursor.execute(sql)
+                rows = await cursor.fetchall()
+            except aiomysql.MySQLError as err:
+                error = str(err)
+                continue
+            replica.status_statement = index
+            router.record_lag(replica, lag_from_status(rows, column))
+            return
+    router.record_lag(replica, None, error)
+
+
+async def acquire_replica(router):
+    """按负载均衡顺序借出一个延迟未超限的副本连接，返回 (副本, 连接)；没有可用副本时返回 (None, None)"""
+    for replica in router.candidates():
+        try:
+            conn = await asyncio.wait_for(replica.pool.acquire(), DB_POOL_CONFIG['timeout'])
+        except (aiomysql.MySQLError, OSError, asyncio.TimeoutError) as err:
+            router.mark_down(replica, err)
+            continue
+        if router.needs_check(replica):
+            try:
+                await check_replica_lag(router, replica, conn)
+            except (aiomysql.MySQLError, OSError) as err:
+                await release(replica.pool, conn)
+                router.mark_down(replica, err)
+                continue
+        if not router.usable(replica):
+            await release(replica.pool, conn)
+            continue
+        router.record_read(replica)
+        return replica, conn
+    return None, None
+
+
+@asynccontextmanager
+async def get_async_read_connection(pinned=False):
+    """借出只读连接，产出 (连接, 读取的实例)：与 db_utils.get_db_connection(read_only=True) 相同，
+    优先使用延迟未超限的副本，pinned（读自己的写）或没有可用副本时使用主库"""
+    await init_pool()
+    if _router is None:
+        async with get_async_connection() as conn:
+            yield conn, 'primary'
+        return
+    started = time.perf_counter()
+    replica, conn = (None, None) if pinned else await acquire_replica(_router)
+    if replica is None:
+        _router.record_read(pinned=pinned)
+        async with get_async_connection() as conn:
+            yield conn, 'primary'
+        return
+    metrics.record_connect(time.perf_counter() - started)
+    try:
+        yield conn, replica.name
+    finally:
+        await release(replica.pool, conn)
+
+
+class InstrumentedAsyncCursor:
+    """异步游标的耗时统计包装，与 db_utils.InstrumentedCursor 相同：一条语句的统计在下一条语句或关闭时提交"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._sql = None
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _flush(self):
+        if self._sql is not None:
+            metrics.record_query(self._sql, self._elapsed, self._rows)
+            self._sql = None
+
+    async def _run(self, sql, coro):
+        self._flush()
+        started = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            self._sql = sql
+            self._elapsed = time.perf_counter() - started
+            self._rows = 0
+
+    async def execute(self, sql, params=None):
+        return await self._run(sql, self._cursor.execute(sql, params))
+
+    async def executemany(self, sql, params):
+        return await self._run(sql, self._cursor.executemany(sql, params))
+
+    async def callproc(self, procname, args=()):
+        return await self._run(f"CALL {procname}", self._cursor.callproc(procname, args))
+
+    async def fetchall(self):
+        started = time.perf_counter()
+        rows = await self._cursor.fetchall()
+        self._elapsed += time.perf_counter() - started
+        self._rows += len(rows)
+        return rows
+
+    async def close(self):
+        self._flush()
+        await self._cursor.close()
+
+
+@asynccontextmanager
+async def get_async_cursor(conn):
+    """在连接上打开字典游标，开启耗时统计时包装为 InstrumentedAsyncCursor"""
+    cursor = await conn.cursor(aiomysql.DictCursor)
+    wrapped = InstrumentedAsyncCursor(cursor) if metrics.enabled() else cursor
+    try:
+        yield wrapped
+    finally:
+        await wrapped.close()
+
+
+def get_async_pool_stats():
+    """连接池的计数器；配置了只读副本时另含 read_routing"""
+    if _pool is None:
+        return {'initialized': False}
+    stats = {
+        'initialized': True,
+        'size': _pool.size,
+        'free': _pool.freesize,
+        'in_use': _pool.size - _pool.freesize,
+        'maxsize': _pool.maxsize,
+    }
+    if _router is not None:
+        stats['read_routing'] = _router.stats()
+    return stats
@@ -0,0 +1,175 @@
+# backend/db_replicas.py
+"""只读副本的选择：负载均衡、复制延迟检查和“读自己的写”
+
+config.DB_REPLICAS 配置若干只读副本（MySQL 复制的从库），只读接口（GET 请求上不写数据的 call_service）
+从副本读取，写入和其他读取仍走主库：
+
+- 负载均衡：round_robin 轮流使用各副本；least_connections 选借出连接最少的副本；
+- 延迟检查：借出副本连接时，若距上次检查超过 lag_check_interval 秒，在该连接上执行 SHOW REPLICA STATUS
+  （MySQL 8.0.22 以前为 SHOW SLAVE STATUS）读取复制延迟秒数。延迟超过 max_lag_seconds、复制线程停止
+  （延迟为 NULL）或查询失败的副本暂不使用，到下次检查时间再试；连接失败的副本 retry_seconds 秒内不再尝试；
+  没有可用副本时回退到主库；
+- 读自己的写：写请求成功后，响应设置 Cookie（read_your_writes_cookie），值为 read_your_writes_seconds 秒后的时间戳，
+  在此之前该客户端的读请求都走主库，刚保存的凭证马上就能在列表和报表中看到。
+
+没有复制状态（SHOW REPLICA STATUS 返回空）的实例视为延迟为 0，这样用两个独立的本地 MySQL 实例
+（如 3306 和 3307 端口）也能验证路由；生产环境只应把真正的从库配置为副本。
+响应头 X-DB-Route 给出本次请求读取的实例（primary 或副本的 host:port）。
+
+本模块只维护副本的状态和选择顺序，不依赖数据库驱动；同步连接池（db_utils）和异步连接池（db_async）共用。
+"""
+import itertools
+import threading
+import time
+
+from config import DB_CONFIG, DB_READ_CONFIG, DB_REPLICAS
+
+BALANCE_METHODS = ('round_robin', 'least_connections')
+STATUS_STATEMENTS = (
+    ("SHOW REPLICA STATUS", 'Seconds_Behind_Source'),
+    ("SHOW SLAVE STATUS", 'Seconds_Behind_Master'),
+)
+
+
+def replica_configs():
+    """各副本的连接参数：DB_REPLICAS 中每一项覆盖 DB_CONFIG 的对应键（通常只需给出 host/port）"""
+    return [{**DB_CONFIG, **replica} for replica in DB_REPLICAS]
+
+
+def replica_name(db_config):
+    return f"{db_config['host']}:{db_config.get('port', 3306)}"
+
+
+def lag_from_status(rows, column):
+    """由复制状态取延迟秒数：没有复制状态的实例为 0，任一复制通道停止时为 None，多个通道取最大值"""
+    lags = [row.get(column) for row in rows]
+    if None in lags:
+        return None
+    return max((int(lag) for lag in lags), default=0)
+
+
+def pinned_to_primary(cookie_value, now=None):
+    """读自己的写：Cookie 中的时间戳尚未到期时返回 True"""
+    if not cookie_value:
+        return False
+    try:
+        until = float(cookie_value)
+    except ValueError:
+        return False
+    return until > (time.time() if now is None else now)
+
+
+def pin_cookie_value(now=None):
+    return f"{(time.time() if now is None else now) + DB_READ_CONFIG['read_your_writes_seconds']:.3f}"
+
+
+class Replica:
+    """一个副本的连接池和健康状态"""
+
+    def __init__(self, db_config, pool):
+        self.name = replica_name(db_config)
+        self.pool = pool
+        self.lag = None           # 最近一次检查到的延迟秒数（None 表示未知或复制已停止）
+        self.checked_at = None    # 最近一次检查延迟的时间（monotonic）
+        self.down_until = 0.0     # 连接失败后暂停使用到该时间（monotonic）
+        self.status_statement = 0  # STATUS_STATEMENTS 中可用的语句
+        self.last_error = None
+        self.reads = 0
+
+
+class ReplicaRouter:
+    """按负载均衡方式给出副本的尝试顺序，并记录各副本的延迟和故障
+
+    in_use(pool) 返回一个连接池当前借出的连接数，供 least_connections 使用。
+    """
+
+    def __init__(self, replicas, in_use, balance='round_robin', max_lag_seconds=5,
+                 lag_check_interval=2, retry_seconds=10):
+        if balance not in BALANCE_METHODS:
+            raise ValueError(f"未知的负载均衡方式: {balance}")
+        self.replicas = replicas
+        self.in_use = in_use
+        self.balance = balance
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_check_interval = lag_check_interval
+        self.retry_seconds = retry_seconds
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = {'replica_reads': 0, 'primary_fallbacks': 0, 'pinned_reads': 0}
+
+    def needs_check(self, replica, now=None):
+        now = time.monotonic() if now is None else now
+        return replica.checked_at is None or now - replica.checked_at >= self.lag_check_interval
+
+    def usable(self, replica):
+        return replica.lag is not None and replica.lag <= self.max_lag_seconds
+
+    def candidates(self, now=None):
+        """本次读取依次尝试的副本：跳过暂停中的副本，以及延迟超限且还未到下次检查时间的副本"""
+        now = time.monotonic() if now is None else now
+        available = [r for r in self.replicas
+                     if r.down_until <= now and (self.usable(r) or self.needs_check(r, now))]
+        if self.balance == 'least_connections':
+            return sorted(available, key=lambda r: self.in_use(r.pool))
+        if not available:
+            return available
+        start = next(self._counter) % len(available)
+        return available[start:] + available[:start]
+
+    def record_lag(self, replica, lag, error=None):
+        replica.lag = lag
+        replica.checked_at = time.monotonic()
+        replica.last_error = error
+
+    def mark_down(self, replica, error):
+        replica.down_until = time.monotonic() + self.retry_seconds
+        replica.lag = None
+        replica.last_error = str(error)
+
+    def record_read(self, replica=None, pinned=False):
+        """记录一次只读请求的去向：replica 为 None 表示回退到主库（pinned 为读自己的写）"""
+        with self._lock:
+            if replica is not None:
+                replica.reads += 1
+                self._stats['replica_reads'] += 1
+            elif pinned:
+                self._stats['pinned_reads'] += 1
+            else:
+                self._stats['primary_fallbacks'] += 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            data = dict(self._stats)
+        data['balance'] = self.balance
+        data['available'] = sum(1 for r in self.replicas if r.down_until <= now and self.usable(r))
+        data['replicas'] = [{
+            'name': r.name,
+            'lag_seconds': r.lag,
+            'usable': r.down_until <= now and self.usable(r),
+            'in_use': self.in_use(r.pool),
+            'reads': r.reads,
+            'last_error': r.last_error,
+        } for r in self.replicas]
+        return data
+
+
+def create_router(replicas, in_use):
+    """按 DB_READ_CONFIG 创建路由器"""
+    return ReplicaRouter(
+        replicas, in_use,
+        balance=DB_READ_CONFIG['balance'],
+        max_lag_seconds=DB_READ_CONFIG['max_lag_seconds'],
+        lag_check_interval=DB_READ_CONFIG['lag_check_interval'],
+        retry_seconds=DB_READ_CONFIG['retry_seconds'],
+    )
+
+
+def routing_gauges(stats):
+    """/metrics 中只读路由的指标（stats 为 ReplicaRouter.stats() 的结果）；请求计数只增不减，类型为 counter"""
+    return {
+        'db_replicas_available': ("当前可用的只读副本数", stats['available']),
+        'db_replica_reads_total': ("从副本读取的请求数", stats['replica_reads'], 'counter'),
+        'db_read_primary_fallbacks_total': ("没有可用副本、回退到主库的只读请求数", stats['primary_fallbacks'], 'counter'),
+        'db_read_pinned_total': ("因读自己的写而走主库的只读请求数", stats['pinned_reads'], 'counter'),
+    }
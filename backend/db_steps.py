@@ -0,0 +1,110 @@
+# backend/db_steps.py
+"""与驱动无关的数据库步骤
+
+需要访问数据库的业务函数写成生成器：每 yield 一个 Query / Call 就是一次数据库操作，
+生成器收到执行结果后继续往下算，最后 return 计算结果。例如：
+
+    def peek_next_voucher_number(voucher_type, voucher_date):
+        row = yield Query("SELECT last_number FROM voucher_sequences WHERE ...", (...), fetch='one')
+        return (row['last_number'] if row else 0) + 1
+
+同一个生成器既可以交给 run_sync 在同步游标（mysql-connector，Flask 应用）上执行，
+也可以交给 run_async 在异步游标（aiomysql，ASGI 应用）上执行，两种服务方式共用同一份SQL和校验逻辑。
+
+执行结果的约定：
+- fetch='all' 返回字典行列表，fetch='one' 返回第一行字典或 None（无论游标本身返回元组还是字典）；
+- 不取结果时返回 ExecResult(rowcount, lastrowid)；
+- Call 执行存储过程，返回 None。
+
+生成器里第一次 yield 之前的部分（参数解析、校验）不访问数据库，可以先用 start() 执行，
+校验失败时就不必借出数据库连接。
+"""
+from collections import namedtuple
+
+Query = namedtuple('Query', ['sql', 'params', 'fetch', 'many'], defaults=((), None, False))
+Call = namedtuple('Call', ['proc', 'args'], defaults=((),))
+ExecResult = namedtuple('ExecResult', ['rowcount', 'lastrowid'])
+
+
+def as_dicts(cursor, rows):
+    """把元组行按游标的列名转换为字典行（已是字典时原样返回）"""
+    if not rows or isinstance(rows[0], dict):
+        return list(rows)
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def query_result(cursor, query, rows):
+    if query.fetch == 'all':
+        return as_dicts(cursor, rows)
+    if query.fetch == 'one':
+        rows = as_dicts(cursor, rows)
+        return rows[0] if rows else None
+    return ExecResult(cursor.rowcount, cursor.lastrowid)
+
+
+def _resume(first, steps):
+    step = first
+    while True:
+        result = yield step
+        try:
+            step = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+
+
+def start(steps):
+    """执行步骤生成器在第一次访问数据库之前的部分
+
+    生成器没有访问数据库就结束时返回 (True, 结果)；否则返回 (False, 从第一个步骤继续的步骤生成器)。
+    其间抛出的异常原样传给调用方。
+    """
+    try:
+        first = next(steps)
+    except StopIteration as stop:
+        return True, stop.value
+    return False, _resume(first, steps)
+
+
+def run_sync(cursor, steps):
+    """在同步游标上执行步骤生成器，返回其最终结果"""
+    result = None
+    while True:
+        try:
+            step = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        if isinstance(step, Call):
+            cursor.callproc(step.proc, step.args)
+            result = None
+        elif step.many:
+            cursor.executemany(step.sql, step.params)
+            result = ExecResult(cursor.rowcount, cursor.lastrowid)
+        else:
+            cursor.execute(step.sql, step.params)
+            # 总是取完全部结果行，非缓冲游标上也可以紧接着执行下一条语句
+            rows = cursor.fetchall() if step.fetch else None
+            result = query_result(cursor, step, rows)
+
+
+async def run_async(cursor, steps):
+    """在异步游标（aiomysql）上执行步骤生成器，返回其最终结果"""
+    result = None
+    while True:
+        try:
+            step = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        if isinstance(step, Call):
+            await cursor.callproc(step.proc, step.args)
+            # 存储过程的各个结果集要全部读完，才能执行下一条语句
+            while await cursor.nextset():
+                pass
+            result = None
+        elif step.many:
+            await cursor.executemany(step.sql, step.params)
+            result = ExecResult(cursor.rowcount, cursor.lastrowid)
+        else:
+            await cursor.execute(step.sql, step.params)
+            rows = await cursor.fetchall() if step.fetch else None
+            result = query_result(cursor, step, rows)
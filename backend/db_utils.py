@@ -1,13 +1,435 @@
 # backend/db_utils.py
+import queue
+import threading
+import time
+
 import mysql.connector
-from config import DB_CONFIG
+import metrics
+from config import DB_CONFIG, DB_POOL_CONFIG, DB_REPLICAS
+from db_replicas import STATUS_STATEMENTS, Replica, create_router, lag_from_status, replica_configs
+
+
+class InstrumentedCursor:
+    """记录每条SQL的耗时（执行加取结果）和返回行数的游标包装，统计写入 metrics
+
+    一条语句的统计在执行下一条语句或关闭游标时提交；其余属性和方法转交给原始游标。
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._sql = None
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def _flush(self):
+        if self._sql is not None:
+            metrics.record_query(self._sql, self._elapsed, self._rows)
+            self._sql = None
+
+    def _run(self, sql, method, *args, **kwargs):
+        self._flush()
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._sql = sql
+            self._elapsed = time.perf_counter() - started
+            self._rows = 0
+
+    def execute(self, operation, *args, **kwargs):
+        return self._run(operation, self._cursor.execute, operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        return self._run(operation, self._cursor.executemany, operation, *args, **kwargs)
+
+    def callproc(self, procname, *args, **kwargs):
+        return self._run(f"CALL {procname}", self._cursor.callproc, procname, *args, **kwargs)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        self._elapsed += time.perf_counter() - started
+        return result
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        if row is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._fetch(self._cursor.fetchmany, *args)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        self._rows += len(rows)
+        return rows
+
+    def close(self):
+        self._flush()
+        return self._cursor.close()
+
+
+class PooledConnection:
+    """从连接池借出的连接。
+
+    用法与原始连接一致；调用 close() 或退出 with 语句块时，连接被归还到池中而不是真正断开。
+    """
+
+    def __init__(self, pool, raw_conn, created_at):
+        self._pool = pool
+        self._conn = raw_conn
+        self.created_at = created_at
+        self.borrowed_at = None
+        self.route = 'primary'  # 读取的实例：primary 或副本的 host:port
+
+    def __getattr__(self, name):
+        # 其余属性和方法（cursor、commit、rollback 等）全部转交给原始连接
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def cursor(self, *args, **kwargs):
+        """创建游标；开启耗时统计时返回 InstrumentedCursor"""
+        cursor = self._conn.cursor(*args, **kwargs)
+        return InstrumentedCursor(cursor) if metrics.enabled() else cursor
+
+    def close(self):
+        """归还连接（重复调用是安全的）"""
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool.release(self)
+
+
+class ConnectionPool:
+    """线程安全的MySQL连接池。
+
+    - pool_size: 常驻连接数；max_overflow: 高峰期允许额外创建的连接数
+    - timeout: 池满时借用连接的最长等待秒数
+    - pre_ping: 借出前做一次健康检查，失效连接自动重建
+    - recycle: 连接存活超过该秒数后，归还时直接关闭，避免被MySQL的wait_timeout断开
+    """
+
+    def __init__(self, db_config, pool_size=10, max_overflow=5, timeout=30,
+                 pre_ping=True, recycle=3600):
+        self.db_config = db_config
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self.recycle = recycle
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        # 有连接归还到空闲队列或空出名额时通知等待者（与计数器共用 _lock）
+        self._available = threading.Condition(self._lock)
+        self._opened = 0  # 当前已创建（空闲+借出）的连接数
+        self._stats = {
+            'in_use': 0,
+            'borrowed_total': 0,
+            'created_total': 0,
+            'recycled_total': 0,
+            'failed_pings': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+        }
+
+    # --- 内部工具 ---
+
+    def _connect(self):
+        raw_conn = mysql.connector.connect(**self.db_config)
+        with self._lock:
+            self._stats['created_total'] += 1
+        return PooledConnection(self, raw_conn, time.monotonic())
+
+    def _release_slot(self):
+        """释放一个名额（连接已关闭或创建失败），唤醒一个等待者在这个名额上新建连接"""
+        with self._lock:
+            self._opened -= 1
+            self._available.notify()
+
+    def _discard(self, conn):
+        self._release_slot()
+        try:
+            conn._conn.close()
+        except Exception:
+            pass
 
-def get_db_connection():
-    """获取数据库连接"""
+    def _is_expired(self, conn):
+        return self.recycle and self.recycle > 0 and time.monotonic() - conn.created_at > self.recycle
+
+    def _has_capacity(self):
+        """持有 _lock 时调用：是否有空闲连接或空余名额"""
+        return self._idle.qsize() > 0 or self._opened < self.pool_size + self.max_overflow
+
+    def _try_reserve_slot(self):
+        with self._lock:
+            if self._opened < self.pool_size + self.max_overflow:
+                self._opened += 1
+                return True
+            return False
+
+    def _checkout(self):
+        """取一个空闲连接，没有时在空余名额上新建；池满时返回 None"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        if not self._try_reserve_slot():
+            return None
+        try:
+            return self._connect()
+        except Exception:
+            self._release_slot()
+            raise
+
+    # --- 借出与归还 ---
+
+    def acquire(self):
+        """借出一个连接，池满时最多等待 timeout 秒"""
+        conn = self._checkout()
+        if conn is None:
+            # 池满：等待连接归还或名额空出（过期、溢出的连接归还时被关闭，只空出名额，不进空闲队列），
+            # 每次被唤醒都重新尝试取空闲连接和新建连接，直到超时
+            started = time.monotonic()
+            deadline = started + self.timeout
+            try:
+                while conn is None:
+                    with self._lock:
+                        while not self._has_capacity():
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                self._stats['timeouts'] += 1
+                                raise TimeoutError(f"等待数据库连接超时（{self.timeout}秒）")
+                            self._available.wait(remaining)
+                    conn = self._checkout()
+            finally:
+                waited = time.monotonic() - started
+                with self._lock:
+                    self._stats['waits'] += 1
+                    self._stats['wait_time_total'] += waited
+                    self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+
+        if self._is_expired(conn):
+            with self._lock:
+                self._stats['recycled_total'] += 1
+            conn = self._replace(conn)
+        elif self.pre_ping:
+            try:
+                conn._conn.ping(reconnect=False)
+            except Exception:
+                with self._lock:
+                    self._stats['failed_pings'] += 1
+                conn = self._replace(conn)
+
+        # 每次借出都换一个新的包装对象，之前借用者手里的旧引用再调用 close() 不会误还别人的连接
+        conn = PooledConnection(self, conn._conn, conn.created_at)
+        conn.borrowed_at = time.monotonic()
+        with self._lock:
+            self._stats['in_use'] += 1
+            self._stats['borrowed_total'] += 1
+        return conn
+
+    def _replace(self, conn):
+        """关闭失效/过期的连接，并在同一个名额上重建"""
+        try:
+            conn._conn.close()
+        except Exception:
+            pass
+        try:
+            return self._connect()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def release(self, conn):
+        """归还连接：回滚未提交的事务，溢出或过期的连接直接关闭"""
+        with self._lock:
+            self._stats['in_use'] -= 1
+        try:
+            if conn._conn.in_transaction:
+                conn._conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+
+        if self._is_expired(conn) or self._idle.qsize() >= self.pool_size:
+            if self._is_expired(conn):
+                with self._lock:
+                    self._stats['recycled_total'] += 1
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+        with self._lock:
+            self._available.notify()
+
+    def close_all(self):
+        """关闭所有空闲连接（借出中的连接会在归还时按需关闭）"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        """连接池计数器，用于评估连接池大小"""
+        with self._lock:
+            data = dict(self._stats)
+            data['opened'] = self._opened
+        data['idle'] = self._idle.qsize()
+        data['pool_size'] = self.pool_size
+        data['max_overflow'] = self.max_overflow
+        data['wait_time_avg'] = data['wait_time_total'] / data['waits'] if data['waits'] else 0.0
+        return data
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_router = None  # 只读副本的路由器（见 db_replicas），未配置副本时为 None
+
+
+def get_pool():
+    """获取进程内唯一的连接池（首次使用时创建）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONFIG, **DB_POOL_CONFIG)
+    return _pool
+
+
+def get_router():
+    """获取只读副本的路由器（首次使用时为每个副本创建连接池），未配置副本时返回 None"""
+    global _router
+    if _router is None and DB_REPLICAS:
+        with _pool_lock:
+            if _router is None:
+                replicas = [Replica(config, ConnectionPool(config, **DB_POOL_CONFIG)) for config in replica_configs()]
+                _router = create_router(replicas, lambda pool: pool.stats()['in_use'])
+    return _router
+
+
+def check_replica_lag(router, replica, conn):
+    """在副本连接上读取复制延迟并记录到路由器"""
+    cursor = conn._conn.cursor(dictionary=True)
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
+        error = None
+        for index in range(replica.status_statement, len(STATUS_STATEMENTS)):
+            sql, column = STATUS_STATEMENTS[index]
+            try:
+                cursor.execute(sql)
+                rows = cursor.fetchall()
+            except mysql.connector.Error as err:
+                # 旧版本不认识 SHOW REPLICA STATUS 时改用 SHOW SLAVE STATUS；缺少 REPLICATION CLIENT 权限时两条都失败
+                error = str(err)
+                continue
+            replica.status_statement = index
+            router.record_lag(replica, lag_from_status(rows, column))
+            return
+        router.record_lag(replica, None, error)
+    finally:
+        cursor.close()
+
+
+def acquire_replica(router):
+    """按负载均衡顺序借出一个延迟未超限的副本连接，没有可用副本时返回 None"""
+    for replica in router.candidates():
+        try:
+            conn = replica.pool.acquire()
+        except (mysql.connector.Error, TimeoutError) as err:
+            router.mark_down(replica, err)
+            continue
+        if router.needs_check(replica):
+            try:
+                check_replica_lag(router, replica, conn)
+            except mysql.connector.Error as err:
+                conn.close()
+                router.mark_down(replica, err)
+                continue
+        if not router.usable(replica):
+            conn.close()
+            continue
+        conn.route = replica.name
+        router.record_read(replica)
         return conn
-    except mysql.connector.Error as err:
+    return None
+
+
+def get_db_connection(read_only=False, pinned=False):
+    """从连接池借出一个数据库连接，失败时返回None
+
+    read_only 为 True 且配置了只读副本时优先从副本借出（见 db_replicas），没有可用副本时回退到主库；
+    pinned 为 True（客户端刚写入过，读自己的写）时仍走主库。连接的 route 属性为实际读取的实例。
+
+    返回的连接支持 with 语句，退出时自动归还到连接池：
+
+        conn = get_db_connection()
+        if conn is None: ...
+        with conn:
+            ...
+    """
+    started = time.perf_counter()
+    router = get_router() if read_only else None
+    if router is not None:
+        conn = None if pinned else acquire_replica(router)
+        if conn is not None:
+            metrics.record_connect(time.perf_counter() - started)
+            return conn
+        router.record_read(pinned=pinned)
+    try:
+        conn = get_pool().acquire()
+    except (mysql.connector.Error, TimeoutError) as err:
         print(f"数据库连接失败: {err}")
         return None
+    metrics.record_connect(time.perf_counter() - started)
+    return conn
+
+
+def get_pool_stats():
+    """返回连接池计数器；配置了只读副本时另含 read_routing（各副本的延迟、借出数和读取次数）"""
+    stats = get_pool().stats()
+    router = get_router()
+    if router is not None:
+        stats['read_routing'] = router.stats()
+    return stats
+
+
+def close_pool():
+    """关闭进程内连接池（含各副本的连接池）的空闲连接并丢弃连接池，下次使用时重新创建
+
+    多进程部署时由主进程在 fork 之前调用，避免子进程继承主进程的数据库连接。
+    """
+    global _pool, _router
+    with _pool_lock:
+        pool, _pool = _pool, None
+        router, _router = _router, None
+    if pool is not None:
+        pool.close_all()
+    if router is not None:
+        for replica in router.replicas:
+            replica.pool.close_all()
+
 
+def reset_pool_after_fork():
+    """在 fork 出的子进程中调用：丢弃继承来的连接池（不关闭连接，套接字仍属于父进程），
+    子进程首次借用连接时创建自己的连接池"""
+    global _pool, _pool_lock, _router
+    _pool = None
+    _router = None
+    _pool_lock = threading.Lock()
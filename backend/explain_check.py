@@ -0,0 +1,132 @@
+# backend/explain_check.py
+"""用 EXPLAIN 检查热点查询是否能用上索引
+
+对每条热点查询执行 EXPLAIN，发现对凭证、分录、余额等表的全表扫描（type = ALL）时：
+- possible_keys 为空：查询条件写法无法使用任何索引（如对列套了函数），判为失败；
+- possible_keys 不为空：有可用索引，只是优化器认为全表扫描更快（表里数据很少时常见），只给出提示；
+- 估计扫描行数少于 SMALL_TABLE_ROWS：表里数据很少，优化器对没有过滤条件的查询（如凭证列表首页）
+  会直接全表扫描再排序，possible_keys 也为空，这时同样只给出提示，新建的空库上检查不会失败。
+
+全部查询都通过 ExplainingCursor 在真正执行之前先 EXPLAIN，检查的就是代码实际发出的SQL：
+路由的查询直接运行 services 中的步骤生成器（route_cases），库函数的查询运行对应的库函数。
+凭证列表的每页合计查询只在该页有凭证时才会发出，空库上检查不到。
+
+用法（在 backend 目录下执行，有失败项时退出码为1）：
+    python explain_check.py 2025
+"""
+from werkzeug.datastructures import MultiDict
+
+import services
+from balance_posting import verify_account_summary
+from db_steps import run_sync
+from ledger import iter_ledger
+from reports import fetch_range_balances
+from statements import fetch_cash_vouchers
+
+# 设计上就需要整表读取的小表（科目表在内存中建树）
+FULL_SCAN_ALLOWED = {'coa', 'chart_of_accounts'}
+# 估计行数少于该值的全表扫描只提示，不判为失败
+SMALL_TABLE_ROWS = 1000
+
+
+def route_cases(year):
+    """路由中的热点查询：(名称, 步骤生成器)，直接运行 services 中路由调用的步骤生成器"""
+    start, end = f"{year}-01-01", f"{year}-12-31"
+    return [
+        ("凭证列表（首页）", services.list_vouchers(MultiDict())),
+        ("凭证列表（按日期范围和凭证字）",
+         services.list_vouchers(MultiDict({'date_from': start, 'date_to': end, 'type': '记'}))),
+        ("凭证列表（按科目）", services.list_vouchers(MultiDict({'account_code': '1002'}))),
+        ("凭证列表（按金额）", services.list_vouchers(MultiDict({'min_amount': '1000'}))),
+        ("凭证列表（按日期范围和金额）",
+         services.list_vouchers(MultiDict({'date_from': start, 'date_to': end, 'max_amount': '1000'}))),
+        ("下一个凭证号", services.next_voucher_number(MultiDict({'date': f"{year}-01-15", 'type': '记'}))),
+    ]
+
+
+class ExplainingCursor:
+    """包装游标：每条 SELECT 在执行前先 EXPLAIN，并记录执行计划（游标需为缓冲游标）"""
+
+    def __init__(self, cursor, label, plans):
+        self._cursor = cursor
+        self._label = label
+        self._plans = plans
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, sql, params=()):
+        if sql.lstrip().upper().startswith('SELECT'):
+            self._cursor.execute('EXPLAIN ' + sql, params)
+            self._plans.append((self._label, sql, self._cursor.fetchall()))
+        return self._cursor.execute(sql, params)
+
+
+def collect_plans(conn, year):
+    """收集全部热点查询的执行计划，返回 [(名称, SQL, EXPLAIN结果行)]"""
+    plans = []
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        for label, steps in route_cases(year):
+            run_sync(ExplainingCursor(cursor, label, plans), steps)
+        run_sync(ExplainingCursor(cursor, "科目余额核对", plans), verify_account_summary(year))
+        run_sync(ExplainingCursor(cursor, "期间科目余额", plans), fetch_range_balances(year, 1, 12))
+        run_sync(ExplainingCursor(cursor, "现金流量表分录", plans), fetch_cash_vouchers(year, 1, 12))
+        for scope, code in (('account', '1002'), ('subtree', '1002'), ('all', None)):
+            try:
+                for _ in iter_ledger(ExplainingCursor(cursor, f"总分类账（{scope}）", plans), year, code, scope, limit=1):
+                    pass
+            except ValueError:
+                pass  # 科目不存在时跳过
+    finally:
+        cursor.close()
+    return plans
+
+
+def check_plans(plans):
+    """返回 (失败列表, 提示列表)，每项为一行说明"""
+    failures = []
+    warnings = []
+    for label, _, rows in plans:
+        for row in rows:
+            table = row.get('table') or ''
+            if row.get('type') != 'ALL' or table in FULL_SCAN_ALLOWED or table.startswith('<'):
+                continue
+            message = f"{label}: 表 {table} 全表扫描（rows={row.get('rows')}）"
+            if row.get('possible_keys'):
+                warnings.append(f"{message}，可用索引 {row['possible_keys']} 未被选用")
+            elif (row.get('rows') or 0) < SMALL_TABLE_ROWS:
+                warnings.append(f"{message}，没有可用索引，表中数据较少，暂不判为失败")
+            else:
+                failures.append(f"{message}，没有可用索引")
+    return failures, warnings
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from db_utils import get_db_connection
+
+    parser = argparse.ArgumentParser(description="用 EXPLAIN 检查热点查询的索引使用情况")
+    parser.add_argument('year', type=int)
+    parser.add_argument('--verbose', action='store_true', help="打印每条查询的执行计划")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if conn is None:
+        raise SystemExit("数据库连接失败")
+    with conn:
+        plans = collect_plans(conn, args.year)
+
+    if args.verbose:
+        for label, _, rows in plans:
+            print(f"== {label}")
+            for row in rows:
+                print(f"   {row.get('table')}: type={row.get('type')} key={row.get('key')} rows={row.get('rows')}")
+    failures, warnings = check_plans(plans)
+    for w in warnings:
+        print(f"提示: {w}")
+    for f in failures:
+        print(f"失败: {f}")
+    print(f"共检查 {len(plans)} 条查询，发现 {len(failures)} 处无法使用索引的全表扫描")
+    raise SystemExit(1 if failures else 0)
@@ -0,0 +1,183 @@
+# backend/exports.py
+"""报表与凭证的流式导出（CSV / NDJSON / XLSX）
+
+每个数据源接收一个非缓冲的字典游标，返回 (列名列表, 行迭代器)，行用 fetchmany 逐批读取；
+写出器把行编码为字节块逐块产出，交给 Flask 的流式响应。
+整个过程中内存里只有一批行，与结果总行数无关，下载也能立即开始。
+
+注意：非缓冲游标必须读完全部结果后才能在同一连接上执行下一条语句，
+所以需要的辅助数据（如期初余额）要在打开流式查询之前先查好。
+"""
+import csv
+import importlib.util
+import io
+import os
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+
+from db_steps import run_sync
+from fast_json import encode
+from ledger import iter_ledger
+from reports import compute_trial_balance, fetch_range_balances
+
+FETCH_SIZE = 1000        # 每次从游标取出的行数
+CHUNK_BYTES = 64 * 1024  # 每个响应块的大致字节数
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+# --- 数据源 ---
+
+def stream_rows(cursor, sql, params=()):
+    """执行查询并用 fetchmany 逐批产出行（cursor 应为非缓冲的字典游标）"""
+    cursor.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        yield from rows
+
+
+def account_summary_source(cursor, year, period_range=None):
+    columns = ['account_code', 'account_name', 'opening_balance', 'period_debit', 'period_credit', 'closing_balance']
+    if period_range:
+        # 按期间的汇总每个科目一行，数据量与科目数相同，直接复用报表查询
+        rows = run_sync(cursor, fetch_range_balances(*period_range))
+        return columns, ([r[c] for c in columns] for r in rows)
+    sql = """
+        SELECT ab.account_code, coa.account_name, ab.opening_balance,
+               ab.period_debit, ab.period_credit, ab.closing_balance
+        FROM account_balances ab
+        JOIN chart_of_accounts coa ON ab.account_code = coa.account_code
+        WHERE ab.fiscal_year = %s
+        ORDER BY ab.account_code
+    """
+    return columns, ([r[c] for c in columns] for r in stream_rows(cursor, sql, (year,)))
+
+
+def trial_balance_source(cursor, year, period_range=None):
+    if not period_range:
+        period_range = (year, 1, 12)
+    rows = compute_trial_balance(run_sync(cursor, fetch_range_balances(*period_range)))
+    columns = ['item_name', 'total_debit', 'total_credit']
+    return columns, ([r[c] for c in columns] for r in rows)
+
+
+def general_ledger_source(cursor, year, account_code=None, scope=None):
+    """总分类账：默认导出全部科目；给出 account_code 时导出该科目及其下级科目汇总的一本账"""
+    scope = scope or ('subtree' if account_code else 'all')
+    columns = ['ledger_code', 'account_code', 'entry_date', 'voucher_ref', 'summary', 'debit', 'credit', 'direction', 'balance']
+    rows = iter_ledger(cursor, year, account_code, scope)
+    return columns, ([r[c] for c in columns] for r in rows)
+
+
+def vouchers_source(cursor, date_from=None, date_to=None):
+    """凭证及其分录，每条分录一行"""
+    conditions = []
+    params = []
+    if date_from:
+        conditions.append("v.voucher_date >= %s")
+        params.append(date_from)
+    if date_to:
+        conditions.append("v.voucher_date <= %s")
+        params.append(date_to)
+    where_sql = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    sql = f"""
+        SELECT v.id AS voucher_id, v.voucher_date, v.voucher_type, v.voucher_number,
+               v.summary AS voucher_summary, je.account_code, coa.account_name,
+               je.summary AS entry_summary, je.debit_amount AS debit, je.credit_amount AS credit
+        FROM vouchers v
+        JOIN journal_entries je ON je.voucher_id = v.id AND je.fiscal_year = v.fiscal_year
+        JOIN chart_of_accounts coa ON je.account_code = coa.account_code
+        {where_sql}
+        ORDER BY v.voucher_date, v.voucher_type, v.voucher_number, v.id, je.id
+    """
+    columns = ['voucher_id', 'voucher_date', 'voucher_type', 'voucher_number', 'voucher_summary',
+               'account_code', 'account_name', 'entry_summary', 'debit', 'credit']
+    return columns, ([r[c] for c in columns] for r in stream_rows(cursor, sql, tuple(params)))
+
+
+# --- 写出器 ---
+
+def to_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def write_csv(columns, rows):
+    """产出CSV字节块；带UTF-8 BOM，方便Excel直接打开中文内容"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([to_text(v) for v in row])
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def write_ndjson(columns, rows):
+    """产出NDJSON字节块，每行一个对象；金额为字符串、日期为ISO格式（与接口的默认输出相同）"""
+    parts = []
+    size = 0
+    for row in rows:
+        line = encode(dict(zip(columns, row)), 'string') + b'\n'
+        parts.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield b''.join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield b''.join(parts)
+
+
+def write_xlsx(columns, rows):
+    """产出XLSX字节块（需要安装 openpyxl）
+
+    XLSX 是 zip 格式，必须写完才能输出：行以 write-only 模式逐行写入临时文件（内存占用恒定），
+    写完后再分块读出。
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(columns)
+    for row in rows:
+        sheet.append([float(v) if isinstance(v, Decimal) else v for v in row])
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+WRITERS = {
+    'csv': write_csv,
+    'ndjson': write_ndjson,
+    'xlsx': write_xlsx,
+}
+
+
+def xlsx_available():
+    """是否安装了 openpyxl（只检查能否找到，不导入）"""
+    return importlib.util.find_spec('openpyxl') is not None
@@ -0,0 +1,109 @@
+# backend/fast_json.py
+"""接口的JSON编码
+
+查询结果中大量的 Decimal（金额）和 date（凭证日期）是默认 JSON 提供者的主要开销：每个值都要回调一次 default，
+还要按键排序。这里改用 orjson（未安装时退回标准库 json）：
+- 日期、时间输出为 ISO 格式（2025-01-31 / 2025-01-31T08:00:00），orjson 原生处理，不经过回调；
+- Decimal 按 decimals 方式输出：string 为精确的字符串 "1234.50"（与原来一致），
+  cents 为乘以 10^cents_scale 后的整数 123450（客户端不必再解析字符串，也不会有浮点误差）；
+- 键按查询列的顺序输出，不再排序。
+
+列式输出：to_columns 把“字典列表”改为 {"columns": [...], "rows": [[...], ...]}，省去每行重复的键名，
+大结果集的响应体积通常能减少一半以上。接口在 call_service(columnar=True) 时支持 ?shape=columns。
+"""
+import json
+import time
+from datetime import date, datetime, time as dt_time
+from decimal import ROUND_HALF_UP, Decimal
+
+import metrics
+from config import JSON_CONFIG
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库 json
+    orjson = None
+
+DECIMAL_MODES = ('string', 'cents')
+SHAPES = ('objects', 'columns')
+
+
+def _decimal_as_string(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (date, datetime, dt_time)):
+        return value.isoformat()
+    raise TypeError(f"无法编码为JSON的类型: {type(value).__name__}")
+
+
+def _decimal_as_cents(value):
+    if isinstance(value, Decimal):
+        return int(value.scaleb(JSON_CONFIG['cents_scale']).to_integral_value(ROUND_HALF_UP))
+    return _decimal_as_string(value)
+
+
+_DEFAULTS = {'string': _decimal_as_string, 'cents': _decimal_as_cents}
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def encode(obj, decimals=None):
+    """编码为 UTF-8 的 JSON 字节串；decimals 为 None 时使用 JSON_CONFIG['decimals']"""
+    default = _DEFAULTS[decimals or JSON_CONFIG['decimals']]
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def to_columns(result):
+    """把字典列表改为列式：[{a: 1, b: 2}, ...] -> {"columns": ["a", "b"], "rows": [[1, 2], ...]}
+
+    result 为字典时，转换其中每个值为字典列表的字段（如 {"vouchers": [...], "next_cursor": ...}），其余字段不变。
+    同一列表中的各行须有相同的键和键序（查询结果总是如此）。
+    """
+    if isinstance(result, list):
+        if result and not isinstance(result[0], dict):
+            return result
+        columns = list(result[0]) if result else []
+        return {"columns": columns, "rows": [tuple(row.values()) for row in result]}
+    if isinstance(result, dict):
+        return {key: to_columns(value) if isinstance(value, list) and value and isinstance(value[0], dict) else value
+                for key, value in result.items()}
+    return result
+
+
+def check_format_args(args):
+    """校验 decimals / shape 请求参数，不支持的取值返回错误信息"""
+    decimals = args.get('decimals')
+    if decimals is not None and decimals not in DECIMAL_MODES:
+        return f"不支持的金额格式: {decimals}（可选 {' / '.join(DECIMAL_MODES)}）"
+    shape = args.get('shape')
+    if shape is not None and shape not in SHAPES:
+        return f"不支持的输出结构: {shape}（可选 {' / '.join(SHAPES)}）"
+    return None
+
+
+class FastJSONMixin:
+    """与 Flask / Quart 的 DefaultJSONProvider 组合使用的JSON提供者，并记录序列化耗时
+
+    子类实现 decimal_mode() 返回当前请求的 decimals 方式（None 表示默认）。
+    """
+
+    def decimal_mode(self):
+        return None
+
+    def _encode(self, obj):
+        started = time.perf_counter()
+        try:
+            return encode(obj, self.decimal_mode())
+        finally:
+            metrics.record_serialize(time.perf_counter() - started)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # 带参数的调用（如 sort_keys、indent）按原实现处理
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._encode(obj) + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,201 @@
+# backend/ledger.py
+"""总分类账引擎
+
+按日期顺序对分录做一次遍历，边读边累计余额，复杂度 O(分录数)，不需要逐行写临时表。
+支持三种范围（scope）：
+- account: 单个科目，只包含记在该科目上的分录；
+- subtree: 科目及其全部下级科目，下级科目的分录汇入该科目，按该科目的余额方向累计；
+- all: 全部科目，每个科目一本账，按科目代码、日期顺序排列。
+
+分页使用游标：游标里记录最后一行的排序键和当时的累计余额，下一页从该位置继续查询、继续累计，
+所以翻到第 N 页的代价与第 1 页相同。
+
+分录按会计年度分区，查询带 fiscal_year 条件只扫描该年度的分区；已结账归档的年度改读归档表（见 period_close）。
+"""
+import base64
+import json
+from datetime import date
+from decimal import Decimal
+
+from db_steps import Query, run_sync
+from period_close import HOT_TABLES, ledger_tables
+from reports import closing_of
+
+ZERO = Decimal('0.00')
+SCOPES = ('account', 'subtree', 'all')
+
+
+def encode_ledger_cursor(row):
+    """把账页的最后一行编码为分页游标"""
+    key = [row['ledger_code'], row['entry_date'].isoformat(), row['voucher_id'], row['entry_id'], str(row['balance'])]
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+
+def decode_ledger_cursor(cursor_str):
+    """解析分页游标，返回 (ledger_code, entry_date, voucher_id, entry_id, balance)；格式错误时抛出 ValueError"""
+    try:
+        code, date_str, voucher_id, entry_id, balance = json.loads(base64.urlsafe_b64decode(cursor_str.encode('ascii')))
+        return code, date.fromisoformat(date_str), int(voucher_id), int(entry_id), Decimal(balance)
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+
+def load_openings(year, account_code=None, exact=False):
+    """查询科目的余额方向和年初余额（步骤生成器），返回 {account_code: (opening_balance, balance_direction)}"""
+    if account_code and exact:
+        condition, param = "coa.account_code = %s", account_code
+    else:
+        condition, param = "coa.account_code LIKE %s", (account_code or '') + '%'
+    rows = yield Query(f"""
+        SELECT coa.account_code, coa.balance_direction, COALESCE(ab.opening_balance, 0) AS opening_balance
+        FROM chart_of_accounts coa
+        LEFT JOIN account_balances ab ON ab.account_code = coa.account_code AND ab.fiscal_year = %s
+        WHERE {condition}
+    """, (year, param), fetch='all')
+    return {r['account_code']: (r['opening_balance'], r['balance_direction']) for r in rows}
+
+
+def opening_row(code, year, direction, balance):
+    """账页开头的期初余额行"""
+    return {
+        'ledger_code': code, 'account_code': code, 'entry_date': date(year, 1, 1),
+        'voucher_id': None, 'entry_id': None, 'voucher_ref': None, 'summary': '期初余额',
+        'debit': ZERO, 'credit': ZERO, 'direction': '借' if direction == 'debit' else '贷',
+        'balance': balance,
+    }
+
+
+def check_scope(scope, account_code):
+    if scope not in SCOPES:
+        raise ValueError(f"无效的总账范围: {scope}")
+    if scope != 'all' and not account_code:
+        raise ValueError("必须提供科目代码")
+
+
+def load_ledger_openings(year, account_code, scope):
+    """校验参数并查询本次需要的期初余额（步骤生成器）"""
+    check_scope(scope, account_code)
+    openings = yield from load_openings(year, account_code if scope != 'all' else None, exact=(scope == 'account'))
+    if scope != 'all' and account_code not in openings:
+        raise ValueError(f"科目 {account_code} 不存在")
+    return openings
+
+
+def ledger_query(year, account_code=None, scope='account', after=None, limit=None, tables=HOT_TABLES):
+    """构造读取分录的查询，返回 (sql, params)；tables 为 (凭证表, 分录表)"""
+    conditions = ["je.fiscal_year = %s", "v.voucher_date >= %s", "v.voucher_date < %s"]
+    params = [year, date(year, 1, 1), date(year + 1, 1, 1)]
+    if scope == 'account':
+        conditions.append("je.account_code = %s")
+        params.append(account_code)
+    elif scope == 'subtree':
+        conditions.append("je.account_code LIKE %s")
+        params.append(account_code + '%')
+
+    if scope == 'all':
+        order_by = "je.account_code, v.voucher_date, v.id, je.id"
+        if after:
+            conditions.append("(je.account_code, v.voucher_date, v.id, je.id) > (%s, %s, %s, %s)")
+            params.extend(after[:4])
+    else:
+        order_by = "v.voucher_date, v.id, je.id"
+        if after:
+            conditions.append("(v.voucher_date, v.id, je.id) > (%s, %s, %s)")
+            params.extend(after[1:4])
+
+    sql = f"""
+        SELECT je.id AS entry_id, je.account_code, v.id AS voucher_id, v.voucher_date,
+               v.voucher_type, v.voucher_number, je.summary, je.debit_amount, je.credit_amount
+        FROM {tables[1]} je
+        JOIN {tables[0]} v ON v.id = je.voucher_id AND v.fiscal_year = je.fiscal_year
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {order_by}
+    """
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql, tuple(params)
+
+
+def ledger_rows(entries, openings, year, account_code=None, scope='account', after=None):
+    """把按顺序读出的分录行累计成总分类账的各行
+
+    每行包含 ledger_code（账页所属科目）、account_code（分录实际记账科目）、entry_date、
+    voucher_id、entry_id、voucher_ref、summary、debit、credit、direction、balance。
+    """
+    ledger_code = None
+    balance = ZERO
+    direction = 'debit'
+    if after:
+        ledger_code = after[0]
+        balance = after[4]
+        direction = openings.get(ledger_code, (ZERO, 'debit'))[1]
+
+    for r in entries:
+        code = r['account_code'] if scope == 'all' else account_code
+        if code != ledger_code:
+            # 新的一本账：先输出期初余额行
+            ledger_code = code
+            balance, direction = openings.get(code, (ZERO, 'debit'))
+            yield opening_row(code, year, direction, balance)
+        balance = closing_of(direction, balance, r['debit_amount'], r['credit_amount'])
+        yield {
+            'ledger_code': code,
+            'account_code': r['account_code'],
+            'entry_date': r['voucher_date'],
+            'voucher_id': r['voucher_id'],
+            'entry_id': r['entry_id'],
+            'voucher_ref': f"{r['voucher_type']}-{r['voucher_number']:04d}",
+            'summary': r['summary'],
+            'debit': r['debit_amount'],
+            'credit': r['credit_amount'],
+            'direction': '借' if direction == 'debit' else '贷',
+            'balance': balance,
+        }
+
+    # 单科目/科目树在本年没有任何分录时，仍然输出期初余额行
+    if ledger_code is None and scope != 'all' and not after:
+        balance, direction = openings[account_code]
+        yield opening_row(account_code, year, direction, balance)
+
+
+def iter_ledger(cursor, year, account_code=None, scope='account', after=None, limit=None):
+    """流式产出总分类账的各行（同步字典游标，用于导出）
+
+    after 为 decode_ledger_cursor 的结果；limit 限制本次读取的分录数（不含期初行）。
+    非缓冲游标在遍历结束前不能执行其他语句，所以期初余额会在开始遍历前先查好。
+    """
+    openings = run_sync(cursor, load_ledger_openings(year, account_code, scope))
+    tables = run_sync(cursor, ledger_tables(year))
+    sql, params = ledger_query(year, account_code, scope, after, limit, tables)
+    cursor.execute(sql, params)
+
+    def fetch_entries():
+        while True:
+            batch = cursor.fetchmany(1000)
+            if not batch:
+                break
+            yield from batch
+
+    yield from ledger_rows(fetch_entries(), openings, year, account_code, scope, after)
+
+
+def ledger_page(year, account_code=None, scope='account', after=None, limit=100):
+    """读取一页总分类账（步骤生成器），返回 (行列表, 下一页游标或None)"""
+    openings = yield from load_ledger_openings(year, account_code, scope)
+    tables = yield from ledger_tables(year)
+    sql, params = ledger_query(year, account_code, scope, after, limit + 1, tables)
+    entries = yield Query(sql, params, fetch='all')
+    rows = ledger_rows(entries, openings, year, account_code, scope, after)
+    entry_count = 0
+    page = []
+    for row in rows:
+        if row['entry_id'] is not None:
+            entry_count += 1
+            if entry_count > limit:
+                # 多取的一条分录只用来判断是否还有下一页；页尾的期初行留给下一页输出
+                while page[-1]['entry_id'] is None:
+                    page.pop()
+                return page, encode_ledger_cursor(page[-1])
+        page.append(row)
+    return page, None
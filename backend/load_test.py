@@ -0,0 +1,142 @@
+# backend/load_test.py
+"""压力测试：多个并发客户端循环请求接口，统计吞吐量和延迟
+
+对已经在运行的服务测试：
+    python load_test.py run --url http://127.0.0.1:5000 --concurrency 32 --duration 20
+
+对比不同 worker 数的吞吐量（依次用 server.py 启动 1、2、4 个 worker 的服务并各测一轮）：
+    python load_test.py scale --workers 1,2,4 --threads 4 --concurrency 32 --duration 20
+
+默认请求 /api/vouchers（凭证列表第一页，需要查询数据库）和 /api/accounts/leaf（科目树缓存，纯 CPU），
+可用 --path 指定其他路径（可重复）。只依赖标准库。
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_PATHS = ['/api/vouchers', '/api/accounts/leaf']
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_load(base_url, path, concurrency, duration):
+    """concurrency 个线程在 duration 秒内循环请求 path，返回统计结果"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        local = []
+        local_errors = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + path, timeout=30) as response:
+                    response.read()
+                local.append(time.perf_counter() - started)
+            except (urllib.error.URLError, OSError):
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'path': path,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def print_result(result, label=''):
+    print(f"{label}{result['path']:<24} {result['rps']:>9.1f} req/s  "
+          f"p50 {result['p50_ms']:>7.1f}ms  p95 {result['p95_ms']:>7.1f}ms  p99 {result['p99_ms']:>7.1f}ms  "
+          f"请求 {result['requests']}  错误 {result['errors']}")
+
+
+def wait_until_ready(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(base_url + '/api/reports/cache_stats', timeout=2):
+                return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    return False
+
+
+def run_scale(args):
+    """依次以不同 worker 数启动 server.py，测出每种配置的吞吐量"""
+    host, port = '127.0.0.1', args.port
+    base_url = f"http://{host}:{port}"
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    summary = []
+    for workers in args.workers:
+        cmd = [sys.executable, 'server.py', '--bind', f"{host}:{port}",
+               '--workers', str(workers), '--threads', str(args.threads)]
+        server = subprocess.Popen(cmd, cwd=backend_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not wait_until_ready(base_url):
+                print(f"workers={workers}: 服务未能在60秒内启动")
+                continue
+            for path in args.path:
+                run_load(base_url, path, args.concurrency, min(2, args.duration))  # 预热
+                result = run_load(base_url, path, args.concurrency, args.duration)
+                print_result(result, f"workers={workers:<3} ")
+                summary.append((workers, result))
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+    print("\n吞吐量（相对 1 个 worker 的倍数）")
+    for path in args.path:
+        rows = [(w, r['rps']) for w, r in summary if r['path'] == path]
+        if not rows:
+            continue
+        base = rows[0][1] or 1.0
+        print(f"{path}: " + "  ".join(f"{w}个worker {rps:.0f} req/s (x{rps / base:.2f})" for w, rps in rows))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="接口压力测试")
+    parser.add_argument('command', choices=['run', 'scale'])
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="run 模式下被测服务的地址")
+    parser.add_argument('--path', action='append', help="被测路径，可重复；默认 /api/vouchers 和 /api/accounts/leaf")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20, help="每个路径的测试秒数")
+    parser.add_argument('--workers', type=lambda s: [int(x) for x in s.split(',')], default=[1, 2, 4],
+                        help="scale 模式下依次测试的 worker 数，逗号分隔")
+    parser.add_argument('--threads', type=int, default=4, help="scale 模式下每个 worker 的线程数")
+    parser.add_argument('--port', type=int, default=5055, help="scale 模式下启动服务使用的端口")
+    args = parser.parse_args()
+    args.path = args.path or DEFAULT_PATHS
+
+    if args.command == 'run':
+        for path in args.path:
+            print_result(run_load(args.url.rstrip('/'), path, args.concurrency, args.duration))
+    else:
+        run_scale(args)
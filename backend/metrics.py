@@ -0,0 +1,195 @@
+# backend/metrics.py
+"""请求与SQL的耗时统计（Prometheus 文本格式）
+
+每个请求记录：借用数据库连接的时间、执行的每条SQL（按指纹归类）的耗时和返回行数、JSON序列化时间，
+汇总为直方图，由 /metrics 接口以 Prometheus 文本格式输出；超过阈值的慢查询、慢请求写入日志
+（logger 名为 financial.slow）。阈值和开关在 config.METRICS 中配置。
+
+开销：每条SQL一次指纹查表（带缓存）、几次 perf_counter 和一次加锁累加，可以在生产环境常开。
+
+当前请求的统计保存在 ContextVar 中，同步线程和 asyncio 协程各自独立，
+数据库层（db_utils 的 InstrumentedCursor）不需要知道自己在哪个请求里。
+"""
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import lru_cache
+
+from config import METRICS
+
+logger = logging.getLogger('financial.slow')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+OTHER_FINGERPRINT = '(other)'
+
+
+class Histogram:
+    """带标签的直方图；observe 只做一次二分查找和加锁累加"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # 标签值元组 -> [各桶计数..., 总和, 总次数]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def has_series(self, labels):
+        return labels in self._series
+
+    def series_count(self):
+        return len(self._series)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            label_text = ",".join(f'{k}="{escape_label(v)}"' for k, v in zip(self.label_names, labels))
+            prefix = label_text + "," if label_text else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+            braces = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{self.name}_sum{braces} {series[-2]}")
+            lines.append(f"{self.name}_count{braces} {series[-1]}")
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """SQL指纹：参数、字面量替换为 ?，IN 列表和多行 VALUES 折叠为一组，空白归一"""
+    text = _WHITESPACE.sub(' ', sql).strip().rstrip(';')
+    text = text.replace('%s', '?')
+    text = _STRING_LITERAL.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _PLACEHOLDER_LIST.sub('(?+)', text)
+    return text[:300]
+
+
+class RequestTiming:
+    """一个请求内的各阶段耗时"""
+    __slots__ = ('started', 'connect', 'sql', 'queries', 'rows', 'serialize')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connect = 0.0
+        self.sql = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.serialize = 0.0
+
+
+current_timing = ContextVar('current_timing', default=None)
+
+request_duration = Histogram('http_request_duration_seconds', "请求处理耗时", ('route', 'method', 'status'))
+request_phase = Histogram('http_request_phase_seconds', "请求内各阶段耗时（connect/sql/serialize）", ('route', 'phase'))
+query_duration = Histogram('db_query_duration_seconds', "SQL执行耗时（含取结果），按指纹", ('fingerprint',))
+query_rows = Histogram('db_query_rows', "SQL返回行数，按指纹", ('fingerprint',), buckets=ROW_BUCKETS)
+connect_duration = Histogram('db_connection_acquire_seconds', "借用数据库连接耗时（含等待和健康检查）", ())
+HISTOGRAMS = [request_duration, request_phase, query_duration, query_rows, connect_duration]
+
+
+def enabled():
+    return METRICS['enabled']
+
+
+def start_request():
+    """请求开始时调用，返回用于 finish_request 的令牌"""
+    return current_timing.set(RequestTiming())
+
+
+def finish_request(token, route, method, status):
+    """请求结束时调用：记录直方图，返回本请求的 RequestTiming"""
+    timing = current_timing.get()
+    current_timing.reset(token)
+    if timing is None:
+        return None
+    elapsed = time.perf_counter() - timing.started
+    route = route or '(unmatched)'
+    request_duration.observe((route, method, str(status)), elapsed)
+    request_phase.observe((route, 'connect'), timing.connect)
+    request_phase.observe((route, 'sql'), timing.sql)
+    request_phase.observe((route, 'serialize'), timing.serialize)
+    if elapsed * 1000 >= METRICS['slow_request_ms']:
+        logger.warning("慢请求 %s %s %.1fms（连接 %.1fms，SQL %d 条 %.1fms，序列化 %.1fms）",
+                       method, route, elapsed * 1000, timing.connect * 1000, timing.queries,
+                       timing.sql * 1000, timing.serialize * 1000)
+    return timing
+
+
+def server_timing_header(timing):
+    """生成 Server-Timing 响应头，浏览器开发者工具中可直接查看各阶段耗时"""
+    return (f'db-connect;dur={timing.connect * 1000:.1f}, '
+            f'sql;dur={timing.sql * 1000:.1f};desc="{timing.queries} queries", '
+            f'serialize;dur={timing.serialize * 1000:.1f}')
+
+
+def record_connect(seconds):
+    connect_duration.observe((), seconds)
+    timing = current_timing.get()
+    if timing is not None:
+        timing.connect += seconds
+
+
+def record_query(sql, seconds, rows):
+    fp = fingerprint(sql)
+    if not query_duration.has_series((fp,)) and query_duration.series_count() >= METRICS['max_fingerprints']:
+        fp = OTHER_FINGERPRINT  # 限制指纹数量，避免动态拼接的SQL撑大指标
+    query_duration.observe((fp,), seconds)
+    query_rows.observe((fp,), rows)
+    timing = current_timing.get()
+    if timing is not None:
+        timing.sql += seconds
+        timing.queries += 1
+        timing.rows += rows
+    if seconds * 1000 >= METRICS['slow_query_ms']:
+        logger.warning("慢查询 %.1fms，%d 行: %s", seconds * 1000, rows, fingerprint(sql))
+
+
+def record_serialize(seconds):
+    timing = current_timing.get()
+    if timing is not None:
+        timing.serialize += seconds
+
+
+def render(extra_gauges=None):
+    """输出 Prometheus 文本格式；extra_gauges 为 {指标名: (说明, 数值)} 或 {指标名: (说明, 数值, 类型)}
+
+    类型默认为 gauge；只增不减的计数（名称以 _total 结尾）应给出 'counter'。
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for name, (help_text, value, *kind) in (extra_gauges or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind[0] if kind else 'gauge'}")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
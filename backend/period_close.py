@@ -0,0 +1,293 @@
+# backend/period_close.py
+"""会计年度结账：锁定年度并把凭证和分录移入归档表
+
+vouchers 和 journal_entries 按会计年度分区（见 database/sql/7_fiscal_year_partitions.sql）。
+结账一个年度分三步，每步完成后都可以安全中断、重新运行：
+
+1. 锁定：写入 fiscal_year_closings，此后数据库触发器拒绝该年度凭证和分录的新增、修改和删除
+   （服务层也会先检查，给出 400 错误）。结账前要求：更早的年度都已结账（或没有凭证）、
+   该年度不是脏年度（科目余额已重建，见 balance_rebuild），且已有科目余额行；
+2. 归档：在一个事务中把该年度的凭证和分录复制到压缩行格式的 vouchers_archive / journal_entries_archive，
+   核对行数后记下 archived_at。从这一刻起，凭证详情和总分类账读取该年度时改读归档表（见 ledger_tables）；
+3. 清理：TRUNCATE 该年度在两张热表中的分区（早于分区起始年度、没有单独分区的年度改为分批 DELETE）。
+
+结账后只有 account_balances、account_period_balances 等余额表留在热数据中，报表照常从余额表计算，
+下一年度的期初余额取自本年度的期末余额，不再需要读取本年度的分录。
+
+reopen_year 撤销最近一个已结账年度：把凭证和分录移回热表并解除锁定。
+
+命令行用法：
+
+    python period_close.py --list          # 列出已结账的年度
+    python period_close.py --close 2023    # 结账2023年度并归档
+    python period_close.py --reopen 2023   # 撤销2023年度的结账
+"""
+import time
+
+from balance_rebuild import fetch_dirty_years
+from db_steps import Query, run_sync
+
+LOCK_NAME = 'financial_period_close'
+HOT_TABLES = ('vouchers', 'journal_entries')
+ARCHIVE_TABLES = ('vouchers_archive', 'journal_entries_archive')
+DELETE_BATCH_SIZE = 10000
+
+# 归档表与热表共有的列；热表的 voucher_month、fiscal_year 是生成列，移回热表时不写入
+VOUCHER_COLUMNS = "id, voucher_date, voucher_type, voucher_number, summary, created_at, updated_at"
+ENTRY_COLUMNS = "id, voucher_id, fiscal_year, account_code, summary, debit_amount, credit_amount"
+
+
+def closed_years(years):
+    """years 中已结账的年度（步骤生成器），返回 set"""
+    years = sorted(set(years))
+    if not years:
+        return set()
+    placeholders = ", ".join(["%s"] * len(years))
+    rows = yield Query(f"SELECT fiscal_year FROM fiscal_year_closings WHERE fiscal_year IN ({placeholders})",
+                       tuple(years), fetch='all')
+    return {r['fiscal_year'] for r in rows}
+
+
+def ledger_tables(year):
+    """读取一个年度的凭证和分录应使用的表（步骤生成器）：已归档的年度为归档表，否则为热表"""
+    row = yield Query("SELECT archived_at FROM fiscal_year_closings WHERE fiscal_year = %s", (year,), fetch='one')
+    return ARCHIVE_TABLES if row and row['archived_at'] else HOT_TABLES
+
+
+def fetch_closing(year=None):
+    """一个年度（year 为 None 时为最近一个已结账年度）的结账记录（步骤生成器），没有时返回 None"""
+    if year is None:
+        row = yield Query("""
+            SELECT fiscal_year, archived_at FROM fiscal_year_closings ORDER BY fiscal_year DESC LIMIT 1
+        """, fetch='one')
+    else:
+        row = yield Query("SELECT fiscal_year, archived_at FROM fiscal_year_closings WHERE fiscal_year = %s",
+                          (year,), fetch='one')
+    return row
+
+
+def list_closings():
+    rows = yield Query("""
+        SELECT fiscal_year, closed_at, archived_at, voucher_count, entry_count
+        FROM fiscal_year_closings ORDER BY fiscal_year
+    """, fetch='all')
+    return rows
+
+
+def count_rows(year, tables):
+    """一个年度在 tables（凭证表, 分录表）中的凭证数和分录数（步骤生成器）"""
+    vouchers, entries = tables
+    row = yield Query(f"""
+        SELECT (SELECT COUNT(*) FROM {vouchers} WHERE fiscal_year = %s) AS voucher_count,
+               (SELECT COUNT(*) FROM {entries} WHERE fiscal_year = %s) AS entry_count
+    """, (year, year), fetch='one')
+    return row['voucher_count'], row['entry_count']
+
+
+def check_closable(year):
+    """结账前的检查（步骤生成器），不满足时抛出 ValueError"""
+    row = yield Query("""
+        SELECT MIN(v.fiscal_year) AS fiscal_year
+        FROM vouchers v
+        LEFT JOIN fiscal_year_closings c ON c.fiscal_year = v.fiscal_year
+        WHERE v.fiscal_year < %s AND c.fiscal_year IS NULL
+    """, (year,), fetch='one')
+    if row['fiscal_year'] is not None:
+        raise ValueError(f"{row['fiscal_year']}年度尚未结账，须按年度顺序结账")
+    dirty = yield from fetch_dirty_years()
+    if year in {y for y, _ in dirty}:
+        raise ValueError(f"{year}年度的科目余额需要先重建（python balance_rebuild.py）")
+    has_balances = yield Query("SELECT 1 FROM account_balances WHERE fiscal_year = %s LIMIT 1", (year,), fetch='one')
+    if not has_balances:
+        raise ValueError(f"{year}年度还没有科目余额，请先生成科目汇总数据")
+
+
+def year_partition(table, year):
+    """表中只包含该年度的分区名，没有时返回 None（步骤生成器）"""
+    row = yield Query("""
+        SELECT partition_name FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = %s AND partition_name = %s
+    """, (table, f"p{year}"), fetch='one')
+    return row['partition_name'] if row else None
+
+
+def archive_year(year):
+    """把一个年度的凭证和分录复制到归档表并记下归档时间（步骤生成器，调用方负责事务）"""
+    yield Query("""
+        INSERT IGNORE INTO vouchers_archive (id, voucher_date, voucher_month, fiscal_year,
+                                             voucher_type, voucher_number, summary, created_at, updated_at)
+        SELECT id, voucher_date, voucher_month, fiscal_year, voucher_type, voucher_number, summary, created_at, updated_at
+        FROM vouchers WHERE fiscal_year = %s
+    """, (year,))
+    yield Query(f"""
+        INSERT IGNORE INTO journal_entries_archive ({ENTRY_COLUMNS})
+        SELECT {ENTRY_COLUMNS} FROM journal_entries WHERE fiscal_year = %s
+    """, (year,))
+    hot = yield from count_rows(year, HOT_TABLES)
+    archived = yield from count_rows(year, ARCHIVE_TABLES)
+    if hot != archived:
+        raise RuntimeError(f"{year}年度归档后行数不一致：热表 {hot}，归档表 {archived}")
+    yield Query("""
+        UPDATE fiscal_year_closings SET archived_at = NOW(), voucher_count = %s, entry_count = %s
+        WHERE fiscal_year = %s
+    """, (archived[0], archived[1], year))
+    return archived
+
+
+def purge_hot_rows(conn, cursor, year):
+    """清空一个已归档年度在热表中的数据：优先 TRUNCATE 年度分区，否则分批 DELETE"""
+    for table in reversed(HOT_TABLES):
+        partition = run_sync(cursor, year_partition(table, year))
+        if partition:
+            cursor.execute(f"ALTER TABLE {table} TRUNCATE PARTITION {partition}")
+            continue
+        # 已结账年度的删除会被触发器拒绝，归档清理时用会话变量 @archiving_fiscal_year 放行
+        cursor.execute("SET @archiving_fiscal_year = %s", (year,))
+        try:
+            while True:
+                cursor.execute(f"DELETE FROM {table} WHERE fiscal_year = %s LIMIT %s", (year, DELETE_BATCH_SIZE))
+                deleted = cursor.rowcount
+                conn.commit()
+                if deleted < DELETE_BATCH_SIZE:
+                    break
+        finally:
+            cursor.execute("SET @archiving_fiscal_year = NULL")
+
+
+def with_lock(conn, work):
+    """在结账命名锁内运行 work(cursor) 产出的事件（同一时间只允许一个结账或撤销任务）"""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 0) AS acquired", (LOCK_NAME,))
+        if not cursor.fetchone()['acquired']:
+            raise RuntimeError("已有结账任务正在运行")
+        try:
+            yield from work(cursor)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s) AS released", (LOCK_NAME,))
+            cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def close_year(conn, year):
+    """结账并归档一个年度，逐步产出进度事件（字典）
+
+    事件的 event 字段为 locked（已锁定）、archived（已复制到归档表）、purged（热表已清空）、done。
+    已完成的步骤会跳过，中断后重新运行即可继续。
+    """
+    def work(cursor):
+        started = time.perf_counter()
+        closing = run_sync(cursor, fetch_closing(year))
+        conn.commit()
+        if closing is None:
+            conn.start_transaction()
+            try:
+                # 先写入结账记录：它会等待正在写入该年度的事务结束（触发器的加锁读），
+                # 之后的检查能看到这些事务的结果，且不会再有新的写入
+                cursor.execute("INSERT INTO fiscal_year_closings (fiscal_year) VALUES (%s)", (year,))
+                run_sync(cursor, check_closable(year))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            yield {'event': 'locked', 'year': year}
+
+        if closing is None or closing['archived_at'] is None:
+            # 确保该年度在两张热表中都有单独的分区，清理时可以直接 TRUNCATE
+            for table in HOT_TABLES:
+                cursor.callproc('proc_extend_fiscal_year_partitions', (table, year))
+                for result in cursor.stored_results():
+                    result.fetchall()
+            conn.start_transaction()
+            try:
+                voucher_count, entry_count = run_sync(cursor, archive_year(year))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            yield {'event': 'archived', 'year': year, 'vouchers': voucher_count, 'entries': entry_count}
+
+        purge_hot_rows(conn, cursor, year)
+        conn.commit()
+        yield {'event': 'purged', 'year': year}
+        yield {'event': 'done', 'year': year, 'seconds': round(time.perf_counter() - started, 3)}
+
+    return with_lock(conn, work)
+
+
+def reopen_year(conn, year):
+    """撤销最近一个已结账年度：凭证和分录移回热表并解除锁定，产出进度事件"""
+    def work(cursor):
+        row = run_sync(cursor, fetch_closing())
+        conn.commit()
+        if row is None or row['fiscal_year'] != year:
+            raise ValueError(f"只能撤销最近一个已结账的年度（当前为 {row['fiscal_year'] if row else '无'}）")
+        conn.start_transaction()
+        try:
+            # 先解除锁定，移回热表的写入才能通过触发器的检查
+            cursor.execute("DELETE FROM fiscal_year_closings WHERE fiscal_year = %s", (year,))
+            if row['archived_at'] is not None:
+                cursor.execute(f"""
+                    INSERT IGNORE INTO vouchers ({VOUCHER_COLUMNS})
+                    SELECT {VOUCHER_COLUMNS} FROM vouchers_archive WHERE fiscal_year = %s
+                """, (year,))
+                cursor.execute(f"""
+                    INSERT IGNORE INTO journal_entries ({ENTRY_COLUMNS})
+                    SELECT {ENTRY_COLUMNS} FROM journal_entries_archive WHERE fiscal_year = %s
+                """, (year,))
+                cursor.execute("DELETE FROM journal_entries_archive WHERE fiscal_year = %s", (year,))
+                cursor.execute("DELETE FROM vouchers_archive WHERE fiscal_year = %s", (year,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        yield {'event': 'reopened', 'year': year}
+
+    return with_lock(conn, work)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from db_utils import get_db_connection
+
+    parser = argparse.ArgumentParser(description="会计年度结账：锁定年度并把凭证和分录移入归档表")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--close', type=int, metavar='YEAR', help="结账并归档该年度")
+    group.add_argument('--reopen', type=int, metavar='YEAR', help="撤销该年度的结账（只能是最近一个已结账年度）")
+    group.add_argument('--list', action='store_true', help="列出已结账的年度")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if conn is None:
+        raise SystemExit("数据库连接失败")
+    with conn:
+        if args.list:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                closings = run_sync(cursor, list_closings())
+            finally:
+                cursor.close()
+            if not closings:
+                print("没有已结账的年度")
+            for c in closings:
+                archived = (f"{c['archived_at']:%Y-%m-%d %H:%M} 归档 {c['voucher_count']} 张凭证、{c['entry_count']} 条分录"
+                            if c['archived_at'] else "尚未归档")
+                print(f"  {c['fiscal_year']}年度：{c['closed_at']:%Y-%m-%d %H:%M} 结账，{archived}")
+            raise SystemExit(0)
+        try:
+            events = close_year(conn, args.close) if args.close else reopen_year(conn, args.reopen)
+            for event in events:
+                if event['event'] == 'locked':
+                    print(f"{event['year']}年度已锁定，不能再新增、修改或删除凭证")
+                elif event['event'] == 'archived':
+                    print(f"  已归档 {event['vouchers']} 张凭证、{event['entries']} 条分录")
+                elif event['event'] == 'purged':
+                    print("  已清空热表中该年度的分区")
+                elif event['event'] == 'done':
+                    print(f"完成，用时 {event['seconds']:.1f} 秒")
+                else:
+                    print(f"{event['year']}年度的结账已撤销，凭证和分录已移回热表")
+        except ValueError as e:
+            raise SystemExit(str(e))
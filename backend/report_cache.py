@@ -0,0 +1,188 @@
+# backend/report_cache.py
+"""报表结果缓存
+
+缓存键为 (报表类型, 年度, 其他参数, 账簿版本)。账簿版本保存在 ledger_versions 表中：
+- 凭证、期初余额、科目汇总的写入把对应年度的版本号加一；
+- 科目的增删改把全局版本（fiscal_year = 0）加一。
+版本号在数据库中，所以多个 worker 进程看到的版本一致；数据没有变化时重复打开同一张报表直接命中缓存。
+
+内存层按 LRU 淘汰，并限制总字节数；可选的磁盘层（config.REPORT_CACHE['disk_dir']）让缓存在重启后仍然可用。
+"""
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from config import REPORT_CACHE
+from db_steps import Query
+
+GLOBAL_VERSION_YEAR = 0
+
+
+def bump_ledger_version(years):
+    """把给定年度（0 表示全局）的账簿版本号加一
+
+    应作为事务中的最后一条语句执行：版本行的行锁只在提交前的一瞬间持有，不会拉长并发写入的等待。
+    """
+    years = sorted({int(y) for y in years})
+    if not years:
+        return
+    placeholders = ", ".join(["(%s, 1)"] * len(years))
+    yield Query(
+        f"INSERT INTO ledger_versions (fiscal_year, version) VALUES {placeholders} "
+        "ON DUPLICATE KEY UPDATE version = version + 1",
+        tuple(years)
+    )
+
+
+def read_ledger_version(year):
+    """读取某年度的账簿版本，返回 '全局版本.年度版本'"""
+    rows = yield Query(
+        "SELECT fiscal_year, version FROM ledger_versions WHERE fiscal_year IN (%s, %s)",
+        (GLOBAL_VERSION_YEAR, year), fetch='all'
+    )
+    versions = {row['fiscal_year']: row['version'] for row in rows}
+    return f"{versions.get(GLOBAL_VERSION_YEAR, 0)}.{versions.get(year, 0)}"
+
+
+class ReportCache:
+    """带内存上限的 LRU 报表缓存，可选磁盘层"""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, disk_dir=None,
+                 disk_max_bytes=512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # key -> (pickled bytes, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'bypasses': 0, 'evictions': 0, 'stores': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(report, year, params, version):
+        return (report, year, tuple(sorted(params.items())), version)
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.pkl")
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[1]
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), 'rb') as f:
+                    data = f.read()
+                value = pickle.loads(data)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                value = None
+            if value is not None:
+                self._store_memory(key, data, value)
+                with self._lock:
+                    self._stats['disk_hits'] += 1
+                return value
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._store_memory(key, data, value)
+        with self._lock:
+            self._stats['stores'] += 1
+        if self.disk_dir:
+            self._store_disk(key, data)
+
+    def _store_memory(self, key, data, value):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._entries[key] = (data, value)
+            self._bytes += len(data)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats['evictions'] += 1
+
+    def _store_disk(self, key, data):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._prune_disk()
+        except OSError:
+            pass
+
+    def _prune_disk(self):
+        """磁盘层超出上限时，按修改时间删除最旧的文件"""
+        files = []
+        total = 0
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        files.sort()
+        while files and total > self.disk_max_bytes:
+            _, size, path = files.pop(0)
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def get_or_compute(self, report, year, params, compute, fresh=False):
+        """按当前账簿版本查缓存，未命中（或 fresh=True）时执行 compute() 计算并写入缓存
+
+        compute 返回计算该报表的步骤生成器；本方法本身也是步骤生成器。
+        """
+        version = yield from read_ledger_version(year)
+        key = self.make_key(report, year, params, version)
+        if fresh:
+            with self._lock:
+                self._stats['bypasses'] += 1
+        else:
+            value = self.get(key)
+            if value is not None:
+                return value
+        value = yield from compute()
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['entries'] = len(self._entries)
+            data['bytes'] = self._bytes
+        lookups = data['hits'] + data['disk_hits'] + data['misses']
+        data['hit_rate'] = (data['hits'] + data['disk_hits']) / lookups if lookups else 0.0
+        data['max_entries'] = self.max_entries
+        data['max_bytes'] = self.max_bytes
+        data['disk_dir'] = self.disk_dir
+        return data
+
+
+report_cache = ReportCache(**REPORT_CACHE)
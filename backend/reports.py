@@ -0,0 +1,146 @@
+# backend/reports.py
+"""按会计期间（年-月）取数的报表查询
+
+account_period_balances 按 (科目, 年度, 月份) 保存预先汇总好的发生额，
+所以任意期间（如第三季度、截至8月的本年累计）的科目余额只需把每个科目至多12行月度数据相加：
+
+    期初余额 = 年初余额 ± 起始月份之前各月的发生额
+    本期发生额 = 起止月份之间各月的发生额之和
+"""
+from decimal import Decimal
+
+from db_steps import Query
+
+ZERO = Decimal('0.00')
+
+
+def parse_period(value):
+    """解析 'YYYY-MM' 格式的会计期间，返回 (year, month)；格式错误时抛出 ValueError"""
+    try:
+        year_str, month_str = value.split('-')
+        year, month = int(year_str), int(month_str)
+    except (AttributeError, ValueError):
+        raise ValueError(f"无效的会计期间: {value}，应为 YYYY-MM 格式")
+    if not 1 <= month <= 12:
+        raise ValueError(f"无效的会计期间: {value}，月份应在1到12之间")
+    return year, month
+
+
+def parse_period_range(args):
+    """从请求参数中解析 from_period / to_period
+
+    两者都未提供时返回 None；只提供一个时另一个默认为同年的1月或12月。
+    返回 (year, from_month, to_month)，起止期间必须在同一会计年度内。
+    """
+    from_period = args.get('from_period')
+    to_period = args.get('to_period')
+    if not from_period and not to_period:
+        return None
+    if from_period:
+        from_year, from_month = parse_period(from_period)
+    if to_period:
+        to_year, to_month = parse_period(to_period)
+    if not from_period:
+        from_year, from_month = to_year, 1
+    if not to_period:
+        to_year, to_month = from_year, 12
+    if from_year != to_year:
+        raise ValueError("起止期间必须在同一会计年度内")
+    if from_month > to_month:
+        raise ValueError("起始期间不能晚于结束期间")
+    return from_year, from_month, to_month
+
+
+def closing_of(direction, opening, debit, credit):
+    """按余额方向计算期末余额"""
+    if direction == 'debit':
+        return opening + debit - credit
+    return opening - debit + credit
+
+
+def fetch_range_balances(year, from_month, to_month, level=None):
+    """查询指定年度某一期间的科目余额（步骤生成器）
+
+    返回的每行包含 account_code、account_name、level、balance_direction、
+    opening_balance、period_debit、period_credit、closing_balance。指定 level 时只查该级科目。
+    """
+    sql = """
+        SELECT
+            ab.account_code,
+            coa.account_name,
+            coa.level,
+            coa.balance_direction,
+            ab.opening_balance,
+            COALESCE(SUM(CASE WHEN p.fiscal_month < %s THEN p.period_debit END), 0) AS prior_debit,
+            COALESCE(SUM(CASE WHEN p.fiscal_month < %s THEN p.period_credit END), 0) AS prior_credit,
+            COALESCE(SUM(CASE WHEN p.fiscal_month >= %s THEN p.period_debit END), 0) AS period_debit,
+            COALESCE(SUM(CASE WHEN p.fiscal_month >= %s THEN p.period_credit END), 0) AS period_credit
+        FROM account_balances ab
+        JOIN chart_of_accounts coa ON ab.account_code = coa.account_code
+        LEFT JOIN account_period_balances p
+            ON p.account_code = ab.account_code
+           AND p.fiscal_year = ab.fiscal_year
+           AND p.fiscal_month <= %s
+        WHERE ab.fiscal_year = %s {level_condition}
+        GROUP BY ab.account_code, coa.account_name, coa.level, coa.balance_direction, ab.opening_balance
+        ORDER BY ab.account_code;
+    """
+    params = (from_month, from_month, from_month, from_month, to_month, year)
+    if level is None:
+        sql = sql.format(level_condition='')
+    else:
+        sql = sql.format(level_condition='AND coa.level = %s')
+        params += (level,)
+    result = yield Query(sql, params, fetch='all')
+    rows = []
+    for row in result:
+        direction = row['balance_direction']
+        opening = closing_of(direction, row['opening_balance'], row['prior_debit'], row['prior_credit'])
+        rows.append({
+            'account_code': row['account_code'],
+            'account_name': row['account_name'],
+            'level': row['level'],
+            'balance_direction': direction,
+            'opening_balance': opening,
+            'period_debit': row['period_debit'],
+            'period_credit': row['period_credit'],
+            'closing_balance': closing_of(direction, opening, row['period_debit'], row['period_credit']),
+        })
+    return rows
+
+
+def split_balance(direction, balance):
+    """把带方向的余额拆成 (借方金额, 贷方金额)"""
+    if direction == 'credit':
+        balance = -balance
+    if balance >= 0:
+        return balance, ZERO
+    return ZERO, -balance
+
+
+def compute_trial_balance(rows):
+    """根据一级科目的余额计算试算平衡表（行的结构见 trial_balance_rows）"""
+    opening_debit = opening_credit = ZERO
+    period_debit = period_credit = ZERO
+    closing_debit = closing_credit = ZERO
+    for row in rows:
+        if row['level'] != 1:
+            continue
+        d, c = split_balance(row['balance_direction'], row['opening_balance'])
+        opening_debit += d
+        opening_credit += c
+        period_debit += row['period_debit']
+        period_credit += row['period_credit']
+        d, c = split_balance(row['balance_direction'], row['closing_balance'])
+        closing_debit += d
+        closing_credit += c
+    return trial_balance_rows(opening_debit, opening_credit, period_debit, period_credit, closing_debit, closing_credit)
+
+
+def trial_balance_rows(opening_debit, opening_credit, period_debit, period_credit, closing_debit, closing_credit):
+    """试算平衡表：期初余额、本期发生额、期末余额三行，每行包含 item_name、total_debit、total_credit"""
+    return [
+        {'item_name': '期初余额', 'total_debit': opening_debit, 'total_credit': opening_credit},
+        {'item_name': '本期发生额', 'total_debit': period_debit, 'total_credit': period_credit},
+        {'item_name': '期末余额', 'total_debit': closing_debit, 'total_credit': closing_credit},
+    ]
@@ -0,0 +1,112 @@
+# backend/server.py
+"""生产环境启动器（gunicorn，多进程 + 多线程）
+
+app.py 末尾的 app.run(debug=True) 是单进程的开发服务器，只用于本地调试。生产环境使用：
+
+    python server.py                          # 使用 config.SERVER_CONFIG
+    SERVER_WORKERS=8 python server.py         # 环境变量覆盖配置
+    python server.py --workers 4 --threads 8  # 命令行参数优先级最高
+    python server.py --asgi                   # 以 uvicorn worker 运行 asgi_app（需安装 uvicorn）
+
+进程模型：
+- preload_app 为真时，主进程先导入应用、编译全部模板、加载科目树缓存和科目搜索索引，然后再 fork 出 worker，
+  这些只读数据在各 worker 间写时复制共享，worker 启动后的第一个请求不用再预热；
+- 主进程在 fork 之前关闭预热用的连接池，每个 worker 在 post_fork 中重置连接池，首次借用时创建自己的连接；
+- kill -HUP <主进程号> 平滑重启：逐个启动新 worker、旧 worker 处理完在途请求（最多 graceful_timeout 秒）后退出；
+  kill -TERM 平滑停止。修改代码后要重新预热，需用 kill -USR2 启动新的主进程再停止旧的。
+
+需要安装 gunicorn：pip install gunicorn
+"""
+import argparse
+import multiprocessing
+import os
+
+from config import SERVER_CONFIG
+
+
+def load_server_config(environ=os.environ):
+    """合并 config.SERVER_CONFIG 与 SERVER_<键名> 环境变量"""
+    options = dict(SERVER_CONFIG)
+    for key, default in SERVER_CONFIG.items():
+        value = environ.get(f"SERVER_{key.upper()}")
+        if value is None:
+            continue
+        if isinstance(default, bool):
+            options[key] = value.lower() in ('1', 'true', 'yes')
+        elif isinstance(default, int) or key == 'workers':
+            options[key] = int(value)
+        else:
+            options[key] = value
+    if not options.get('workers'):
+        options['workers'] = multiprocessing.cpu_count() * 2 + 1
+    return options
+
+
+def warm_up(app):
+    """在主进程中预热：编译全部模板、加载科目树并建立科目搜索索引（数据库不可用时跳过，由 worker 首次请求时加载）"""
+    from account_search import account_index
+    from account_tree import get_account_tree
+    from db_utils import close_pool
+
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    try:
+        tree = get_account_tree()
+        account_index.sync(tree)
+        print(f"科目树已预热：{len(tree.accounts)} 个科目")
+    except Exception as e:
+        print(f"科目树预热失败，将在 worker 中首次使用时加载: {e}")
+    finally:
+        # 预热用的连接不能被子进程继承
+        close_pool()
+
+
+def post_fork(server, worker):
+    """gunicorn 钩子：worker 进程启动后重置连接池"""
+    from db_utils import reset_pool_after_fork
+    reset_pool_after_fork()
+
+
+def run(options, asgi=False):
+    from gunicorn.app.base import BaseApplication
+
+    class FinancialApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+            if asgi:
+                self.cfg.set('worker_class', 'uvicorn.workers.UvicornWorker')
+            elif options.get('threads', 1) > 1:
+                self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('post_fork', post_fork)
+
+        def load(self):
+            # preload_app 为真时在主进程中调用一次，否则在每个 worker 中调用
+            if asgi:
+                from asgi_app import app
+            else:
+                from app import app
+            warm_up(app)
+            return app
+
+    FinancialApplication().run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="以多进程方式启动财务系统")
+    parser.add_argument('--bind')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--threads', type=int)
+    parser.add_argument('--timeout', type=int)
+    parser.add_argument('--no-preload', action='store_true', help="每个 worker 各自加载应用和缓存")
+    parser.add_argument('--asgi', action='store_true', help="运行 asgi_app（uvicorn worker）")
+    args = parser.parse_args()
+
+    options = load_server_config()
+    for key in ('bind', 'workers', 'threads', 'timeout'):
+        if getattr(args, key) is not None:
+            options[key] = getattr(args, key)
+    if args.no_preload:
+        options['preload_app'] = False
+    run(options, asgi=args.asgi)
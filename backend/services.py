@@ -0,0 +1,596 @@
+# backend/services.py
+"""接口的业务逻辑（与 Web 框架、数据库驱动无关）
+
+每个服务函数接收解析好的请求参数（args 为查询参数 MultiDict，data 为 JSON 请求体），
+写成 db_steps 约定的步骤生成器，最后 return 可直接序列化为 JSON 的结果。
+Flask 应用（app.py，同步）和 ASGI 应用（asgi_app.py，异步）只负责取连接、开事务、执行步骤和生成响应，
+两种服务方式共用这里的SQL和校验逻辑。
+
+参数不合法、记录不存在等可预期的错误抛出 ServiceError，由应用转换为对应状态码的错误响应；
+在第一次访问数据库之前抛出的 ServiceError 不会占用数据库连接（见 db_steps.start）。
+"""
+import base64
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+from balance_posting import load_voucher_entries, post_voucher_deltas, verify_account_summary
+from balance_rebuild import fetch_dirty_years
+from comparative import COMPARATIVE_REPORTS, comparative_report, parse_periods
+from config import (COMPARATIVE_MAX_PERIODS, INCREMENTAL_BALANCES, LEDGER_PAGE_SIZE, LEDGER_PAGE_SIZE_MAX,
+                    VOUCHER_BATCH_MAX, VOUCHER_PAGE_SIZE, VOUCHER_PAGE_SIZE_MAX)
+from db_steps import Call, Query
+from ledger import decode_ledger_cursor, ledger_page
+from period_close import ARCHIVE_TABLES, HOT_TABLES, closed_years
+from report_cache import GLOBAL_VERSION_YEAR, bump_ledger_version, report_cache
+from reports import compute_trial_balance, fetch_range_balances, parse_period_range
+from statement_engine import compute_statements
+from statements import (compute_balance_sheet, compute_cash_flow_statement, compute_income_statement,
+                        fetch_cash_flow_amounts)
+from voucher_batch import insert_voucher_batch, normalize_voucher, validate_accounts
+from voucher_numbers import peek_next_voucher_number
+
+
+class ServiceError(Exception):
+    """可预期的业务错误，status 为响应状态码，extra 为附加到错误响应中的字段"""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+    def to_dict(self):
+        return {"error": str(self), **self.extra}
+
+
+# --- 参数解析 ---
+
+def require_year(args):
+    year = args.get('year', type=int)
+    if not year:
+        raise ServiceError("必须提供年份参数")
+    return year
+
+
+def report_period(args):
+    """解析报表期间：优先使用 from_period/to_period，否则为 year 参数对应的全年；都没有时返回 None"""
+    try:
+        period_range = parse_period_range(args)
+    except ValueError as e:
+        raise ServiceError(str(e))
+    if period_range:
+        return period_range
+    year = args.get('year', type=int)
+    return (year, 1, 12) if year else None
+
+
+def require_period(args):
+    period_range = report_period(args)
+    if not period_range:
+        raise ServiceError("必须提供年份参数")
+    return period_range
+
+
+def require_open_years(years):
+    """已结账的会计年度不能再写入凭证和余额（步骤生成器）；数据库触发器也会拒绝，这里先给出明确的错误"""
+    closed = yield from closed_years(years)
+    if closed:
+        raise ServiceError(f"{'、'.join(str(y) for y in sorted(closed))}年度已结账，不能再修改")
+
+
+def is_fresh(args):
+    """请求带 ?fresh=1 时绕过报表缓存，强制重新计算"""
+    return args.get('fresh') in ('1', 'true')
+
+
+def parse_amount(value):
+    """把字符串金额转换为 Decimal；格式错误时抛出 ValueError"""
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"无效的金额: {value}")
+
+
+def parse_date(value):
+    return date.fromisoformat(value) if value else None
+
+
+def encode_voucher_cursor(row):
+    """把一行凭证的排序键 (voucher_date, voucher_number, id) 编码为分页游标"""
+    key = f"{row['voucher_date'].isoformat()}|{row['voucher_number']}|{row['id']}"
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+
+def decode_voucher_cursor(cursor_str):
+    """解析分页游标，返回 (voucher_date, voucher_number, id)；格式错误时抛出 ValueError"""
+    try:
+        key = base64.urlsafe_b64decode(cursor_str.encode('ascii')).decode('utf-8')
+        date_str, number, voucher_id = key.split('|')
+        return date.fromisoformat(date_str), int(number), int(voucher_id)
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+
+# --- 科目管理 ---
+
+def create_account(data):
+    if not data:
+        raise ServiceError("请求体中没有提供数据")
+    account_code = data.get('account_code')
+    account_name = data.get('account_name')
+    balance_direction = data.get('balance_direction')
+    if not all([account_code, account_name, balance_direction]):
+        raise ServiceError("缺少必要的字段")
+
+    yield Query("INSERT INTO chart_of_accounts (account_code, account_name, balance_direction) VALUES (%s, %s, %s)",
+                (account_code, account_name, balance_direction))
+    yield from bump_ledger_version([GLOBAL_VERSION_YEAR])
+    return {"message": "会计科目创建成功"}
+
+
+def update_account(account_code, data):
+    if not data:
+        raise ServiceError("请求体中没有提供数据")
+    fields_to_update = []
+    values = []
+    if 'account_name' in data:
+        fields_to_update.append("account_name = %s")
+        values.append(data['account_name'])
+    if 'balance_direction' in data:
+        fields_to_update.append("balance_direction = %s")
+        values.append(data['balance_direction'])
+    if not fields_to_update:
+        raise ServiceError("没有提供可更新的字段")
+
+    values.append(account_code)
+    yield Query(f"UPDATE chart_of_accounts SET {', '.join(fields_to_update)} WHERE account_code = %s", tuple(values))
+    yield from bump_ledger_version([GLOBAL_VERSION_YEAR])
+    return {"message": "会计科目更新成功"}
+
+
+def delete_account(account_code):
+    result = yield Query("DELETE FROM chart_of_accounts WHERE account_code = %s", (account_code,))
+    if result.rowcount == 0:
+        raise ServiceError("未找到该科目", 404)
+    yield from bump_ledger_version([GLOBAL_VERSION_YEAR])
+    return {"message": "删除成功"}
+
+
+# --- 期初余额 ---
+
+def get_account_balances(args):
+    """某年度所有科目的期初余额，以及该年度是否为初始年份"""
+    year = require_year(args)
+    row = yield Query("SELECT MIN(fiscal_year) as min_year FROM account_balances "
+                      "WHERE opening_balance != 0 OR period_debit != 0 OR period_credit != 0", fetch='one')
+    min_year = row['min_year'] if row and row['min_year'] is not None else year
+    balances = yield Query("""
+        SELECT coa.account_code, ab.opening_balance
+        FROM chart_of_accounts coa
+        LEFT JOIN account_balances ab ON coa.account_code = ab.account_code AND ab.fiscal_year = %s
+        ORDER BY coa.account_code;
+    """, (year,), fetch='all')
+    return {
+        "balances": {b['account_code']: b['opening_balance'] for b in balances},
+        "is_initial_year": year <= min_year
+    }
+
+
+def save_account_balances(data):
+    year = (data or {}).get('year')
+    balances = (data or {}).get('balances')
+    if not year or balances is None:
+        raise ServiceError("缺少年份或余额数据")
+    yield from require_open_years([year])
+
+    # 期末余额 = 期初余额 ± 本期发生额，所以期初余额变动多少，期末余额就同步变动多少
+    # （MySQL按从左到右的顺序赋值，计算期末余额时 opening_balance 仍是旧值）
+    if balances:
+        yield Query("""
+            INSERT INTO account_balances (account_code, fiscal_year, opening_balance, closing_balance)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                closing_balance = closing_balance + VALUES(opening_balance) - opening_balance,
+                opening_balance = VALUES(opening_balance)
+        """, [(item['account_code'], year, item['balance'], item['balance']) for item in balances], many=True)
+    yield from bump_ledger_version([year])
+    return {"message": f"{year}年度的期初余额已成功保存"}
+
+
+# --- 报表 ---
+
+def generate_summary(data):
+    """调用存储过程全量计算科目汇总数据"""
+    year = (data or {}).get('year')
+    if not year:
+        raise ServiceError("必须提供年份")
+    # 已结账年度的分录已归档，存储过程从热表汇总会得到零发生额
+    yield from require_open_years([year])
+    yield Call('proc_generate_account_summary', (year,))
+    yield from bump_ledger_version([year])
+    return {"message": f"{year}年度科目汇总数据已生成"}
+
+
+def dirty_years(args):
+    """上次重建科目余额之后又有过写入的年度（见 balance_rebuild）"""
+    years = yield from fetch_dirty_years()
+    return {"dirty_years": [year for year, _ in years]}
+
+
+def verify_summary(args):
+    year = require_year(args)
+    drifts = yield from verify_account_summary(year)
+    return {"year": year, "consistent": not drifts, "drifts": drifts}
+
+
+def account_summary(args):
+    """指定年度（或 from_period~to_period 期间）的科目汇总表"""
+    try:
+        period_range = parse_period_range(args)
+    except ValueError as e:
+        raise ServiceError(str(e))
+    year = args.get('year', type=int)
+    if not year and not period_range:
+        raise ServiceError("必须提供年份参数")
+
+    def compute():
+        if period_range:
+            # 按期间查询：由月度发生额表汇总，每个科目最多12行
+            rows = yield from fetch_range_balances(*period_range)
+            return [{
+                'account_code': r['account_code'],
+                'account_name': r['account_name'],
+                'opening_balance': r['opening_balance'],
+                'period_debit': r['period_debit'],
+                'period_credit': r['period_credit'],
+                'closing_balance': r['closing_balance'],
+            } for r in rows]
+        rows = yield Query("""
+            SELECT
+                ab.account_code,
+                coa.account_name,
+                ab.opening_balance,
+                ab.period_debit,
+                ab.period_credit,
+                ab.closing_balance
+            FROM account_balances ab
+            JOIN chart_of_accounts coa ON ab.account_code = coa.account_code
+            WHERE ab.fiscal_year = %s
+            ORDER BY ab.account_code;
+        """, (year,), fetch='all')
+        return rows
+
+    return (yield from report_cache.get_or_compute(
+        'account_summary', period_range[0] if period_range else year,
+        {'period_range': period_range}, compute, fresh=is_fresh(args)))
+
+
+def balance_sheet(args):
+    period_range = require_period(args)
+
+    def compute():
+        return compute_balance_sheet((yield from fetch_range_balances(*period_range)))
+
+    return (yield from report_cache.get_or_compute(
+        'balance_sheet', period_range[0], {'period_range': period_range}, compute, fresh=is_fresh(args)))
+
+
+def income_statement(args):
+    period_range = require_period(args)
+
+    def compute():
+        return compute_income_statement((yield from fetch_range_balances(*period_range)))
+
+    return (yield from report_cache.get_or_compute(
+        'income_statement', period_range[0], {'period_range': period_range}, compute, fresh=is_fresh(args)))
+
+
+def cash_flow_statement(args):
+    """现金流量表要查两次（余额和分录），调用方应在一致性快照的只读事务中执行"""
+    period_range = require_period(args)
+    return (yield from report_cache.get_or_compute(
+        'cash_flow_statement', period_range[0], {'period_range': period_range},
+        lambda: compute_cash_flow_statement(*period_range), fresh=is_fresh(args)))
+
+
+def statements(args):
+    """资产负债表、利润表、现金流量表和试算平衡表一起计算（见 statement_engine）
+
+    一级科目余额只查一次；与现金流量表相同，调用方应在一致性快照的只读事务中执行。
+    """
+    period_range = require_period(args)
+
+    def compute():
+        rows = yield from fetch_range_balances(*period_range, level=1)
+        cash_amounts = yield from fetch_cash_flow_amounts(*period_range)
+        return {
+            'year': period_range[0], 'from_month': period_range[1], 'to_month': period_range[2],
+            **compute_statements(rows, cash_amounts),
+        }
+
+    return (yield from report_cache.get_or_compute(
+        'statements', period_range[0], {'period_range': period_range}, compute, fresh=is_fresh(args)))
+
+
+def comparative(args):
+    """多期间对比报表：report 为 balance_sheet / income_statement / trial_balance，
+    years=2021,2022,2023 或 periods=2024-07~2024-09,2025-07~2025-09
+
+    各年度的账簿版本不同，结果不进入报表缓存；整个请求只有一条查询。
+    """
+    report = args.get('report')
+    if report not in COMPARATIVE_REPORTS:
+        raise ServiceError(f"不支持的对比报表: {report}（可选 {' / '.join(COMPARATIVE_REPORTS)}）")
+    try:
+        periods = parse_periods(args, COMPARATIVE_MAX_PERIODS)
+    except ValueError as e:
+        raise ServiceError(str(e))
+    return (yield from comparative_report(report, periods))
+
+
+def trial_balance(args):
+    try:
+        period_range = parse_period_range(args)
+    except ValueError as e:
+        raise ServiceError(str(e))
+    year = args.get('year', type=int)
+    if not year and not period_range:
+        raise ServiceError("必须提供年份参数")
+
+    def compute():
+        # 未指定期间时按全年计算
+        return compute_trial_balance((yield from fetch_range_balances(*(period_range or (year, 1, 12)))))
+
+    # 账簿未变化时直接使用缓存
+    return (yield from report_cache.get_or_compute(
+        'trial_balance', period_range[0] if period_range else year,
+        {'period_range': period_range}, compute, fresh=is_fresh(args)))
+
+
+def general_ledger(args):
+    """总分类账的一页
+
+    参数：year；scope 为 account（单科目，默认）/ subtree（科目及下级汇总）/ all（全部科目）；
+    account_code；limit 每页分录数；after 上一页返回的 next_cursor
+    """
+    year = require_year(args)
+    scope = args.get('scope', 'account')
+    account_code = args.get('account_code')
+    limit = max(1, min(args.get('limit', LEDGER_PAGE_SIZE, type=int), LEDGER_PAGE_SIZE_MAX))
+    try:
+        after = args.get('after')
+        after = decode_ledger_cursor(after) if after else None
+    except ValueError as e:
+        raise ServiceError(str(e))
+
+    try:
+        rows, next_cursor = yield from ledger_page(year, account_code, scope, after, limit)
+    except ValueError as e:
+        raise ServiceError(str(e))
+    return {"rows": rows, "next_cursor": next_cursor}
+
+
+# --- 凭证 ---
+
+def list_vouchers(args):
+    """分页获取凭证列表
+
+    按 (凭证日期, 凭证号, ID) 倒序做游标分页，参数：
+    - limit: 每页条数；after: 上一页返回的 next_cursor
+    - date_from / date_to: 日期范围（含两端）；type: 凭证字
+    - account_code: 只看包含该科目（或其下级科目）分录的凭证
+    - min_amount / max_amount: 凭证借方合计金额范围
+    """
+    try:
+        limit = args.get('limit', VOUCHER_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, VOUCHER_PAGE_SIZE_MAX))
+        after = args.get('after')
+        after_key = decode_voucher_cursor(after) if after else None
+        date_from = parse_date(args.get('date_from'))
+        date_to = parse_date(args.get('date_to'))
+        min_amount = args.get('min_amount')
+        max_amount = args.get('max_amount')
+        min_amount = parse_amount(min_amount) if min_amount else None
+        max_amount = parse_amount(max_amount) if max_amount else None
+    except ValueError as e:
+        raise ServiceError(f"查询参数错误: {e}")
+    voucher_type = args.get('type')
+    account_code = args.get('account_code')
+
+    conditions = []
+    params = []
+    if date_from:
+        conditions.append("v.voucher_date >= %s")
+        params.append(date_from)
+    if date_to:
+        conditions.append("v.voucher_date < %s")
+        params.append(date_to + timedelta(days=1))
+    if voucher_type:
+        conditions.append("v.voucher_type = %s")
+        params.append(voucher_type)
+    if account_code:
+        conditions.append("EXISTS (SELECT 1 FROM journal_entries f "
+                          "WHERE f.voucher_id = v.id AND f.fiscal_year = v.fiscal_year AND f.account_code LIKE %s)")
+        params.append(account_code + '%')
+    if after_key:
+        # 展开的行比较，便于MySQL在 (voucher_date, voucher_number, id) 上做范围扫描
+        conditions.append("""(v.voucher_date < %s
+                 OR (v.voucher_date = %s AND v.voucher_number < %s)
+                 OR (v.voucher_date = %s AND v.voucher_number = %s AND v.id < %s))""")
+        a_date, a_number, a_id = after_key
+        params.extend([a_date, a_date, a_number, a_date, a_number, a_id])
+    where_sql = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+    if min_amount is not None or max_amount is not None:
+        # 有金额条件时，合计金额必须先于分页算出：一次分组关联完成过滤和求和
+        having = []
+        having_params = []
+        if min_amount is not None:
+            having.append("total_amount >= %s")
+            having_params.append(min_amount)
+        if max_amount is not None:
+            having.append("total_amount <= %s")
+            having_params.append(max_amount)
+        vouchers = yield Query(f"""
+            SELECT
+                v.id,
+                v.voucher_date,
+                v.voucher_type,
+                v.voucher_number,
+                CONCAT(v.voucher_type, '-', LPAD(v.voucher_number, 4, '0')) as voucher_ref,
+                v.summary,
+                COALESCE(SUM(je.debit_amount), 0) as total_amount
+            FROM vouchers v
+            LEFT JOIN journal_entries je ON je.voucher_id = v.id AND je.fiscal_year = v.fiscal_year
+            {where_sql}
+            GROUP BY v.id, v.fiscal_year
+            HAVING {" AND ".join(having)}
+            ORDER BY v.voucher_date DESC, v.voucher_number DESC, v.id DESC
+            LIMIT %s;
+        """, tuple(params + having_params + [limit + 1]), fetch='all')
+    else:
+        # 先按索引顺序取出一页凭证头，再对这一页的凭证做一次分组求和
+        vouchers = yield Query(f"""
+            SELECT
+                v.id,
+                v.voucher_date,
+                v.voucher_type,
+                v.voucher_number,
+                CONCAT(v.voucher_type, '-', LPAD(v.voucher_number, 4, '0')) as voucher_ref,
+                v.summary
+            FROM vouchers v
+            {where_sql}
+            ORDER BY v.voucher_date DESC, v.voucher_number DESC, v.id DESC
+            LIMIT %s;
+        """, tuple(params + [limit + 1]), fetch='all')
+        if vouchers:
+            # 带上这一页凭证的年度（fiscal_year 即凭证日期的年度），分录表只扫描这些年度的分区
+            ids = [v['id'] for v in vouchers]
+            years = sorted({v['voucher_date'].year for v in vouchers})
+            rows = yield Query(f"""
+                SELECT voucher_id, SUM(debit_amount) as total_amount
+                FROM journal_entries
+                WHERE fiscal_year IN ({", ".join(["%s"] * len(years))})
+                  AND voucher_id IN ({", ".join(["%s"] * len(ids))})
+                GROUP BY voucher_id;
+            """, tuple(years + ids), fetch='all')
+            totals = {row['voucher_id']: row['total_amount'] for row in rows}
+            for v in vouchers:
+                v['total_amount'] = totals.get(v['id'], Decimal('0.00'))
+
+    next_cursor = None
+    if len(vouchers) > limit:
+        vouchers = vouchers[:limit]
+        next_cursor = encode_voucher_cursor(vouchers[-1])
+    return {"vouchers": vouchers, "next_cursor": next_cursor}
+
+
+def voucher_detail(voucher_id):
+    """单张凭证的凭证头和全部分录；已结账归档年度的凭证从归档表读取"""
+    vouchers_table, entries_table = HOT_TABLES
+    header = yield Query(f"SELECT * FROM {vouchers_table} WHERE id = %s", (voucher_id,), fetch='one')
+    if not header:
+        vouchers_table, entries_table = ARCHIVE_TABLES
+        header = yield Query(f"SELECT * FROM {vouchers_table} WHERE id = %s", (voucher_id,), fetch='one')
+    if not header:
+        raise ServiceError("未找到该凭证", 404)
+    entries = yield Query(f"""
+        SELECT je.*, coa.account_name
+        FROM {entries_table} je
+        JOIN chart_of_accounts coa ON je.account_code = coa.account_code
+        WHERE je.voucher_id = %s AND je.fiscal_year = %s
+        ORDER BY je.id;
+    """, (voucher_id, header['fiscal_year']), fetch='all')
+    return {"header": header, "entries": entries}
+
+
+def create_voucher(data, tree):
+    """创建一张凭证（调用方在写事务中执行）；tree 为当前的科目树"""
+    if not data:
+        raise ServiceError("请求体为空")
+    # 校验借贷平衡、金额格式，以及科目必须是已启用的末级科目
+    try:
+        voucher = normalize_voucher(data)
+        validate_accounts(voucher, tree)
+    except ValueError as e:
+        raise ServiceError(str(e))
+    # 前端显示的凭证号只是预览，实际号码在写入事务中分配
+    voucher['header']['number'] = None
+    yield from require_open_years([voucher['header']['date'].year])
+
+    # 分配凭证号，写入凭证主表和分录表，并在同一事务中把发生额累加到科目余额表
+    [(voucher_id, voucher_number)] = yield from insert_voucher_batch([voucher])
+    return {
+        "message": f"凭证创建成功，凭证号 {voucher['header']['type']}-{voucher_number:04d}",
+        "voucher_id": voucher_id,
+        "voucher_number": voucher_number
+    }
+
+
+def create_voucher_batch(data, tree):
+    """一次提交多张凭证
+
+    请求体为 {"vouchers": [凭证, ...]}（或直接是凭证数组），每张凭证的格式与 POST /api/vouchers 相同，
+    凭证号可省略（自动分配）。全部凭证在内存中校验通过后才在一个事务中写入：
+    凭证头一条多行 INSERT、分录一条多行 INSERT；任何一张不合法则全部不写入，并返回每张的错误。
+    """
+    items = data.get('vouchers') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise ServiceError("请求体应为非空的凭证数组")
+    if len(items) > VOUCHER_BATCH_MAX:
+        raise ServiceError(f"单次最多提交 {VOUCHER_BATCH_MAX} 张凭证")
+
+    vouchers = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            voucher = normalize_voucher(item)
+            validate_accounts(voucher, tree)
+            vouchers.append(voucher)
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+    if errors:
+        raise ServiceError(f"{len(errors)} 张凭证校验失败，未写入任何凭证", errors=errors)
+    yield from require_open_years({v['header']['date'].year for v in vouchers})
+
+    inserted = yield from insert_voucher_batch(vouchers)
+    return {
+        "message": f"成功创建 {len(inserted)} 张凭证",
+        "vouchers": [
+            {"voucher_id": voucher_id, "voucher_number": number,
+             "voucher_ref": f"{v['header']['type']}-{number:04d}"}
+            for v, (voucher_id, number) in zip(vouchers, inserted)
+        ]
+    }
+
+
+def delete_voucher(voucher_id):
+    """删除一张凭证（调用方在写事务中执行）"""
+    # 删除前先锁定凭证，并冲销它对科目余额的影响
+    voucher_date, entries = yield from load_voucher_entries(voucher_id)
+    if voucher_date is None:
+        raise ServiceError("未找到该凭证", 404)
+    yield from require_open_years([voucher_date.year])
+    if INCREMENTAL_BALANCES:
+        yield from post_voucher_deltas(voucher_date, entries, sign=-1)
+
+    # 分区表不能有外键，分录不会随凭证级联删除，先删分录再删凭证
+    yield Query("DELETE FROM journal_entries WHERE voucher_id = %s AND fiscal_year = %s", (voucher_id, voucher_date.year))
+    yield Query("DELETE FROM vouchers WHERE id = %s AND fiscal_year = %s", (voucher_id, voucher_date.year))
+    yield from bump_ledger_version([voucher_date.year])
+    return {"message": "凭证删除成功"}
+
+
+def next_voucher_number(args):
+    """根据日期和凭证字预览下一个凭证号（实际号码在保存凭证时分配）"""
+    voucher_date_str = args.get('date')
+    voucher_type = args.get('type')
+    if not voucher_date_str or not voucher_type:
+        raise ServiceError("必须提供日期和凭证字参数")
+    try:
+        voucher_date = date.fromisoformat(voucher_date_str)
+    except ValueError:
+        raise ServiceError(f"日期格式错误: {voucher_date_str}")
+
+    # 读取该凭证字、该月份的凭证号序列（单行主键查询）
+    next_number = yield from peek_next_voucher_number(voucher_type, voucher_date)
+    return {"next_number": next_number}
@@ -0,0 +1,170 @@
+# backend/statement_engine.py
+"""四张报表（资产负债表、利润表、现金流量表、试算平衡表）的一次性计算
+
+一个期间的一级科目余额只查询一次，装入按科目代码排序的整数（分）矩阵：
+
+    values[科目, 字段]，字段为 FIELDS 中的期初/期末余额（借方为正）、本期借贷方发生额、余额的借贷方拆分
+
+statements 和 reports 中的项目定义（科目代码前缀、合计行、行次公式）被编译为一个系数矩阵，
+每个报表数值（如“存货”的期末数、“营业利润”、试算平衡表的期末借方合计）是其中一行，
+于是四张报表的全部数值由一次矩阵乘法得到。科目代码有序，一个前缀对应一段连续的科目，用二分查找定位。
+金额以整数分计算，结果换回 Decimal，与逐项相加的结果完全相同。
+
+现金流量表的各项目金额需要逐张分析凭证（见 statements.fetch_cash_flow_amounts），只有期初、期末现金余额来自矩阵。
+
+需要安装 numpy（pip install numpy）；未安装时 compute_statements 逐张调用 statements / reports 中的计算函数，结果相同。
+"""
+from decimal import Decimal
+
+from reports import compute_trial_balance, trial_balance_rows
+from statements import (BALANCE_SHEET_ASSETS, BALANCE_SHEET_LIABILITIES_EQUITY, BALANCE_SHEET_TOTALS, CASH_ACCOUNTS,
+                        INCOME_STATEMENT_LINES, ZERO, balance_sheet_rows, cash_flow_rows, compute_balance_sheet,
+                        compute_income_statement, debit_positive, income_statement_rows, level_one, matches)
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时使用逐项计算
+    np = None
+
+FIELDS = ('opening', 'period_debit', 'period_credit', 'closing',
+          'opening_debit', 'opening_credit', 'closing_debit', 'closing_credit')
+FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+
+
+def to_cents(value):
+    return int(value.scaleb(2))
+
+
+def from_cents(value):
+    return Decimal(int(value)).scaleb(-2)
+
+
+def field_values(raw, sign):
+    """由按余额方向记录的 [期初, 本期借方, 本期贷方, 期末]（最后一维，单位分）算出 FIELDS 各字段
+
+    raw 为 (科目数, 4)，或多个期间叠成的 (期间数, 科目数, 4)；sign 为各科目的余额方向（借方 1，贷方 -1）。
+    """
+    opening = raw[..., 0] * sign
+    closing = raw[..., 3] * sign
+    return np.stack([
+        opening, raw[..., 1], raw[..., 2], closing,
+        np.maximum(opening, 0), np.maximum(-opening, 0), np.maximum(closing, 0), np.maximum(-closing, 0),
+    ], axis=-1)
+
+
+class BalanceMatrix:
+    """一级科目余额的整数矩阵，科目按代码排序
+
+    values 为 (科目数, 字段数)；多个期间一起计算时为 (期间数, 科目数, 字段数)，各期间的科目相同。
+    """
+
+    def __init__(self, codes, values):
+        self.codes = np.array(codes, dtype=str)
+        self.values = values
+
+    @classmethod
+    def from_rows(cls, rows):
+        """由 fetch_range_balances 的结果构造"""
+        rows = sorted(level_one(rows), key=lambda r: r['account_code'])
+        n = len(rows)
+        sign = np.fromiter((1 if r['balance_direction'] == 'debit' else -1 for r in rows), dtype=np.int64, count=n)
+        raw = np.fromiter((to_cents(r[field]) for r in rows
+                           for field in ('opening_balance', 'period_debit', 'period_credit', 'closing_balance')),
+                          dtype=np.int64, count=n * 4).reshape(n, 4)
+        return cls([r['account_code'] for r in rows], field_values(raw, sign))
+
+    def select(self, prefixes):
+        """代码匹配任一前缀的科目为 1、其余为 0 的向量；前缀重叠时同一科目只计一次"""
+        mask = np.zeros(len(self.codes), dtype=np.int64)
+        for prefix in prefixes:
+            lo, hi = np.searchsorted(self.codes, [prefix, prefix + '\uffff'])
+            mask[lo:hi] = 1
+        return mask
+
+    def term(self, prefixes, field, sign=1):
+        """取匹配科目某一字段之和的系数（科目数 x 字段数）"""
+        coef = np.zeros((len(self.codes), len(FIELDS)), dtype=np.int64)
+        coef[:, FIELD_INDEX[field]] = sign * self.select(prefixes)
+        return coef
+
+
+def compile_lines(matrix):
+    """把报表项目定义编译为系数，返回 {键: 系数}；合计行和公式行的系数是其组成项目系数的线性组合"""
+    coefs = {}
+    for side, lines, sign in (('asset', BALANCE_SHEET_ASSETS, 1), ('liability_equity', BALANCE_SHEET_LIABILITIES_EQUITY, -1)):
+        for field in ('opening', 'closing'):
+            for name, prefixes in lines:
+                if prefixes is None:
+                    coefs[(side, field, name)] = sum(coefs[(side, field, part)] for part in BALANCE_SHEET_TOTALS[name])
+                else:
+                    coefs[(side, field, name)] = matrix.term(prefixes, field, sign)
+
+    for line_index, _, (kind, spec) in INCOME_STATEMENT_LINES:
+        if kind == 'formula':
+            coefs[('income', line_index)] = sum(coefs[('income', i)] * s for i, s in spec)
+        else:
+            coefs[('income', line_index)] = matrix.term(spec, 'period_credit' if kind == 'credit' else 'period_debit')
+
+    # 空前缀匹配全部一级科目
+    for field in ('opening_debit', 'opening_credit', 'period_debit', 'period_credit', 'closing_debit', 'closing_credit'):
+        coefs[('trial', field)] = matrix.term(('',), field)
+
+    coefs[('cash', 'opening')] = matrix.term(CASH_ACCOUNTS, 'opening')
+    coefs[('cash', 'closing')] = matrix.term(CASH_ACCOUNTS, 'closing')
+    return coefs
+
+
+def evaluate(matrix):
+    """一次矩阵乘法求出全部报表数值，返回 {键: Decimal}；多个期间时返回每个期间一个字典的列表"""
+    coefs = compile_lines(matrix)
+    keys = list(coefs)
+    coef_matrix = np.stack([coefs[k].ravel() for k in keys])
+    if matrix.values.ndim == 2:
+        return {key: from_cents(total) for key, total in zip(keys, coef_matrix @ matrix.values.ravel())}
+    totals = matrix.values.reshape(len(matrix.values), -1) @ coef_matrix.T
+    return [{key: from_cents(total) for key, total in zip(keys, row)} for row in totals]
+
+
+def assemble(values, cash_amounts=None):
+    """由 evaluate 的结果排成各报表行；cash_amounts 为 None 时不含现金流量表"""
+    def column(side, field, lines):
+        return {name: values[(side, field, name)] for name, _ in lines}
+
+    result = {
+        'balance_sheet': balance_sheet_rows(
+            column('asset', 'opening', BALANCE_SHEET_ASSETS),
+            column('asset', 'closing', BALANCE_SHEET_ASSETS),
+            column('liability_equity', 'opening', BALANCE_SHEET_LIABILITIES_EQUITY),
+            column('liability_equity', 'closing', BALANCE_SHEET_LIABILITIES_EQUITY)),
+        'income_statement': income_statement_rows(
+            {line_index: values[('income', line_index)] for line_index, _, _ in INCOME_STATEMENT_LINES}),
+        'trial_balance': trial_balance_rows(*(values[('trial', field)] for field in (
+            'opening_debit', 'opening_credit', 'period_debit', 'period_credit', 'closing_debit', 'closing_credit'))),
+    }
+    if cash_amounts is not None:
+        result['cash_flow_statement'] = cash_flow_rows(
+            cash_amounts, values[('cash', 'opening')], values[('cash', 'closing')])
+    return result
+
+
+def compute_statements(rows, cash_amounts=None):
+    """由 fetch_range_balances 的结果和 fetch_cash_flow_amounts 的结果计算四张报表
+
+    返回 {balance_sheet, income_statement, cash_flow_statement, trial_balance}，各报表行与单独的报表接口相同；
+    cash_amounts 为 None 时不含现金流量表。
+    """
+    if np is not None:
+        return assemble(evaluate(BalanceMatrix.from_rows(rows)), cash_amounts)
+
+    result = {
+        'balance_sheet': compute_balance_sheet(rows),
+        'income_statement': compute_income_statement(rows),
+        'trial_balance': compute_trial_balance(rows),
+    }
+    if cash_amounts is not None:
+        balances = [r for r in level_one(rows) if matches(r['account_code'], CASH_ACCOUNTS)]
+        result['cash_flow_statement'] = cash_flow_rows(
+            cash_amounts,
+            sum((debit_positive(r, 'opening_balance') for r in balances), ZERO),
+            sum((debit_positive(r, 'closing_balance') for r in balances), ZERO))
+    return result
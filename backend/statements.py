@@ -0,0 +1,323 @@
+# backend/statements.py
+"""财务报表（资产负债表、利润表、现金流量表）的计算
+
+报表在每个请求内由科目余额直接计算，不再写入共享的报表结果表：
+不同用户同时查询不同年度时互不影响，也不会在报表表的锁上排队。
+
+报表项目与科目的对应关系按《小企业会计准则》的一级科目代码定义在下面的表中，
+科目体系不同时只需修改这些表。每个项目列出若干科目代码前缀，只匹配一级科目，避免与上级科目的汇总数重复计算。
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from db_steps import Query
+from period_close import ledger_tables
+from reports import fetch_range_balances
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+# --- 资产负债表 ---
+# (项目名称, 科目代码前缀)；前缀为 None 的是合计行，由 BALANCE_SHEET_TOTALS 中列出的项目相加
+BALANCE_SHEET_ASSETS = [
+    ('货币资金', ('1001', '1002', '1012')),
+    ('短期投资', ('1101',)),
+    ('应收票据', ('1121',)),
+    ('应收账款', ('1122',)),
+    ('预付账款', ('1123',)),
+    ('应收股利', ('1131',)),
+    ('应收利息', ('1132',)),
+    ('其他应收款', ('1221',)),
+    ('存货', ('1401', '1402', '1403', '1404', '1405', '1407', '1408', '1411', '1421', '4001', '4101', '4301')),
+    ('流动资产合计', None),
+    ('长期债券投资', ('1501',)),
+    ('长期股权投资', ('1511',)),
+    ('固定资产账面价值', ('1601', '1602')),
+    ('在建工程', ('1604',)),
+    ('工程物资', ('1605',)),
+    ('固定资产清理', ('1606',)),
+    ('无形资产', ('1701', '1702')),
+    ('长期待摊费用', ('1801',)),
+    ('非流动资产合计', None),
+    ('资产总计', None),
+]
+
+BALANCE_SHEET_LIABILITIES_EQUITY = [
+    ('短期借款', ('2001',)),
+    ('应付票据', ('2201',)),
+    ('应付账款', ('2202',)),
+    ('预收账款', ('2203',)),
+    ('应付职工薪酬', ('2211',)),
+    ('应交税费', ('2221',)),
+    ('应付利息', ('2231',)),
+    ('应付利润', ('2232',)),
+    ('其他应付款', ('2241',)),
+    ('流动负债合计', None),
+    ('长期借款', ('2501',)),
+    ('长期应付款', ('2701',)),
+    ('递延收益', ('2401',)),
+    ('非流动负债合计', None),
+    ('负债合计', None),
+    ('实收资本', ('3001',)),
+    ('资本公积', ('3002',)),
+    ('盈余公积', ('3101',)),
+    # 损益类科目（5开头）尚未结转到本年利润时，其余额也计入未分配利润，报表才能平衡
+    ('未分配利润', ('3103', '3104', '5')),
+    ('所有者权益合计', None),
+    ('负债和所有者权益总计', None),
+]
+
+# 合计行由哪些项目（或合计行）相加得到
+BALANCE_SHEET_TOTALS = {
+    '流动资产合计': ('货币资金', '短期投资', '应收票据', '应收账款', '预付账款', '应收股利', '应收利息', '其他应收款', '存货'),
+    '非流动资产合计': ('长期债券投资', '长期股权投资', '固定资产账面价值', '在建工程', '工程物资', '固定资产清理', '无形资产', '长期待摊费用'),
+    '资产总计': ('流动资产合计', '非流动资产合计'),
+    '流动负债合计': ('短期借款', '应付票据', '应付账款', '预收账款', '应付职工薪酬', '应交税费', '应付利息', '应付利润', '其他应付款'),
+    '非流动负债合计': ('长期借款', '长期应付款', '递延收益'),
+    '负债合计': ('流动负债合计', '非流动负债合计'),
+    '所有者权益合计': ('实收资本', '资本公积', '盈余公积', '未分配利润'),
+    '负债和所有者权益总计': ('负债合计', '所有者权益合计'),
+}
+
+# --- 利润表 ---
+# (行次, 项目名称, 取数方式)：'credit'/'debit' 取科目的本期贷方/借方发生额（结转损益的分录落在另一方，不影响取数），
+# 'formula' 为按行次加减的公式
+INCOME_STATEMENT_LINES = [
+    (1, '一、营业收入', ('credit', ('5001', '5051'))),
+    (2, '减：营业成本', ('debit', ('5401', '5402'))),
+    (3, '营业税金及附加', ('debit', ('5403',))),
+    (4, '销售费用', ('debit', ('5601',))),
+    (5, '管理费用', ('debit', ('5602',))),
+    (6, '财务费用', ('debit', ('5603',))),
+    (7, '加：投资收益', ('credit', ('5111',))),
+    (8, '二、营业利润', ('formula', ((1, 1), (2, -1), (3, -1), (4, -1), (5, -1), (6, -1), (7, 1)))),
+    (9, '加：营业外收入', ('credit', ('5301',))),
+    (10, '减：营业外支出', ('debit', ('5711',))),
+    (11, '三、利润总额', ('formula', ((8, 1), (9, 1), (10, -1)))),
+    (12, '减：所得税费用', ('debit', ('5801',))),
+    (13, '四、净利润', ('formula', ((11, 1), (12, -1)))),
+]
+
+# --- 现金流量表 ---
+CASH_ACCOUNTS = ('1001', '1002', '1012')
+
+# (项目名称, 现金流向, 对方科目前缀, 所属活动)；对方科目前缀为空的是“其他”项目，未匹配到的现金流量归入其中
+CASH_FLOW_LINES = [
+    ('销售产成品、商品、提供劳务收到的现金', 'in', ('5001', '5051', '1121', '1122', '2203'), 'operating'),
+    ('收到其他与经营活动有关的现金', 'in', (), 'operating'),
+    ('购买原材料、商品、接受劳务支付的现金', 'out', ('14', '2201', '2202', '1123', '5401', '5402'), 'operating'),
+    ('支付的职工薪酬', 'out', ('2211',), 'operating'),
+    ('支付的税费', 'out', ('2221', '5403', '5801'), 'operating'),
+    ('支付其他与经营活动有关的现金', 'out', (), 'operating'),
+    ('收回短期投资、长期债券投资和长期股权投资收到的现金', 'in', ('1101', '1501', '1511'), 'investing'),
+    ('取得投资收益收到的现金', 'in', ('5111', '1131', '1132'), 'investing'),
+    ('处置固定资产、无形资产和其他非流动资产收回的现金净额', 'in', ('16', '17', '18'), 'investing'),
+    ('短期投资、长期债券投资和长期股权投资支付的现金', 'out', ('1101', '1501', '1511'), 'investing'),
+    ('购建固定资产、无形资产和其他非流动资产支付的现金', 'out', ('16', '17', '18'), 'investing'),
+    ('取得借款收到的现金', 'in', ('2001', '2501'), 'financing'),
+    ('吸收投资者投资收到的现金', 'in', ('3001', '3002'), 'financing'),
+    ('偿还借款本金支付的现金', 'out', ('2001', '2501'), 'financing'),
+    ('偿还借款利息支付的现金', 'out', ('2231',), 'financing'),
+    ('分配利润支付的现金', 'out', ('2232', '3104'), 'financing'),
+]
+
+CASH_FLOW_SECTIONS = [
+    ('operating', '一、经营活动产生的现金流量', '经营活动产生的现金流量净额'),
+    ('investing', '二、投资活动产生的现金流量', '投资活动产生的现金流量净额'),
+    ('financing', '三、筹资活动产生的现金流量', '筹资活动产生的现金流量净额'),
+]
+
+
+def matches(code, prefixes):
+    return any(code.startswith(p) for p in prefixes)
+
+
+def debit_positive(row, field):
+    """把按科目余额方向记录的余额换算为“借方为正”的金额"""
+    value = row[field]
+    return value if row['balance_direction'] == 'debit' else -value
+
+
+def level_one(rows):
+    return [r for r in rows if r['level'] == 1]
+
+
+def sum_balances(rows, prefixes, field):
+    """一级科目中代码匹配前缀的科目余额之和（借方为正）"""
+    return sum((debit_positive(r, field) for r in rows if matches(r['account_code'], prefixes)), ZERO)
+
+
+def balance_sheet_column(rows, lines, sign, field):
+    """计算资产负债表一栏的各项目金额；sign 为 1（资产，借方为正）或 -1（负债和权益，贷方为正）"""
+    values = {}
+    for name, prefixes in lines:
+        if prefixes is None:
+            values[name] = sum((values[part] for part in BALANCE_SHEET_TOTALS[name]), ZERO)
+        else:
+            values[name] = sign * sum_balances(rows, prefixes, field)
+    return values
+
+
+def compute_balance_sheet(rows):
+    """根据 fetch_range_balances 的结果计算资产负债表（行的结构见 balance_sheet_rows）"""
+    rows = level_one(rows)
+    return balance_sheet_rows(
+        balance_sheet_column(rows, BALANCE_SHEET_ASSETS, 1, 'opening_balance'),
+        balance_sheet_column(rows, BALANCE_SHEET_ASSETS, 1, 'closing_balance'),
+        balance_sheet_column(rows, BALANCE_SHEET_LIABILITIES_EQUITY, -1, 'opening_balance'),
+        balance_sheet_column(rows, BALANCE_SHEET_LIABILITIES_EQUITY, -1, 'closing_balance'))
+
+
+def balance_sheet_rows(asset_opening, asset_closing, le_opening, le_closing):
+    """把各栏的 {项目名称: 金额} 排成报表行
+
+    每行包含 line_index、asset_item、asset_opening、asset_closing、
+    liability_equity_item、liability_equity_opening、liability_equity_closing，资产与负债和权益左右并列。
+    """
+    left = [name for name, _ in BALANCE_SHEET_ASSETS]
+    right = [name for name, _ in BALANCE_SHEET_LIABILITIES_EQUITY]
+    report = []
+    for index in range(max(len(left), len(right))):
+        row = {'line_index': index + 1}
+        if index < len(left):
+            name = left[index]
+            row.update(asset_item=name, asset_opening=asset_opening[name], asset_closing=asset_closing[name])
+        else:
+            row.update(asset_item=None, asset_opening=None, asset_closing=None)
+        if index < len(right):
+            name = right[index]
+            row.update(liability_equity_item=name, liability_equity_opening=le_opening[name],
+                       liability_equity_closing=le_closing[name])
+        else:
+            row.update(liability_equity_item=None, liability_equity_opening=None, liability_equity_closing=None)
+        report.append(row)
+    return report
+
+
+def compute_income_statement(rows):
+    """根据 fetch_range_balances 的结果计算利润表，每行包含 line_index、item、amount"""
+    rows = level_one(rows)
+    amounts = {}
+    for line_index, item, (kind, spec) in INCOME_STATEMENT_LINES:
+        if kind == 'formula':
+            amount = sum((amounts[i] * sign for i, sign in spec), ZERO)
+        else:
+            field = 'period_credit' if kind == 'credit' else 'period_debit'
+            amount = sum((r[field] for r in rows if matches(r['account_code'], spec)), ZERO)
+        amounts[line_index] = amount
+    return income_statement_rows(amounts)
+
+
+def income_statement_rows(amounts):
+    """把 {行次: 金额} 排成利润表行"""
+    return [{'line_index': line_index, 'item': item, 'amount': amounts[line_index]}
+            for line_index, item, _ in INCOME_STATEMENT_LINES]
+
+
+def fetch_cash_vouchers(year, from_month, to_month):
+    """查询期间内涉及现金科目的凭证分录，返回 {voucher_id: [(account_code, debit, credit), ...]}
+
+    只扫描该年度的分区；已归档的年度读取归档表。
+    """
+    vouchers_table, entries_table = yield from ledger_tables(year)
+    start = date(year, from_month, 1)
+    end = date(year + 1, 1, 1) if to_month == 12 else date(year, to_month + 1, 1)
+    cash_condition = " OR ".join(["c.account_code LIKE %s"] * len(CASH_ACCOUNTS))
+    rows = yield Query(f"""
+        SELECT je.voucher_id, je.account_code, je.debit_amount, je.credit_amount
+        FROM {entries_table} je
+        JOIN {vouchers_table} v ON v.id = je.voucher_id AND v.fiscal_year = je.fiscal_year
+        WHERE je.fiscal_year = %s AND v.voucher_date >= %s AND v.voucher_date < %s
+          AND EXISTS (SELECT 1 FROM {entries_table} c
+                      WHERE c.voucher_id = je.voucher_id AND c.fiscal_year = je.fiscal_year AND ({cash_condition}))
+        ORDER BY je.voucher_id, je.id
+    """, (year, start, end, *[p + '%' for p in CASH_ACCOUNTS]), fetch='all')
+    vouchers = defaultdict(list)
+    for r in rows:
+        vouchers[r['voucher_id']].append((r['account_code'], r['debit_amount'], r['credit_amount']))
+    return vouchers
+
+
+def allocate_cash(entries):
+    """把一张凭证的现金净流量按对方科目的金额比例分配，返回 [(对方科目, 现金金额)]
+
+    现金流入时对方科目是贷方分录，流出时是借方分录；只涉及现金科目之间划转的凭证不产生现金流量。
+    """
+    cash_delta = sum((d - c for code, d, c in entries if matches(code, CASH_ACCOUNTS)), ZERO)
+    if not cash_delta:
+        return []
+    counterparts = []
+    for code, d, c in entries:
+        if matches(code, CASH_ACCOUNTS):
+            continue
+        weight = (c - d) if cash_delta > 0 else (d - c)
+        if weight > 0:
+            counterparts.append((code, weight))
+    if not counterparts:
+        return [(None, cash_delta)]
+
+    total = sum(w for _, w in counterparts)
+    allocated = []
+    remaining = cash_delta
+    for code, weight in counterparts[:-1]:
+        amount = (cash_delta * weight / total).quantize(CENT)
+        allocated.append((code, amount))
+        remaining -= amount
+    allocated.append((counterparts[-1][0], remaining))
+    return allocated
+
+
+def classify_cash(code, amount):
+    """按对方科目和现金流向确定现金流量表项目"""
+    flow = 'in' if amount > 0 else 'out'
+    for item, line_flow, prefixes, _ in CASH_FLOW_LINES:
+        if line_flow == flow and prefixes and code and matches(code, prefixes):
+            return item
+    return '收到其他与经营活动有关的现金' if flow == 'in' else '支付其他与经营活动有关的现金'
+
+
+def fetch_cash_flow_amounts(year, from_month=1, to_month=12):
+    """逐张分析期间内涉及现金科目的凭证，返回 {现金流量表项目: 金额}（步骤生成器）；流出项目为正数"""
+    amounts = defaultdict(lambda: ZERO)
+    cash_vouchers = yield from fetch_cash_vouchers(year, from_month, to_month)
+    for entries in cash_vouchers.values():
+        for code, amount in allocate_cash(entries):
+            amounts[classify_cash(code, amount)] += abs(amount)
+    return amounts
+
+
+def compute_cash_flow_statement(year, from_month=1, to_month=12):
+    """计算现金流量表（直接法），每行包含 line_index、item、amount（步骤生成器）
+
+    金额由涉及现金科目的凭证逐张分析得到；期初、期末现金余额取自现金科目的余额。
+    """
+    range_rows = yield from fetch_range_balances(year, from_month, to_month)
+    balances = [r for r in level_one(range_rows) if matches(r['account_code'], CASH_ACCOUNTS)]
+    opening_cash = sum((debit_positive(r, 'opening_balance') for r in balances), ZERO)
+    closing_cash = sum((debit_positive(r, 'closing_balance') for r in balances), ZERO)
+    amounts = yield from fetch_cash_flow_amounts(year, from_month, to_month)
+    return cash_flow_rows(amounts, opening_cash, closing_cash)
+
+
+def cash_flow_rows(amounts, opening_cash, closing_cash):
+    """由各项目金额和期初、期末现金余额排成现金流量表行（含各活动的净额和现金净增加额）"""
+    report = []
+    net_increase = ZERO
+    for section, title, net_title in CASH_FLOW_SECTIONS:
+        report.append({'item': title, 'amount': None})
+        net = ZERO
+        for item, flow, _, line_section in CASH_FLOW_LINES:
+            if line_section != section:
+                continue
+            amount = amounts.get(item, ZERO)
+            report.append({'item': item, 'amount': amount})
+            net += amount if flow == 'in' else -amount
+        report.append({'item': net_title, 'amount': net})
+        net_increase += net
+    report.append({'item': '四、现金净增加额', 'amount': net_increase})
+    report.append({'item': '加：期初现金余额', 'amount': opening_cash})
+    report.append({'item': '五、期末现金余额', 'amount': closing_cash})
+    for index, row in enumerate(report, start=1):
+        row['line_index'] = index
+    return report
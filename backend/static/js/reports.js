@@ -12,6 +12,16 @@ $(document).ready(function() {
         return parseFloat(value).toFixed(2);
     }
 
+    // 可选的期间参数：填写了起止月份时，科目汇总表和试算平衡表按期间查询
+    function periodQuery() {
+        let query = '';
+        const fromPeriod = $('#report-from-period').val();
+        const toPeriod = $('#report-to-period').val();
+        if (fromPeriod) query += `&from_period=${fromPeriod}`;
+        if (toPeriod) query += `&to_period=${toPeriod}`;
+        return query;
+    }
+
     // ==================== 按钮点击样式切换逻辑 ====================
     $reportButtons.on('click', function() {
         $reportButtons.removeClass('btn-primary');
@@ -44,7 +54,7 @@ $(document).ready(function() {
 
     function fetchAndDisplaySummary(year) {
         $.ajax({
-            url: `/api/reports/account_summary?year=${year}`,
+            url: `/api/reports/account_summary?year=${year}${periodQuery()}`,
             type: 'GET',
             success: function(data) {
                 let html = '<h3>科目汇总表</h3><table class="table"><thead><tr><th>科目代码</th><th>科目名称</th><th>期初余额</th><th>本期借方</th><th>本期贷方</th><th>期末余额</th></tr></thead><tbody>';
@@ -75,7 +85,7 @@ $(document).ready(function() {
             return;
         }
         $.ajax({
-            url: `/api/reports/balance_sheet?year=${year}`,
+            url: `/api/reports/balance_sheet?year=${year}${periodQuery()}`,
             type: 'GET',
             success: function(data) {
                 let html = '<h3>资产负债表</h3><table class="table"><thead><tr><th>资产项目</th><th>期初数</th><th>期末数</th><th>负债和所有者权益</th><th>期初数</th><th>期末数</th></tr></thead><tbody>';
@@ -106,7 +116,7 @@ $(document).ready(function() {
             return;
         }
         $.ajax({
-            url: `/api/reports/income_statement?year=${year}`,
+            url: `/api/reports/income_statement?year=${year}${periodQuery()}`,
             type: 'GET',
             success: function(data) {
                 let html = `<h3>利润表</h3><p style="text-align:center;">${year}年度</p><table class="table"><thead><tr><th>项目</th><th>行次</th><th>金额</th></tr></thead><tbody>`;
@@ -134,7 +144,7 @@ $(document).ready(function() {
             return;
         }
         $.ajax({
-            url: `/api/reports/cash_flow_statement?year=${year}`,
+            url: `/api/reports/cash_flow_statement?year=${year}${periodQuery()}`,
             type: 'GET',
             success: function(data) {
                 let html = '<h3>现金流量表</h3><table class="table"><thead><tr><th>项目</th><th>金额</th></tr></thead><tbody>';
@@ -163,7 +173,7 @@ $(document).ready(function() {
         $displayArea.html('<p>正在进行试算平衡检查...</p>');
 
         $.ajax({
-            url: `/api/reports/trial_balance?year=${year}`,
+            url: `/api/reports/trial_balance?year=${year}${periodQuery()}`,
             type: 'GET',
             success: function(data) {
                 let html = '<h3>一级科目试算平衡表</h3><table class="table"><thead><tr><th>项目</th><th style="text-align: right;">借方总额</th><th style="text-align: right;">贷方总额</th><th>平衡状态</th></tr></thead><tbody>';
@@ -6,7 +6,7 @@ $(document).ready(function() {
     const $voucherDate = $('#voucher-date');
     const $voucherType = $('#voucher-type');
     const $voucherNumber = $('#voucher-number');
-    let accountOptions = '';
+    let rowCounter = 0;
 
     // --- 1. 自动获取下一个凭证号的核心函数 ---
     function fetchNextVoucherNumber() {
@@ -26,10 +26,16 @@ $(document).ready(function() {
 
     // --- 2. 动态增加一行 ---
     function addNewRow() {
+        rowCounter += 1;
+        const listId = `account-options-${rowCounter}`;
         const newRowHtml = `
             <tr>
                 <td><input type="text" class="summary-input"></td>
-                <td><select class="account-select">${accountOptions}</select></td>
+                <td>
+                    <input type="text" class="account-input" list="${listId}" autocomplete="off"
+                           placeholder="科目代码、名称或拼音首字母">
+                    <datalist id="${listId}"></datalist>
+                </td>
                 <td><input type="number" class="debit-input" value="0.00" step="0.01"></td>
                 <td><input type="number" class="credit-input" value="0.00" step="0.01"></td>
                 <td><button type="button" class="btn btn-danger btn-delete-row">删除</button></td>
@@ -50,29 +56,38 @@ $(document).ready(function() {
         $totalCredit.text(totalCredit.toFixed(2));
     }
 
-    // --- 4. 初始化页面 ---
-    function initializePage() {
-        // 设置默认日期为今天
-        const today = new Date().toISOString().split('T')[0];
-        $voucherDate.val(today);
-
-        // 获取末级科目
+    // --- 4. 科目搜索（服务端按代码、名称、拼音首字母匹配末级科目）---
+    function searchAccounts($input) {
+        const query = $input.val().trim();
+        const requestId = ($input.data('requestId') || 0) + 1;
+        $input.data('requestId', requestId);
         $.ajax({
-            url: '/api/accounts/leaf',
+            url: '/api/accounts/search',
             type: 'GET',
+            data: { q: query, limit: 20 },
             success: function(accounts) {
-                accounts.forEach(function(acc) {
-                    accountOptions += `<option value="${acc.account_code}">${acc.account_code} ${acc.account_name}</option>`;
+                // 只显示最后一次输入的结果，先发出的慢请求返回时直接丢弃
+                if ($input.data('requestId') !== requestId) return;
+                const options = accounts.map(function(acc) {
+                    return `<option value="${acc.account_code}">${acc.account_code} ${acc.account_name}</option>`;
                 });
-                addNewRow();
-                addNewRow();
-                // 在获取科目后，立即获取默认的'记'字号凭证号
-                fetchNextVoucherNumber();
+                $input.siblings('datalist').html(options.join(''));
             }
         });
     }
 
-    // --- 5. 绑定所有事件 ---
+    // --- 5. 初始化页面 ---
+    function initializePage() {
+        // 设置默认日期为今天
+        const today = new Date().toISOString().split('T')[0];
+        $voucherDate.val(today);
+
+        addNewRow();
+        addNewRow();
+        fetchNextVoucherNumber();
+    }
+
+    // --- 6. 绑定所有事件 ---
     // 当日期或凭证字改变时，重新获取凭证号
     $voucherDate.on('change', fetchNextVoucherNumber);
     $voucherType.on('change', fetchNextVoucherNumber);
@@ -93,6 +108,13 @@ $(document).ready(function() {
     // 实时更新合计
     $tableBody.on('input', '.debit-input, .credit-input', updateTotals);
 
+    // 输入科目时搜索（停止输入 150 毫秒后发出请求）
+    $tableBody.on('input focus', '.account-input', function() {
+        const $input = $(this);
+        clearTimeout($input.data('searchTimer'));
+        $input.data('searchTimer', setTimeout(function() { searchAccounts($input); }, 150));
+    });
+
     // 保存凭证
     $('#voucher-form').on('submit', function(event) {
         event.preventDefault();
@@ -125,7 +147,7 @@ $(document).ready(function() {
             if (debit > 0 || credit > 0) {
                 voucherData.entries.push({
                     summary: $row.find('.summary-input').val(),
-                    account_code: $row.find('.account-select').val(),
+                    account_code: $row.find('.account-input').val().trim().split(/\s+/)[0],
                     debit: debit,
                     credit: credit
                 });
@@ -148,6 +170,6 @@ $(document).ready(function() {
         });
     });
     
-    // --- 6. 页面启动 ---
+    // --- 7. 页面启动 ---
     initializePage();
 });
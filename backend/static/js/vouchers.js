@@ -7,13 +7,22 @@ $(document).ready(function() {
         return parseFloat(value).toFixed(2);
     }
 
-    function loadVouchers() {
+    const $loadMore = $('#btn-load-more');
+    let nextCursor = null;
+
+    function loadVouchers(append) {
+        let url = '/api/vouchers';
+        if (append && nextCursor) {
+            url += `?after=${encodeURIComponent(nextCursor)}`;
+        }
         $.ajax({
-            url: '/api/vouchers',
+            url: url,
             type: 'GET',
-            success: function(vouchers) {
-                $tableBody.empty();
-                vouchers.forEach(function(voucher) {
+            success: function(data) {
+                if (!append) {
+                    $tableBody.empty();
+                }
+                data.vouchers.forEach(function(voucher) {
                     const row = `
                         <tr data-id="${voucher.id}" class="view-details" style="cursor: pointer;">
                             <td>${voucher.voucher_date}</td>
@@ -27,10 +36,17 @@ $(document).ready(function() {
                     `;
                     $tableBody.append(row);
                 });
+                // 还有下一页时才显示“加载更多”
+                nextCursor = data.next_cursor;
+                $loadMore.toggle(!!nextCursor);
             }
         });
     }
 
+    $loadMore.on('click', function() {
+        loadVouchers(true);
+    });
+
     // --- 查看凭证详情 ---
     $tableBody.on('click', '.view-details', function(event) {
         if ($(event.target).hasClass('btn-delete')) {
@@ -98,6 +114,6 @@ $(document).ready(function() {
     });
 
     // --- 初始加载 ---
-    loadVouchers();
+    loadVouchers(false);
 });
 
@@ -0,0 +1,189 @@
+# backend/voucher_import.py
+"""凭证批量导入：流式解析 NDJSON/CSV，按批次在事务中写入
+
+支持两种输入格式：
+- ndjson: 每行一张凭证，格式与 POST /api/vouchers 的请求体相同
+- csv: 每行一条分录，列为 date,type,number,summary,account_code,entry_summary,debit,credit，
+  相邻且 (date, type, number) 相同的行属于同一张凭证
+
+NDJSON 中可以省略凭证号，由系统按凭证字和月份自动编号；CSV 依靠 number 列区分凭证，必须填写。
+导入的凭证号会推进凭证号序列，之后新建的凭证从已导入的最大号之后继续编号。
+
+输入按行流式解析，不会把整个文件读入内存；每 batch_size 张凭证一个事务，
+一个批次写入失败时回滚后逐张重试，只有出错的凭证被记录为失败，不影响其余凭证。
+
+命令行用法：
+
+    python voucher_import.py vouchers.ndjson
+    python voucher_import.py vouchers.csv --format csv --batch-size 1000
+"""
+import csv
+import json
+
+from config import IMPORT_BATCH_SIZE, IMPORT_MAX_ERRORS
+from account_tree import get_account_tree
+from db_steps import run_sync
+from voucher_batch import insert_voucher_batch, normalize_voucher, validate_accounts, voucher_ref
+
+CSV_COLUMNS = ['date', 'type', 'number', 'summary', 'account_code', 'entry_summary', 'debit', 'credit']
+
+
+def iter_ndjson(lines):
+    """逐行解析 NDJSON，产出 (行号, 凭证数据或解析错误)"""
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f"JSON格式错误: {e}")
+
+
+def iter_csv(lines):
+    """逐行解析 CSV，把相邻且 (date, type, number) 相同的分录行合并为一张凭证，产出 (起始行号, 凭证数据)"""
+    reader = csv.DictReader(lines)
+    missing = [c for c in CSV_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV缺少列: {', '.join(missing)}")
+
+    current_key = None
+    current = None
+    start_line = None
+    for row in reader:
+        key = (row['date'], row['type'], row['number'])
+        if key != current_key:
+            if current is not None:
+                yield start_line, current
+            current_key = key
+            start_line = reader.line_num
+            current = {
+                'header': {'date': row['date'], 'type': row['type'], 'number': row['number'], 'summary': row['summary']},
+                'entries': [],
+            }
+        current['entries'].append({
+            'account_code': row['account_code'],
+            'summary': row['entry_summary'],
+            'debit': row['debit'],
+            'credit': row['credit'],
+        })
+    if current is not None:
+        yield start_line, current
+
+
+def parse_stream(lines, fmt):
+    if fmt == 'ndjson':
+        return iter_ndjson(lines)
+    if fmt == 'csv':
+        return iter_csv(lines)
+    raise ValueError(f"不支持的导入格式: {fmt}")
+
+
+class ImportResult:
+    """导入结果统计；errors 最多保留 max_errors 条明细"""
+
+    def __init__(self, max_errors=IMPORT_MAX_ERRORS):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def add_error(self, line_no, ref, error):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line_no, 'voucher': ref, 'error': str(error)})
+
+    def to_dict(self):
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def import_vouchers(conn, records, batch_size=IMPORT_BATCH_SIZE, result=None):
+    """把 (行号, 凭证数据) 序列写入数据库，返回 ImportResult
+
+    conn 为从连接池借出的连接，每个批次单独提交。
+    分录科目按缓存的科目树校验（必须是已启用的末级科目）。
+    输入在中途出错（如 CSV 缺少列、编码错误）时异常照常抛出，之前的批次已经提交；
+    调用方可传入自己的 result，以便在异常时仍能报告已写入的数量和错误明细。
+    """
+    tree = get_account_tree()
+    if result is None:
+        result = ImportResult()
+    batch = []
+    for line_no, data in records:
+        if isinstance(data, Exception):
+            result.add_error(line_no, None, data)
+            continue
+        try:
+            voucher = normalize_voucher(data)
+            validate_accounts(voucher, tree)
+        except ValueError as e:
+            header = data.get('header') if isinstance(data, dict) else None
+            ref = f"{header.get('type')}-{header.get('number')}" if isinstance(header, dict) else None
+            result.add_error(line_no, ref, e)
+            continue
+        batch.append((line_no, voucher))
+        if len(batch) >= batch_size:
+            _write_batch(conn, batch, result)
+            batch = []
+    if batch:
+        _write_batch(conn, batch, result)
+    return result
+
+
+def _write_batch(conn, batch, result):
+    cursor = conn.cursor()
+    try:
+        try:
+            conn.start_transaction()
+            run_sync(cursor, insert_voucher_batch([v for _, v in batch]))
+            conn.commit()
+            result.imported += len(batch)
+            return
+        except Exception:
+            conn.rollback()
+
+        # 整批失败：逐张重试，把出错的凭证找出来
+        for line_no, voucher in batch:
+            try:
+                conn.start_transaction()
+                run_sync(cursor, insert_voucher_batch([voucher]))
+                conn.commit()
+                result.imported += 1
+            except Exception as e:
+                conn.rollback()
+                result.add_error(line_no, voucher_ref(voucher), e)
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from db_utils import get_db_connection
+
+    parser = argparse.ArgumentParser(description="凭证批量导入")
+    parser.add_argument('file')
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default=None,
+                        help="默认按文件扩展名判断")
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or ('csv' if args.file.lower().endswith('.csv') else 'ndjson')
+    conn = get_db_connection()
+    if conn is None:
+        raise SystemExit("数据库连接失败")
+
+    started = time.perf_counter()
+    with conn, open(args.file, encoding='utf-8-sig', newline='') as f:
+        result = import_vouchers(conn, parse_stream(f, fmt), batch_size=args.batch_size)
+    elapsed = time.perf_counter() - started
+
+    for error in result.errors:
+        print(f"第{error['line']}行 {error['voucher'] or ''}: {error['error']}")
+    print(f"导入完成：成功 {result.imported} 张，失败 {result.failed} 张，用时 {elapsed:.1f} 秒")
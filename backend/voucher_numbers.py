@@ -0,0 +1,174 @@
+# backend/voucher_numbers.py
+"""凭证号分配
+
+凭证号按 (凭证字, 年, 月) 连续编号，当前最大号保存在 voucher_sequences 表中，每个序列一行。
+分配时用一条语句完成“加一并取回新值”：
+
+    INSERT ... ON DUPLICATE KEY UPDATE last_number = LAST_INSERT_ID(last_number + n)
+
+该语句在凭证写入事务中执行，序列行的行锁持有到提交：
+- 并发的两张凭证不可能拿到同一个号；
+- 事务回滚时号码的增加一起回滚，不会跳号；
+- 不同凭证字、不同月份的序列互不阻塞。
+vouchers 上的唯一键 uk_voucher_number (voucher_type, voucher_month, voucher_number) 兜底防止重号。
+
+命令行用法（并发压测：多个线程同时分配号码，检查既不重号也不跳号）：
+
+    python voucher_numbers.py stress --workers 50 --per-worker 20
+"""
+from collections import defaultdict
+
+from db_steps import Query
+
+
+def sequence_key(voucher_type, voucher_date):
+    return voucher_type, voucher_date.year, voucher_date.month
+
+
+def allocate_voucher_numbers(voucher_type, voucher_date, count=1):
+    """在当前事务中为该凭证字、该月份分配 count 个连续凭证号，返回第一个号"""
+    result = yield Query("""
+        INSERT INTO voucher_sequences (voucher_type, fiscal_year, fiscal_month, last_number)
+        VALUES (%s, %s, %s, LAST_INSERT_ID(%s))
+        ON DUPLICATE KEY UPDATE last_number = LAST_INSERT_ID(last_number + %s)
+    """, (*sequence_key(voucher_type, voucher_date), count, count))
+    last_number = result.lastrowid
+    if not last_number:
+        row = yield Query("SELECT LAST_INSERT_ID() AS last_number", fetch='one')
+        last_number = row['last_number']
+    return last_number - count + 1
+
+
+def reserve_voucher_numbers(max_numbers):
+    """导入带凭证号的历史凭证时，把序列推进到不小于已使用的最大号
+
+    max_numbers 为 {(voucher_type, year, month): 最大凭证号}。
+    """
+    if not max_numbers:
+        return
+    keys = sorted(max_numbers)
+    placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(keys))
+    yield Query(
+        f"INSERT INTO voucher_sequences (voucher_type, fiscal_year, fiscal_month, last_number) VALUES {placeholders} "
+        "ON DUPLICATE KEY UPDATE last_number = GREATEST(last_number, VALUES(last_number))",
+        tuple(value for key in keys for value in (*key, max_numbers[key]))
+    )
+
+
+def assign_voucher_numbers(vouchers):
+    """为一批已校验的凭证确定凭证号，返回与 vouchers 顺序对应的号码列表（不修改 vouchers）
+
+    凭证头的 number 为 None 时按序列自动分配；已给出号码的凭证只推进序列。
+    本批涉及的全部序列（无论是推进还是分配）按序列键的全局顺序逐个加锁，避免并发批次之间死锁：
+    相邻的只需推进的序列合并为一条多行 INSERT（按 VALUES 的顺序加锁），遇到需要分配的序列时先把它之前
+    （含它自己的推进）写出，再为它分配号码。
+    """
+    pending = defaultdict(list)   # 序列 -> 需要自动编号的凭证下标
+    explicit = {}                 # 序列 -> 已给出的最大号
+    for index, v in enumerate(vouchers):
+        h = v['header']
+        key = sequence_key(h['type'], h['date'])
+        if h['number'] is None:
+            pending[key].append(index)
+        else:
+            explicit[key] = max(explicit.get(key, 0), h['number'])
+
+    numbers = [v['header']['number'] for v in vouchers]
+    reserve = {}
+    for key in sorted(set(explicit) | set(pending)):
+        if key in explicit:
+            reserve[key] = explicit[key]
+        if key not in pending:
+            continue
+        yield from reserve_voucher_numbers(reserve)
+        reserve = {}
+        indexes = pending[key]
+        voucher_date = vouchers[indexes[0]]['header']['date']
+        first = yield from allocate_voucher_numbers(key[0], voucher_date, len(indexes))
+        for offset, index in enumerate(indexes):
+            numbers[index] = first + offset
+    yield from reserve_voucher_numbers(reserve)
+    return numbers
+
+
+def peek_next_voucher_number(voucher_type, voucher_date):
+    """预览下一个凭证号（主键查询，不加锁；实际号码在保存时分配）"""
+    row = yield Query(
+        "SELECT last_number FROM voucher_sequences WHERE voucher_type = %s AND fiscal_year = %s AND fiscal_month = %s",
+        sequence_key(voucher_type, voucher_date), fetch='one'
+    )
+    return (row['last_number'] if row else 0) + 1
+
+
+if __name__ == '__main__':
+    import argparse
+    import threading
+    import time
+    from datetime import date
+
+    import mysql.connector
+
+    from config import DB_CONFIG
+    from db_steps import run_sync
+
+    parser = argparse.ArgumentParser(description="凭证号分配并发压测")
+    parser.add_argument('command', choices=['stress'])
+    parser.add_argument('--workers', type=int, default=50)
+    parser.add_argument('--per-worker', type=int, default=20)
+    parser.add_argument('--type', default='压测', help="压测使用的凭证字，结束后删除其序列")
+    args = parser.parse_args()
+
+    test_date = date(1900, 1, 1)  # 不会与真实凭证冲突的月份
+    allocated = []
+    errors = []
+    lock = threading.Lock()
+
+    def clear_test_sequence():
+        conn = mysql.connector.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM voucher_sequences WHERE voucher_type = %s AND fiscal_year = %s",
+                       (args.type, test_date.year))
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+    def worker():
+        # 每个线程直接建立自己的连接，使并发数不受连接池大小限制
+        try:
+            conn = mysql.connector.connect(**DB_CONFIG)
+        except mysql.connector.Error as e:
+            errors.append(f"数据库连接失败: {e}")
+            return
+        cursor = conn.cursor()
+        try:
+            for _ in range(args.per_worker):
+                conn.start_transaction()
+                number = run_sync(cursor, allocate_voucher_numbers(args.type, test_date))
+                conn.commit()
+                with lock:
+                    allocated.append(number)
+        except Exception as e:
+            conn.rollback()
+            errors.append(str(e))
+        finally:
+            cursor.close()
+            conn.close()
+
+    clear_test_sequence()
+    threads = [threading.Thread(target=worker) for _ in range(args.workers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    clear_test_sequence()
+
+    expected = list(range(1, args.workers * args.per_worker + 1))
+    ok = sorted(allocated) == expected and not errors
+    print(f"分配 {len(allocated)} 个号码，用时 {elapsed:.2f} 秒（{len(allocated) / elapsed:.0f} 个/秒）")
+    for e in errors[:10]:
+        print(f"错误: {e}")
+    print("结果: 无重号、无跳号" if ok else "结果: 存在重号、跳号或错误")
+    raise SystemExit(0 if ok else 1)
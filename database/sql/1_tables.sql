@@ -35,6 +35,55 @@ CREATE TABLE `account_balances` (
   UNIQUE KEY `uk_account_year` (`account_code`,`fiscal_year`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='科目余额表';
 
+-- ----------------------------
+-- Table structure for account_period_balances
+-- ----------------------------
+DROP TABLE IF EXISTS `account_period_balances`;
+CREATE TABLE `account_period_balances` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `account_code` varchar(16) NOT NULL COMMENT '科目代码',
+  `fiscal_year` int NOT NULL COMMENT '会计年度',
+  `fiscal_month` tinyint NOT NULL COMMENT '会计期间（月份）',
+  `period_debit` decimal(12,2) NOT NULL DEFAULT '0.00' COMMENT '本月借方发生额',
+  `period_credit` decimal(12,2) NOT NULL DEFAULT '0.00' COMMENT '本月贷方发生额',
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_account_period` (`account_code`,`fiscal_year`,`fiscal_month`),
+  KEY `idx_period` (`fiscal_year`,`fiscal_month`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='科目月度发生额表';
+
+-- ----------------------------
+-- Table structure for ledger_versions
+-- ----------------------------
+DROP TABLE IF EXISTS `ledger_versions`;
+CREATE TABLE `ledger_versions` (
+  `fiscal_year` int NOT NULL COMMENT '会计年度（0 表示全局，如科目变动）',
+  `version` bigint NOT NULL DEFAULT '0' COMMENT '版本号，每次相关数据写入时加一',
+  PRIMARY KEY (`fiscal_year`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='账簿版本表（报表缓存失效用）';
+
+-- ----------------------------
+-- Table structure for balance_rebuilds
+-- ----------------------------
+DROP TABLE IF EXISTS `balance_rebuilds`;
+CREATE TABLE `balance_rebuilds` (
+  `fiscal_year` int NOT NULL COMMENT '会计年度',
+  `ledger_version` bigint NOT NULL DEFAULT '0' COMMENT '重建完成时该年度的账簿版本',
+  `rebuilt_at` datetime DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '重建时间',
+  PRIMARY KEY (`fiscal_year`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='科目余额重建记录（账簿版本与之不同的年度需要重建）';
+
+-- ----------------------------
+-- Table structure for voucher_sequences
+-- ----------------------------
+DROP TABLE IF EXISTS `voucher_sequences`;
+CREATE TABLE `voucher_sequences` (
+  `voucher_type` varchar(10) NOT NULL COMMENT '凭证字',
+  `fiscal_year` int NOT NULL COMMENT '会计年度',
+  `fiscal_month` tinyint NOT NULL COMMENT '会计期间（月份）',
+  `last_number` int NOT NULL DEFAULT '0' COMMENT '已分配的最大凭证号',
+  PRIMARY KEY (`voucher_type`,`fiscal_year`,`fiscal_month`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='凭证号序列表';
+
 -- ----------------------------
 -- Table structure for vouchers
 -- ----------------------------
@@ -8,8 +8,10 @@
 SET FOREIGN_KEY_CHECKS=0;
 
 -- 删除外键约束 (MySQL中DROP FOREIGN KEY不支持IF EXISTS)
-ALTER TABLE `journal_entries` DROP FOREIGN KEY `fk_entry_account`;
+-- journal_entries 按会计年度分区后不能有外键（见 7_fiscal_year_partitions.sql），
+-- 分录的科目由下面 chart_of_accounts 的触发器保护
 ALTER TABLE `account_balances` DROP FOREIGN KEY `fk_balance_account`;
+ALTER TABLE `account_period_balances` DROP FOREIGN KEY `fk_period_balance_account`;
 
 -- 删除检查约束 (MySQL中DROP CHECK不支持IF EXISTS)
 ALTER TABLE `journal_entries` DROP CHECK `chk_debit_amount`;
@@ -28,18 +30,18 @@ SET FOREIGN_KEY_CHECKS=1;
 -- 创建新的约束和触发器
 -- =================================================================
 
--- 为凭证分录表添加外键约束，关联到会计科目表
-ALTER TABLE `journal_entries`
-ADD CONSTRAINT `fk_entry_account`
-FOREIGN KEY (`account_code`) REFERENCES `chart_of_accounts` (`account_code`)
-ON UPDATE CASCADE ON DELETE RESTRICT;
-
 -- 为科目余额表添加外键约束
 ALTER TABLE `account_balances`
 ADD CONSTRAINT `fk_balance_account`
 FOREIGN KEY (`account_code`) REFERENCES `chart_of_accounts` (`account_code`)
 ON DELETE CASCADE ON UPDATE CASCADE;
 
+-- 为科目月度发生额表添加外键约束
+ALTER TABLE `account_period_balances`
+ADD CONSTRAINT `fk_period_balance_account`
+FOREIGN KEY (`account_code`) REFERENCES `chart_of_accounts` (`account_code`)
+ON DELETE CASCADE ON UPDATE CASCADE;
+
 -- 为凭证分录表的金额字段添加检查约束
 ALTER TABLE `journal_entries`
 ADD CONSTRAINT `chk_debit_amount` CHECK ((`debit_amount` >= 0)),
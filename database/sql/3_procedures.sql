@@ -2,8 +2,61 @@
 -- 清理已存在的存储过程 (为了让脚本可重复执行)
 -- =================================================================
 DROP PROCEDURE IF EXISTS `proc_generate_account_summary`;
+DROP PROCEDURE IF EXISTS `proc_generate_period_balances`;
 DROP PROCEDURE IF EXISTS `proc_generate_general_ledger`;
 
+-- =================================================================
+-- 过程零：生成指定年度的科目月度发生额（由过程一在最后调用）
+-- =================================================================
+DELIMITER $$
+CREATE PROCEDURE `proc_generate_period_balances`(IN fiscal_year_param INT)
+BEGIN
+    DECLARE max_level INT;
+    DECLARE current_level INT;
+
+    DELETE FROM account_period_balances WHERE fiscal_year = fiscal_year_param;
+
+    -- 末级科目按月汇总发生额
+    INSERT INTO account_period_balances (account_code, fiscal_year, fiscal_month, period_debit, period_credit)
+    SELECT
+        je.account_code,
+        fiscal_year_param,
+        MONTH(v.voucher_date),
+        SUM(je.debit_amount),
+        SUM(je.credit_amount)
+    FROM journal_entries je
+    JOIN vouchers v ON v.id = je.voucher_id AND v.fiscal_year = je.fiscal_year
+    WHERE je.fiscal_year = fiscal_year_param -- 只扫描该年度的分区
+      AND v.voucher_date >= MAKEDATE(fiscal_year_param, 1)
+      AND v.voucher_date < MAKEDATE(fiscal_year_param + 1, 1)
+      AND NOT EXISTS (SELECT 1 FROM chart_of_accounts WHERE parent_code = je.account_code) -- 确保是末级科目
+    GROUP BY je.account_code, MONTH(v.voucher_date);
+
+    -- 自底向上逐级把下级科目的月度发生额累加到上级科目
+    SELECT MAX(level) INTO max_level FROM chart_of_accounts;
+    SET current_level = max_level;
+    WHILE current_level > 1 DO
+        INSERT INTO account_period_balances (account_code, fiscal_year, fiscal_month, period_debit, period_credit)
+        SELECT
+            coa.parent_code,
+            fiscal_year_param,
+            child.fiscal_month,
+            SUM(child.period_debit),
+            SUM(child.period_credit)
+        FROM account_period_balances child
+        JOIN chart_of_accounts coa ON child.account_code = coa.account_code
+        WHERE child.fiscal_year = fiscal_year_param AND coa.level = current_level AND coa.parent_code IS NOT NULL
+        GROUP BY coa.parent_code, child.fiscal_month
+        ON DUPLICATE KEY UPDATE
+            period_debit = period_debit + VALUES(period_debit),
+            period_credit = period_credit + VALUES(period_credit);
+
+        SET current_level = current_level - 1;
+    END WHILE;
+END$$
+DELIMITER ;
+
+
 -- =================================================================
 -- 过程一：生成科目汇总表 (循环更新法)
 -- =================================================================
@@ -35,8 +88,10 @@ BEGIN
             SUM(je.debit_amount) AS total_debit,
             SUM(je.credit_amount) AS total_credit
         FROM journal_entries je
-        JOIN vouchers v ON je.voucher_id = v.id
-        WHERE YEAR(v.voucher_date) = fiscal_year_param
+        JOIN vouchers v ON v.id = je.voucher_id AND v.fiscal_year = je.fiscal_year
+        WHERE je.fiscal_year = fiscal_year_param
+          AND v.voucher_date >= MAKEDATE(fiscal_year_param, 1)
+          AND v.voucher_date < MAKEDATE(fiscal_year_param + 1, 1)
           AND NOT EXISTS (SELECT 1 FROM chart_of_accounts WHERE parent_code = je.account_code) -- 确保是末级科目
         GROUP BY je.account_code
     ) AS leaf_summary ON ab.account_code = leaf_summary.account_code
@@ -78,92 +133,67 @@ BEGIN
         END
     WHERE ab.fiscal_year = fiscal_year_param;
 
+    -- 同步重建月度发生额，使按期间查询的报表与年度汇总保持一致
+    CALL proc_generate_period_balances(fiscal_year_param);
+
 END$$
 DELIMITER ;
 
 
 -- =================================================================
 -- 过程二：生成指定科目的总分类账
+-- 用窗口函数一次性算出逐笔余额（集合运算），不再用游标逐行写临时表
 -- =================================================================
 DELIMITER $$
 CREATE PROCEDURE `proc_generate_general_ledger`(IN target_account_code VARCHAR(16), IN fiscal_year_param INT)
 BEGIN
     -- 声明变量
-    DECLARE done INT DEFAULT FALSE;
-    DECLARE running_balance DECIMAL(14, 2);
-    DECLARE v_voucher_date DATE;
-    DECLARE v_summary VARCHAR(255);
-    DECLARE v_debit DECIMAL(12, 2);
-    DECLARE v_credit DECIMAL(12, 2);
+    DECLARE opening_balance_value DECIMAL(14, 2) DEFAULT 0;
     DECLARE v_direction ENUM('debit', 'credit');
 
-    -- 声明游标，用于遍历指定年度的凭证分录
-    DECLARE cur_entries CURSOR FOR 
-        SELECT v.voucher_date, je.summary, je.debit_amount, je.credit_amount 
+    -- 获取余额方向和期初余额
+    SELECT balance_direction INTO v_direction
+    FROM chart_of_accounts
+    WHERE account_code = target_account_code;
+
+    SELECT COALESCE(MAX(opening_balance), 0) INTO opening_balance_value
+    FROM account_balances
+    WHERE account_code = target_account_code AND fiscal_year = fiscal_year_param;
+
+    -- 期初行 + 按日期排序的分录行，余额为期初余额加上截至当前行的累计发生额
+    SELECT entry_date, summary, debit, credit, direction, balance
+    FROM (
+        SELECT
+            MAKEDATE(fiscal_year_param, 1) AS entry_date,
+            '期初余额' AS summary,
+            0.00 AS debit,
+            0.00 AS credit,
+            IF(v_direction = 'debit', '借', '贷') AS direction,
+            opening_balance_value AS balance,
+            0 AS row_group,
+            0 AS voucher_id,
+            0 AS entry_id
+        UNION ALL
+        SELECT
+            v.voucher_date,
+            je.summary,
+            je.debit_amount,
+            je.credit_amount,
+            IF(v_direction = 'debit', '借', '贷'),
+            opening_balance_value + SUM(
+                IF(v_direction = 'debit', je.debit_amount - je.credit_amount, je.credit_amount - je.debit_amount)
+            ) OVER (ORDER BY v.voucher_date, v.id, je.id ROWS UNBOUNDED PRECEDING),
+            1,
+            v.id,
+            je.id
         FROM journal_entries je
-        JOIN vouchers v ON je.voucher_id = v.id
-        WHERE je.account_code = target_account_code AND YEAR(v.voucher_date) = fiscal_year_param
-        ORDER BY v.voucher_date, v.id;
-        
-    DECLARE CONTINUE HANDLER FOR NOT FOUND SET done = TRUE;
-
-    -- 准备工作：创建临时结果表
-    DROP TEMPORARY TABLE IF EXISTS `general_ledger_result`;
-    CREATE TEMPORARY TABLE `general_ledger_result` (
-        `entry_date` DATE,
-        `summary` VARCHAR(255),
-        `debit` DECIMAL(12, 2),
-        `credit` DECIMAL(12, 2),
-        `direction` VARCHAR(10),
-        `balance` DECIMAL(14, 2)
-    );
-
-    -- 获取期初余额和余额方向
-    SELECT ab.opening_balance, coa.balance_direction 
-    INTO running_balance, v_direction
-    FROM account_balances ab
-    JOIN chart_of_accounts coa ON ab.account_code = coa.account_code
-    WHERE ab.account_code = target_account_code AND ab.fiscal_year = fiscal_year_param;
-
-    -- 插入期初行
-    INSERT INTO `general_ledger_result` VALUES (
-        MAKEDATE(fiscal_year_param, 1), 
-        '期初余额', 
-        0.00, 
-        0.00, 
-        IF(v_direction = 'debit', '借', '贷'), 
-        running_balance
-    );
-
-    -- 打开游标并循环处理
-    OPEN cur_entries;
-    read_loop: LOOP
-        FETCH cur_entries INTO v_voucher_date, v_summary, v_debit, v_credit;
-        IF done THEN
-            LEAVE read_loop;
-        END IF;
-
-        -- 计算实时余额
-        IF v_direction = 'debit' THEN
-            SET running_balance = running_balance + v_debit - v_credit;
-        ELSE
-            SET running_balance = running_balance - v_debit + v_credit;
-        END IF;
-
-        -- 将计算结果插入到结果表
-        INSERT INTO `general_ledger_result` VALUES (
-            v_voucher_date, 
-            v_summary, 
-            v_debit, 
-            v_credit, 
-            IF(v_direction = 'debit', '借', '贷'), 
-            running_balance
-        );
-    END LOOP;
-    CLOSE cur_entries;
-    
-    -- 返回最终结果
-    SELECT * FROM `general_ledger_result`;
+        JOIN vouchers v ON v.id = je.voucher_id AND v.fiscal_year = je.fiscal_year
+        WHERE je.fiscal_year = fiscal_year_param
+          AND je.account_code = target_account_code
+          AND v.voucher_date >= MAKEDATE(fiscal_year_param, 1)
+          AND v.voucher_date < MAKEDATE(fiscal_year_param + 1, 1)
+    ) AS ledger_rows
+    ORDER BY row_group, entry_date, voucher_id, entry_id;
 
 END$$
 DELIMITER ;
@@ -0,0 +1,56 @@
+-- 确保在 financial_db 数据库下执行
+use financial_db;
+
+-- =================================================================
+-- 凭证与分录的查询索引
+-- =================================================================
+-- 所有按日期的查询都写成半开区间（voucher_date >= 起始日 AND voucher_date < 截止日的次日），
+-- 不再对列套 YEAR()/DATE_FORMAT()，这样才能使用下面的索引。
+-- 本脚本可重复执行：已存在的索引会被跳过。
+
+DROP PROCEDURE IF EXISTS `proc_add_index_if_missing`;
+
+DELIMITER $$
+CREATE PROCEDURE `proc_add_index_if_missing`(IN table_name_param VARCHAR(64), IN index_name_param VARCHAR(64), IN alter_sql TEXT)
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = table_name_param AND index_name = index_name_param
+    ) THEN
+        SET @alter_sql = alter_sql;
+        PREPARE stmt FROM @alter_sql;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END$$
+DELIMITER ;
+
+-- 按日期范围查询凭证，以及凭证列表按 (日期, 凭证号, ID) 的游标分页
+-- （InnoDB 二级索引自带主键 id，所以这个索引同时覆盖分页排序键）
+CALL proc_add_index_if_missing('vouchers', 'idx_voucher_date',
+    'ALTER TABLE `vouchers` ADD INDEX `idx_voucher_date` (`voucher_date`, `voucher_number`)');
+
+-- 按凭证字 + 月份取最大凭证号、按凭证字筛选凭证列表
+CALL proc_add_index_if_missing('vouchers', 'idx_voucher_type_date',
+    'ALTER TABLE `vouchers` ADD INDEX `idx_voucher_type_date` (`voucher_type`, `voucher_date`, `voucher_number`)');
+
+-- 按科目（或科目前缀）汇总分录金额时只读索引、不回表；
+-- 它以 account_code 开头，可以替代外键 fk_entry_account 原来使用的单列索引
+CALL proc_add_index_if_missing('journal_entries', 'idx_entry_account_cover',
+    'ALTER TABLE `journal_entries` ADD INDEX `idx_entry_account_cover` (`account_code`, `voucher_id`, `debit_amount`, `credit_amount`)');
+
+-- 报表按年度读取科目余额（唯一键以 account_code 开头，按 fiscal_year 过滤时用不上）
+CALL proc_add_index_if_missing('account_balances', 'idx_balance_year',
+    'ALTER TABLE `account_balances` ADD INDEX `idx_balance_year` (`fiscal_year`, `account_code`)');
+
+DROP PROCEDURE IF EXISTS `proc_add_index_if_missing`;
+
+-- 删除被覆盖索引取代的单列索引（已删除时跳过）
+SET @drop_sql = IF(
+    EXISTS (SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'journal_entries' AND index_name = 'fk_entry_account'),
+    'ALTER TABLE `journal_entries` DROP INDEX `fk_entry_account`',
+    'DO 0');
+PREPARE stmt FROM @drop_sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
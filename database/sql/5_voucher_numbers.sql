@@ -0,0 +1,37 @@
+-- 确保在 financial_db 数据库下执行
+use financial_db;
+
+-- =================================================================
+-- 凭证号唯一约束与凭证号序列
+-- =================================================================
+-- 凭证号在 (凭证字, 年月) 内唯一。年月用生成列 voucher_month (如 202501) 表示，唯一键建在生成列上。
+-- 本脚本可重复执行。
+--
+-- 注意：已有数据中存在重号时添加唯一键会失败，可以先用下面的查询找出重号凭证并处理：
+--   SELECT voucher_type, DATE_FORMAT(voucher_date, '%Y-%m') AS period, voucher_number, COUNT(*)
+--   FROM vouchers GROUP BY voucher_type, period, voucher_number HAVING COUNT(*) > 1;
+
+SET @alter_sql = IF(
+    EXISTS (SELECT 1 FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = 'vouchers' AND column_name = 'voucher_month'),
+    'DO 0',
+    'ALTER TABLE `vouchers` ADD COLUMN `voucher_month` int GENERATED ALWAYS AS (YEAR(`voucher_date`) * 100 + MONTH(`voucher_date`)) VIRTUAL COMMENT ''凭证年月，如 202501'' AFTER `voucher_date`');
+PREPARE stmt FROM @alter_sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @alter_sql = IF(
+    EXISTS (SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'vouchers' AND index_name = 'uk_voucher_number'),
+    'DO 0',
+    'ALTER TABLE `vouchers` ADD UNIQUE KEY `uk_voucher_number` (`voucher_type`, `voucher_month`, `voucher_number`)');
+PREPARE stmt FROM @alter_sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- 用已有凭证初始化序列（序列只会向前推进）
+INSERT INTO voucher_sequences (voucher_type, fiscal_year, fiscal_month, last_number)
+SELECT voucher_type, YEAR(voucher_date), MONTH(voucher_date), MAX(voucher_number)
+FROM vouchers
+GROUP BY voucher_type, YEAR(voucher_date), MONTH(voucher_date)
+ON DUPLICATE KEY UPDATE last_number = GREATEST(last_number, VALUES(last_number));
@@ -0,0 +1,21 @@
+-- 确保在 financial_db 数据库下执行
+use financial_db;
+
+-- =================================================================
+-- 科目余额重建记录（已有数据库升级用；新建的库由 1_tables.sql 创建）
+-- =================================================================
+-- 年度的账簿版本（ledger_versions）与这里记录的重建版本不同，说明该年度在上次重建后有过凭证或期初余额的写入，
+-- backend/balance_rebuild.py 会从最早的这类年度开始按年重建，并把期末余额结转到以后各年度。
+-- 本脚本可重复执行。
+
+CREATE TABLE IF NOT EXISTS `balance_rebuilds` (
+  `fiscal_year` int NOT NULL COMMENT '会计年度',
+  `ledger_version` bigint NOT NULL DEFAULT '0' COMMENT '重建完成时该年度的账簿版本',
+  `rebuilt_at` datetime DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '重建时间',
+  PRIMARY KEY (`fiscal_year`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='科目余额重建记录（账簿版本与之不同的年度需要重建）';
+
+-- 升级时认为现有各年度的余额都是最新的；需要时可用 python balance_rebuild.py --from-year <年度> 强制重建
+INSERT INTO balance_rebuilds (fiscal_year, ledger_version)
+SELECT fiscal_year, version FROM ledger_versions WHERE fiscal_year <> 0
+ON DUPLICATE KEY UPDATE fiscal_year = fiscal_year;
@@ -0,0 +1,280 @@
+-- 确保在 financial_db 数据库下执行
+use financial_db;
+
+-- =================================================================
+-- 凭证与分录按会计年度分区；已结账年度的锁定与归档
+-- =================================================================
+-- 新建和已有的数据库都需要执行（在 1~6 号脚本之后）。本脚本可重复执行。
+--
+-- 1. vouchers 增加存储生成列 fiscal_year（凭证日期的年度）；journal_entries 增加 fiscal_year 列
+--    （由应用随分录写入，这里按所属凭证回填）。两表按 fiscal_year 做 RANGE 分区，每个年度一个分区，
+--    带 fiscal_year 条件的查询（报表、总账、存储过程）只扫描该年度的分区。
+-- 2. MySQL 的分区表不支持外键，并要求主键和唯一键包含分区列：
+--    - 删除 fk_entry_voucher（删除凭证时由应用先删除分录）和 fk_entry_account
+--      （科目表的触发器已禁止删除或修改已有分录的科目，归档分录的科目由第6节的触发器保护）；
+--    - 主键改为 (id, fiscal_year)；凭证号唯一键加上 fiscal_year（它由 voucher_month 决定，唯一性不变）。
+-- 3. fiscal_year_closings 记录已结账的年度，触发器拒绝已结账年度的凭证和分录的写入。
+-- 4. vouchers_archive / journal_entries_archive 是压缩行格式的归档表：结账时（backend/period_close.py）
+--    把年度的凭证和分录移入归档表并清空该年度的分区，只有 account_balances 等余额表留在热数据中；
+--    凭证详情和总分类账按年度自动读取归档表。
+--
+-- 注意：改主键和分区都会重建整张表，数据量大时请在维护窗口执行。
+
+DROP PROCEDURE IF EXISTS `proc_exec_unless`;
+
+DELIMITER $$
+-- 条件不成立时执行一条 DDL（用于跳过已经完成的步骤）
+CREATE PROCEDURE `proc_exec_unless`(IN done_param TINYINT, IN ddl_param TEXT)
+BEGIN
+    IF NOT done_param THEN
+        SET @exec_sql = ddl_param;
+        PREPARE stmt FROM @exec_sql;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END$$
+DELIMITER ;
+
+-- -----------------------------------------------------------------
+-- 1. 会计年度列
+-- -----------------------------------------------------------------
+SET @done = EXISTS (SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = DATABASE() AND table_name = 'vouchers' AND column_name = 'fiscal_year');
+CALL proc_exec_unless(@done,
+    'ALTER TABLE `vouchers` ADD COLUMN `fiscal_year` int GENERATED ALWAYS AS (YEAR(`voucher_date`)) STORED COMMENT ''会计年度（分区列）'' AFTER `voucher_month`');
+
+SET @done = EXISTS (SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = DATABASE() AND table_name = 'journal_entries' AND column_name = 'fiscal_year');
+CALL proc_exec_unless(@done,
+    'ALTER TABLE `journal_entries` ADD COLUMN `fiscal_year` int NOT NULL DEFAULT ''0'' COMMENT ''会计年度（所属凭证的年度，分区列）'' AFTER `voucher_id`');
+
+UPDATE journal_entries je
+JOIN vouchers v ON v.id = je.voucher_id
+SET je.fiscal_year = v.fiscal_year
+WHERE je.fiscal_year = 0;
+
+ALTER TABLE `journal_entries` ALTER COLUMN `fiscal_year` DROP DEFAULT;
+
+-- -----------------------------------------------------------------
+-- 2. 外键和主键、唯一键
+-- -----------------------------------------------------------------
+SET @done = NOT EXISTS (SELECT 1 FROM information_schema.table_constraints
+                        WHERE table_schema = DATABASE() AND table_name = 'journal_entries'
+                          AND constraint_name = 'fk_entry_voucher' AND constraint_type = 'FOREIGN KEY');
+CALL proc_exec_unless(@done, 'ALTER TABLE `journal_entries` DROP FOREIGN KEY `fk_entry_voucher`');
+
+SET @done = NOT EXISTS (SELECT 1 FROM information_schema.table_constraints
+                        WHERE table_schema = DATABASE() AND table_name = 'journal_entries'
+                          AND constraint_name = 'fk_entry_account' AND constraint_type = 'FOREIGN KEY');
+CALL proc_exec_unless(@done, 'ALTER TABLE `journal_entries` DROP FOREIGN KEY `fk_entry_account`');
+
+SET @done = EXISTS (SELECT 1 FROM information_schema.statistics
+                    WHERE table_schema = DATABASE() AND table_name = 'vouchers'
+                      AND index_name = 'PRIMARY' AND column_name = 'fiscal_year');
+CALL proc_exec_unless(@done, 'ALTER TABLE `vouchers` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `fiscal_year`)');
+
+SET @done = EXISTS (SELECT 1 FROM information_schema.statistics
+                    WHERE table_schema = DATABASE() AND table_name = 'vouchers'
+                      AND index_name = 'uk_voucher_number' AND column_name = 'fiscal_year');
+CALL proc_exec_unless(@done,
+    'ALTER TABLE `vouchers` DROP INDEX `uk_voucher_number`, ADD UNIQUE KEY `uk_voucher_number` (`voucher_type`, `voucher_month`, `voucher_number`, `fiscal_year`)');
+
+SET @done = EXISTS (SELECT 1 FROM information_schema.statistics
+                    WHERE table_schema = DATABASE() AND table_name = 'journal_entries'
+                      AND index_name = 'PRIMARY' AND column_name = 'fiscal_year');
+CALL proc_exec_unless(@done, 'ALTER TABLE `journal_entries` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `fiscal_year`)');
+
+DROP PROCEDURE IF EXISTS `proc_exec_unless`;
+
+-- -----------------------------------------------------------------
+-- 3. 按年度分区
+-- -----------------------------------------------------------------
+-- 分区为 p_before（早于起始年度）、每个年度一个 p<年度>、pmax（以后的年度）。
+-- 起始年度取现有凭证的最早年度与十年前的较早者，空库也预先建好近年的分区。
+DROP PROCEDURE IF EXISTS `proc_partition_by_fiscal_year`;
+DROP PROCEDURE IF EXISTS `proc_extend_fiscal_year_partitions`;
+
+DELIMITER $$
+CREATE PROCEDURE `proc_partition_by_fiscal_year`(IN table_name_param VARCHAR(64), IN first_year_param INT, IN last_year_param INT)
+BEGIN
+    DECLARE current_year INT;
+    DECLARE partition_list TEXT;
+
+    IF NOT EXISTS (SELECT 1 FROM information_schema.partitions
+                   WHERE table_schema = DATABASE() AND table_name = table_name_param AND partition_name IS NOT NULL) THEN
+        SET partition_list = CONCAT('PARTITION p_before VALUES LESS THAN (', first_year_param, ')');
+        SET current_year = first_year_param;
+        WHILE current_year <= last_year_param DO
+            SET partition_list = CONCAT(partition_list, ', PARTITION p', current_year,
+                                        ' VALUES LESS THAN (', current_year + 1, ')');
+            SET current_year = current_year + 1;
+        END WHILE;
+        SET @exec_sql = CONCAT('ALTER TABLE `', table_name_param, '` PARTITION BY RANGE (`fiscal_year`) (',
+                               partition_list, ', PARTITION pmax VALUES LESS THAN MAXVALUE)');
+        PREPARE stmt FROM @exec_sql;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END$$
+
+-- 把 pmax 中到 through_year_param 为止的年度拆成单独的分区（结账前和每年初调用，已存在的分区跳过）
+CREATE PROCEDURE `proc_extend_fiscal_year_partitions`(IN table_name_param VARCHAR(64), IN through_year_param INT)
+BEGIN
+    DECLARE next_year INT;
+
+    SELECT MAX(CAST(partition_description AS SIGNED)) INTO next_year
+    FROM information_schema.partitions
+    WHERE table_schema = DATABASE() AND table_name = table_name_param
+      AND partition_name IS NOT NULL AND partition_description <> 'MAXVALUE';
+
+    WHILE next_year IS NOT NULL AND next_year <= through_year_param DO
+        SET @exec_sql = CONCAT('ALTER TABLE `', table_name_param, '` REORGANIZE PARTITION pmax INTO (PARTITION p',
+                               next_year, ' VALUES LESS THAN (', next_year + 1,
+                               '), PARTITION pmax VALUES LESS THAN MAXVALUE)');
+        PREPARE stmt FROM @exec_sql;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+        SET next_year = next_year + 1;
+    END WHILE;
+END$$
+DELIMITER ;
+
+SELECT LEAST(COALESCE(MIN(fiscal_year), YEAR(CURDATE())), YEAR(CURDATE()) - 10),
+       GREATEST(COALESCE(MAX(fiscal_year), YEAR(CURDATE())), YEAR(CURDATE()) + 1)
+INTO @first_year, @last_year
+FROM vouchers;
+
+CALL proc_partition_by_fiscal_year('vouchers', @first_year, @last_year);
+CALL proc_partition_by_fiscal_year('journal_entries', @first_year, @last_year);
+
+-- -----------------------------------------------------------------
+-- 4. 已结账年度与归档表
+-- -----------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS `fiscal_year_closings` (
+  `fiscal_year` int NOT NULL COMMENT '会计年度',
+  `closed_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '结账时间，此后该年度的凭证和分录不能再写入',
+  `archived_at` datetime DEFAULT NULL COMMENT '凭证和分录移入归档表的时间',
+  `voucher_count` int NOT NULL DEFAULT '0' COMMENT '归档的凭证数',
+  `entry_count` int NOT NULL DEFAULT '0' COMMENT '归档的分录数',
+  PRIMARY KEY (`fiscal_year`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='已结账的会计年度';
+
+CREATE TABLE IF NOT EXISTS `vouchers_archive` (
+  `id` int NOT NULL,
+  `voucher_date` date NOT NULL COMMENT '凭证日期',
+  `voucher_month` int NOT NULL COMMENT '凭证年月，如 202501',
+  `fiscal_year` int NOT NULL COMMENT '会计年度',
+  `voucher_type` varchar(10) NOT NULL COMMENT '凭证字',
+  `voucher_number` int NOT NULL COMMENT '凭证号',
+  `summary` varchar(255) NOT NULL COMMENT '摘要',
+  `created_at` datetime DEFAULT NULL COMMENT '创建时间',
+  `updated_at` datetime DEFAULT NULL COMMENT '更新时间',
+  PRIMARY KEY (`id`),
+  KEY `idx_archive_voucher_date` (`fiscal_year`, `voucher_date`, `voucher_number`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8 COMMENT='已结账年度的凭证（归档）';
+
+CREATE TABLE IF NOT EXISTS `journal_entries_archive` (
+  `id` int NOT NULL,
+  `voucher_id` int NOT NULL COMMENT '凭证ID',
+  `fiscal_year` int NOT NULL COMMENT '会计年度',
+  `account_code` varchar(16) NOT NULL COMMENT '科目代码',
+  `summary` varchar(255) NOT NULL COMMENT '摘要',
+  `debit_amount` decimal(12,2) NOT NULL DEFAULT '0.00' COMMENT '借方金额',
+  `credit_amount` decimal(12,2) NOT NULL DEFAULT '0.00' COMMENT '贷方金额',
+  PRIMARY KEY (`id`),
+  KEY `idx_archive_entry_voucher` (`voucher_id`),
+  KEY `idx_archive_entry_account` (`fiscal_year`, `account_code`, `voucher_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8 COMMENT='已结账年度的凭证分录（归档）';
+
+-- -----------------------------------------------------------------
+-- 5. 已结账年度的写入保护
+-- -----------------------------------------------------------------
+DROP TRIGGER IF EXISTS `trg_before_insert_vouchers`;
+DROP TRIGGER IF EXISTS `trg_before_update_vouchers`;
+DROP TRIGGER IF EXISTS `trg_before_delete_vouchers`;
+DROP TRIGGER IF EXISTS `trg_before_insert_journal_entries`;
+DROP TRIGGER IF EXISTS `trg_before_update_journal_entries`;
+DROP TRIGGER IF EXISTS `trg_before_delete_journal_entries`;
+DROP PROCEDURE IF EXISTS `proc_check_fiscal_year_open`;
+
+DELIMITER $$
+-- 加锁读：与结账事务写入 fiscal_year_closings 互相等待，结账提交后该年度不会再有未完成的写入。
+-- 归档清理没有单独分区的年度时，period_close 设置会话变量 @archiving_fiscal_year 放行该年度的删除
+CREATE PROCEDURE `proc_check_fiscal_year_open`(IN fiscal_year_param INT)
+BEGIN
+    DECLARE closed_count INT;
+    IF @archiving_fiscal_year IS NOT NULL AND @archiving_fiscal_year = fiscal_year_param THEN
+        SET closed_count = 0;
+    ELSE
+        SELECT COUNT(*) INTO closed_count FROM fiscal_year_closings WHERE fiscal_year = fiscal_year_param FOR SHARE;
+    END IF;
+    IF closed_count > 0 THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = '该会计年度已结账，不能新增、修改或删除凭证。';
+    END IF;
+END$$
+
+CREATE TRIGGER `trg_before_insert_vouchers` BEFORE INSERT ON `vouchers`
+FOR EACH ROW
+BEGIN
+    CALL proc_check_fiscal_year_open(YEAR(NEW.voucher_date));
+END$$
+
+CREATE TRIGGER `trg_before_update_vouchers` BEFORE UPDATE ON `vouchers`
+FOR EACH ROW
+BEGIN
+    CALL proc_check_fiscal_year_open(YEAR(OLD.voucher_date));
+    CALL proc_check_fiscal_year_open(YEAR(NEW.voucher_date));
+END$$
+
+CREATE TRIGGER `trg_before_delete_vouchers` BEFORE DELETE ON `vouchers`
+FOR EACH ROW
+BEGIN
+    CALL proc_check_fiscal_year_open(YEAR(OLD.voucher_date));
+END$$
+
+CREATE TRIGGER `trg_before_insert_journal_entries` BEFORE INSERT ON `journal_entries`
+FOR EACH ROW
+BEGIN
+    CALL proc_check_fiscal_year_open(NEW.fiscal_year);
+END$$
+
+CREATE TRIGGER `trg_before_update_journal_entries` BEFORE UPDATE ON `journal_entries`
+FOR EACH ROW
+BEGIN
+    CALL proc_check_fiscal_year_open(OLD.fiscal_year);
+    CALL proc_check_fiscal_year_open(NEW.fiscal_year);
+END$$
+
+CREATE TRIGGER `trg_before_delete_journal_entries` BEFORE DELETE ON `journal_entries`
+FOR EACH ROW
+BEGIN
+    CALL proc_check_fiscal_year_open(OLD.fiscal_year);
+END$$
+DELIMITER ;
+
+-- -----------------------------------------------------------------
+-- 6. 归档分录的科目保护
+-- -----------------------------------------------------------------
+-- 2 号脚本的科目表触发器只检查 journal_entries；科目只在已归档年度使用过时，同样不能删除或修改科目代码。
+-- 单独建触发器（排在 2 号脚本的触发器之后执行），重新执行 2 号脚本也不会丢掉这项检查。
+DROP TRIGGER IF EXISTS `trg_before_delete_chart_of_accounts_archive`;
+DROP TRIGGER IF EXISTS `trg_before_update_chart_of_accounts_archive`;
+
+DELIMITER $$
+CREATE TRIGGER `trg_before_delete_chart_of_accounts_archive` BEFORE DELETE ON `chart_of_accounts`
+FOR EACH ROW
+BEGIN
+    IF EXISTS (SELECT 1 FROM journal_entries_archive WHERE account_code = OLD.account_code) THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = '该科目在已结账年度有发生额，不允许删除。';
+    END IF;
+END$$
+
+CREATE TRIGGER `trg_before_update_chart_of_accounts_archive` BEFORE UPDATE ON `chart_of_accounts`
+FOR EACH ROW
+BEGIN
+    IF NEW.account_code != OLD.account_code AND
+       EXISTS (SELECT 1 FROM journal_entries_archive WHERE account_code = OLD.account_code) THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = '科目已被使用，禁止修改科目代码。';
+    END IF;
+END$$
+DELIMITER ;